@@ -12,6 +12,8 @@ from ProceduralCityGenerator.tensor_field import TensorField
 from ProceduralCityGenerator.integrator import RK4Integrator
 from ProceduralCityGenerator.streamline_parameters import StreamlineParameters
 from ProceduralCityGenerator.graph import Graph
+from ProceduralCityGenerator.stepper import Stepper, StreamlineStepper, GraphStepper
+from ProceduralCityGenerator.baked_field import BakedTensorField
 
 
 bl_info = {
@@ -20,6 +22,9 @@ bl_info = {
     "category": "Object"
 }
 
+# Grid spacing of the baked tensor fields.
+BAKE_RESOLUTION = 2
+
 
 ###############################################################
 #
@@ -45,6 +50,7 @@ class GridGenGridPanel(GridGenBasePanel, bpy.types.Panel):
         layout = self.layout
         col = layout.column()
         col.operator("operator.grid_gen_generate")
+        col.operator("operator.grid_gen_generate_background")
 
 
 class GridGenGenerateGrid(bpy.types.Operator):
@@ -57,18 +63,171 @@ class GridGenGenerateGrid(bpy.types.Operator):
         return {'FINISHED'}
 
 
+# Generates the road graph of the first generator in the background, stepped by bpy.app.timers,
+# so the viewport stays interactive. Progress is shown by the window manager.
+# Baking and generation (StreamlineStepper), graph generation (GraphStepper) and placement
+# (PlacementStepper) run one after the other, each stepper registers the timer of the next.
+class GridGenGenerateGridBackground(bpy.types.Operator):
+    bl_idname = "operator.grid_gen_generate_background"
+    bl_label = "Generate in Background"
+
+    # Share of the steppers in the progress shown.
+    STREAMLINES_SHARE = 0.6
+    GRAPH_SHARE = 0.3
+
+    def execute(self, context):
+        generator = create_generator(0)
+        window_manager = context.window_manager
+        window_manager.progress_begin(0, 100)
+        t0 = time()
+        # The operator can be freed before the callbacks run, so they don't access 'self'.
+        streamlines_share = self.STREAMLINES_SHARE
+        graph_share = self.GRAPH_SHARE
+
+        def report_progress(start, share):
+            def on_progress(stepper: Stepper):
+                window_manager.progress_update(int((start + share * stepper.progress) * 100))
+            return on_progress
+
+        def on_placed(stepper: PlacementStepper):
+            window_manager.progress_end()
+            print(f"placed graph in background, done in {time() - t0:.2f}s")
+
+        def on_graph_finished(stepper: GraphStepper):
+            print(f"generated graph in background after {time() - t0:.2f}s")
+            start = streamlines_share + graph_share
+            placement = PlacementStepper(
+                stepper.graph,
+                on_progress=report_progress(start, 1 - start),
+                on_finished=on_placed)
+            bpy.app.timers.register(placement.timer)
+
+        def on_streamlines_finished(stepper: StreamlineStepper):
+            print(f"done generating in background after {time() - t0:.2f}s")
+            graph_stepper = GraphStepper(
+                stepper.generator,
+                on_progress=report_progress(streamlines_share, graph_share),
+                on_finished=on_graph_finished)
+            bpy.app.timers.register(graph_stepper.timer)
+
+        stepper = StreamlineStepper(
+            generator,
+            on_progress=report_progress(0, streamlines_share),
+            on_finished=on_streamlines_finished,
+            bake_resolution=BAKE_RESOLUTION)
+        bpy.app.timers.register(stepper.timer)
+        return {'FINISHED'}
+
+
+# Places the curves and nodes of a graph in steps, see Stepper. The result equals
+# 'place_graph' and 'place_nodes'.
+# The collections are cleared in a single unit, then the sections of one streamline or
+# NODE_COUNT nodes are placed per unit.
+class PlacementStepper(Stepper):
+    CLEARING = 'clearing'
+    SECTIONS = 'sections'
+    NODES = 'nodes'
+
+    NODE_COUNT = 50
+
+    def __init__(self, graph: Graph, budget_ms=20, on_progress=None, on_finished=None, prefix=''):
+        super().__init__(budget_ms, on_progress, on_finished)
+        self.graph = graph
+        self.prefix = prefix
+        self.phase = self.CLEARING
+        self.index = 0
+        self.grid = None
+        self.nodes = None
+        self.cube_mesh = None
+
+    def run_unit(self):
+        graph = self.graph
+        if self.phase == self.CLEARING:
+            self.grid = clear_grid(self.prefix)
+            self.nodes = clear_nodes(self.prefix)
+            self.cube_mesh = create_node_mesh()
+            self.phase = self.SECTIONS
+        elif self.phase == self.SECTIONS:
+            if self.index < len(graph.streamline_sections):
+                place_sections(self.grid, graph.streamline_sections[self.index])
+                self.index += 1
+                return
+            self.index = 0
+            self.phase = self.NODES
+        elif self.phase == self.NODES:
+            for node in graph.nodes[self.index:self.index + self.NODE_COUNT]:
+                place_node(self.nodes, self.cube_mesh, node)
+            self.index += self.NODE_COUNT
+            if self.index >= len(graph.nodes):
+                self.phase = self.DONE
+
+    @property
+    def progress(self) -> float:
+        if self.phase == self.CLEARING:
+            return 0.0
+        if self.phase == self.SECTIONS:
+            return 0.5 * self.index / max(len(self.graph.streamline_sections), 1)
+        if self.phase == self.NODES:
+            return 0.5 + 0.5 * min(self.index / max(len(self.graph.nodes), 1), 1.0)
+        return 1.0
+
+
 classes = [
     GridGenGridPanel,
-    GridGenGenerateGrid
+    GridGenGenerateGrid,
+    GridGenGenerateGridBackground
 ]
 
 
 def main():
     print("-- starting generation --")
+    generator, generator2 = create_generators()
+
+    # Generate all streamlines.
+    t0 = time()
+    generator.create_all_streamlines()
+    print(f"done generating in {time() - t0:.2f}s")
+
+    # Generate graph from generated streamlines.
+    t0 = time()
+    graph = Graph(generator)
+    print(f"generated graph in {time() - t0:.2f}s")
+
+    # Visualize graph in Blender
+    t0 = time()
+    place_graph(graph)
+    place_nodes(graph)
+    print(f"placed graph in {time() - t0:.2f}s")
+
+    generator2.create_all_streamlines()
+    graph2 = Graph(generator2)
+    place_graph(graph2, prefix="two")
+    place_nodes(graph2, prefix="two")
+
+    # # Visualize simple and complex streamlines in Blender
+    # place_stuff(generator, simple=True, offset=Vector((1500., 0.0)), id="grid_simple")
+    # place_stuff(generator, simple=False, offset=Vector((3000., 0.0)), id="grid_complex")
+
+
+# Creates the two test generators with their tensor fields and bakes the fields.
+def create_generators() -> tuple[StreamlineGenerator, StreamlineGenerator]:
+    generator = create_generator(0)
+    generator2 = create_generator(1)
+
+    # Bake both fields into raster caches covering the generator domains.
+    baked = bake_field(generator)
+    print(f"baked field, max error {baked.error_report()['max_error']:.4f} rad")
+    bake_field(generator2)
+    return generator, generator2
+
+
+# Creates one of the two test generators with its tensor field, without baking the field.
+# The generators have equal fields, placed side by side, the field of the second one is smooth.
+def create_generator(index) -> StreamlineGenerator:
+    offset = Vector((1500 * index, 0))
 
     # Create new global TensorField
     field = TensorField()
-    field2 = TensorField()
 
     # Create new StreamlineParameters. Values used here are derived from testing and seem like a good baseline
     parameters = StreamlineParameters(
@@ -90,65 +249,39 @@ def main():
         parameters
     )
 
-    integrator2 = RK4Integrator(
-        field2,
-        parameters
-    )
-
     # Create new StreamlineGenerator with integrator, parameters, and origin + world dimensions as input variables.
     # Current testing shows that integer values based on common screen sizes work well.
     generator = StreamlineGenerator(
         integrator=integrator,
-        origin=Vector((519, 249)),
-        world_dimensions=Vector((1452, 1279)),
-        parameters=parameters,
-    )
-
-    generator2 = StreamlineGenerator(
-        integrator=integrator2,
-        origin=Vector((1500 + 519, 249)),
+        origin=Vector((519, 249)) + offset,
         world_dimensions=Vector((1452, 1279)),
         parameters=parameters,
     )
 
     # Add two grid and one radial basis field to the global field.
-    field.add_grid(Vector((1381, 788)), 1500, 35, 1.983775)
-    field.add_grid(Vector((1181, 988)), 1500, 35, -1.283775)
-    field.add_radial(Vector((800, 888)), 750, 55)
+    field.add_grid(Vector((1381, 788)) + offset, 1500, 35, 1.983775)
+    field.add_grid(Vector((1181, 988)) + offset, 1500, 35, -1.283775)
+    field.add_radial(Vector((800, 888)) + offset, 750, 55)
+    if index == 1:
+        field.smooth = True
+    return generator
 
-    field2.add_grid(Vector((1500 + 1381, 788)), 1500, 35, 1.983775)
-    field2.add_grid(Vector((1500 + 1181, 988)), 1500, 35, -1.283775)
-    field2.add_radial(Vector((1500 + 800, 888)), 750, 55)
-    field2.smooth = True
 
-    # Generate all streamlines.
-    t0 = time()
-    generator.create_all_streamlines()
-    print(f"done generating in {time() - t0:.2f}s")
-
-    # Generate graph from generated streamlines.
-    t0 = time()
-    graph = Graph(generator)
-    print(f"generated graph in {time() - t0:.2f}s")
-
-    # Visualize graph in Blender
-    t0 = time()
-    place_graph(graph)
-    place_nodes(graph)
-    print(f"placed graph in {time() - t0:.2f}s")
-
-    generator2.create_all_streamlines()
-    graph2 = Graph(generator2)
-    place_graph(graph2, prefix="two")
-    place_nodes(graph2, prefix="two")
-
-    # # Visualize simple and complex streamlines in Blender
-    # place_stuff(generator, simple=True, offset=Vector((1500., 0.0)), id="grid_simple")
-    # place_stuff(generator, simple=False, offset=Vector((3000., 0.0)), id="grid_complex")
+# Bakes the field of the generator into a raster cache covering the generator domain.
+def bake_field(generator: StreamlineGenerator) -> BakedTensorField:
+    return generator.integrator.field.bake(generator.origin, generator.world_dimensions, BAKE_RESOLUTION)
 
 
 # Helper method to place cubes at node points of the generated graph.
 def place_nodes(graph: Graph, prefix=''):
+    nodes = clear_nodes(prefix)
+    cube_mesh = create_node_mesh()
+    for node in graph.nodes:
+        place_node(nodes, cube_mesh, node)
+
+
+# Returns the collection of the nodes placed by 'place_nodes', after deleting its objects.
+def clear_nodes(prefix='') -> bpy.types.Collection:
     try:
         nodes = bpy.data.collections[prefix + "nodes"]
         bpy.ops.object.select_all(action='DESELECT')
@@ -158,20 +291,34 @@ def place_nodes(graph: Graph, prefix=''):
     except Exception:
         nodes = bpy.data.collections.new(prefix + "nodes")
         bpy.context.scene.collection.children.link(nodes)
+    return nodes
+
 
+def create_node_mesh() -> bpy.types.Mesh:
     cube_mesh = bpy.data.meshes.new('Basic_Cube')
     bm = bmesh.new()
     bmesh.ops.create_cube(bm, size=1.5)
     bm.to_mesh(cube_mesh)
     bm.free()
-    for node in graph.nodes:
-        n = bpy.data.objects.new("Node", cube_mesh)
-        nodes.objects.link(n)
-        n.location = node.co.to_3d()
+    return cube_mesh
+
+
+def place_node(nodes: bpy.types.Collection, cube_mesh: bpy.types.Mesh, node):
+    n = bpy.data.objects.new("Node", cube_mesh)
+    nodes.objects.link(n)
+    n.location = node.co.to_3d()
 
 
 # Helper method to turn streamline sections of the graph into curves to visualize in Blender.
 def place_graph(graph: Graph, prefix=''):
+    grid = clear_grid(prefix)
+    for streamline in graph.streamline_sections:
+        place_sections(grid, streamline)
+
+
+# Returns the collection of the curves placed by 'place_graph', after deleting its objects and
+# child collections.
+def clear_grid(prefix='') -> bpy.types.Collection:
     try:
         grid = bpy.data.collections[prefix + "grid"]
         bpy.ops.object.select_all(action='DESELECT')
@@ -186,20 +333,23 @@ def place_graph(graph: Graph, prefix=''):
     except Exception:
         grid = bpy.data.collections.new(prefix + "grid")
         bpy.context.scene.collection.children.link(grid)
-
-    for streamline in graph.streamline_sections:
-        sl = bpy.data.collections.new("streamline")
-        grid.children.link(sl)
-        for section in streamline:
-            curve = bpy.data.curves.new("section", 'CURVE')
-            curve.splines.new('BEZIER')
-            curve.splines.active.bezier_points.add(len(section) - 1)
-            obj = bpy.data.objects.new("section", curve)
-            sl.objects.link(obj)
-            for i in range(len(section)):
-                curve.splines.active.bezier_points[i].co = section[i].to_3d()
-                curve.splines.active.bezier_points[i].handle_right_type = 'VECTOR'
-                curve.splines.active.bezier_points[i].handle_left_type = 'VECTOR'
+    return grid
+
+
+# Places the sections of a single streamline as curves in a new child collection of the grid.
+def place_sections(grid: bpy.types.Collection, streamline):
+    sl = bpy.data.collections.new("streamline")
+    grid.children.link(sl)
+    for section in streamline:
+        curve = bpy.data.curves.new("section", 'CURVE')
+        curve.splines.new('BEZIER')
+        curve.splines.active.bezier_points.add(len(section) - 1)
+        obj = bpy.data.objects.new("section", curve)
+        sl.objects.link(obj)
+        for i in range(len(section)):
+            curve.splines.active.bezier_points[i].co = section[i].to_3d()
+            curve.splines.active.bezier_points[i].handle_right_type = 'VECTOR'
+            curve.splines.active.bezier_points[i].handle_left_type = 'VECTOR'
 
 
 # Helper method to place single vertices at all streamline points.
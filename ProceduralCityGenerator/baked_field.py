@@ -0,0 +1,137 @@
+import math
+import numpy as np
+from array import array
+from mathutils import Vector
+from ProceduralCityGenerator.tensor import Tensor, TensorAccumulator, TensorSamples
+
+
+# Raster cache of a TensorField, holding the summed tensor components ('r' and the two
+# matrix components) on a regular grid with spacing 'resolution' covering the domain given
+# by origin and dimensions.
+# Samples inside the domain are bilinearly interpolated from the four surrounding grid
+# points, instead of summing all basis fields.
+#
+# Values are stored in flat 'array.array' buffers, which are cheap to index from Python for
+# single point lookups and are viewed as NumPy arrays (without copy) for batch lookups.
+class BakedTensorField:
+    def __init__(self, field, origin: Vector, dimensions: Vector, resolution, deferred=False):
+        self.field = field
+        self.origin = origin.copy()
+        self.dimensions = dimensions.copy()
+        self.resolution = resolution
+        self.nx = math.ceil(dimensions.x / resolution) + 1
+        self.ny = math.ceil(dimensions.y / resolution) + 1
+        self.max_x = self.origin.x + (self.nx - 1) * resolution
+        self.max_y = self.origin.y + (self.ny - 1) * resolution
+
+        # Flat index of grid point (ix, iy) is ix * ny + iy.
+        size = self.nx * self.ny
+        self.r = array('d', bytes(8 * size))
+        self.m0 = array('d', bytes(8 * size))
+        self.m1 = array('d', bytes(8 * size))
+        self.baked_columns = 0
+        if not deferred:
+            self.bake_columns(self.nx)
+
+    @property
+    def done(self) -> bool:
+        return self.baked_columns == self.nx
+
+    # Evaluates the field at the grid points of the next 'count' columns (constant x). With
+    # 'deferred', the raster is baked in several calls, e.g. by StreamlineStepper, and must
+    # not be sampled before 'done'. Returns True if there are columns left.
+    def bake_columns(self, count) -> bool:
+        start = self.baked_columns
+        end = min(start + count, self.nx)
+        xs = self.origin.x + np.arange(start, end) * self.resolution
+        ys = self.origin.y + np.arange(self.ny) * self.resolution
+        grid_x, grid_y = np.meshgrid(xs, ys, indexing='ij')
+        tensors = self.field.evaluate_points(np.stack((grid_x.ravel(), grid_y.ravel()), axis=1))
+
+        indices = slice(start * self.ny, end * self.ny)
+        np.frombuffer(self.r, dtype=float)[indices] = tensors.r
+        np.frombuffer(self.m0, dtype=float)[indices] = tensors.matrix[:, 0]
+        np.frombuffer(self.m1, dtype=float)[indices] = tensors.matrix[:, 1]
+        self.baked_columns = end
+        return not self.done
+
+    def contains(self, x, y) -> bool:
+        return self.origin.x <= x <= self.max_x and self.origin.y <= y <= self.max_y
+
+    def sample_point(self, point: Vector) -> Tensor:
+        return self.load(TensorAccumulator(), point.x, point.y).to_tensor()
+
+    # Writes the interpolated tensor at (x, y) into the accumulator.
+    def load(self, acc: TensorAccumulator, x, y) -> TensorAccumulator:
+        fx = (x - self.origin.x) / self.resolution
+        fy = (y - self.origin.y) / self.resolution
+        ix = min(int(fx), self.nx - 2)
+        iy = min(int(fy), self.ny - 2)
+        tx = fx - ix
+        ty = fy - iy
+        w00 = (1 - tx) * (1 - ty)
+        w01 = (1 - tx) * ty
+        w10 = tx * (1 - ty)
+        w11 = tx * ty
+        i00 = ix * self.ny + iy
+        i10 = i00 + self.ny
+        r = self.r
+        m0 = self.m0
+        m1 = self.m1
+        return acc.set(
+            r[i00] * w00 + r[i00 + 1] * w01 + r[i10] * w10 + r[i10 + 1] * w11,
+            m0[i00] * w00 + m0[i00 + 1] * w01 + m0[i10] * w10 + m0[i10 + 1] * w11,
+            m1[i00] * w00 + m1[i00 + 1] * w01 + m1[i10] * w10 + m1[i10 + 1] * w11
+        )
+
+    # Expects all points to be inside the baked domain, see 'contains_points'.
+    def sample_points(self, points: np.ndarray) -> TensorSamples:
+        fx = (points[:, 0] - self.origin.x) / self.resolution
+        fy = (points[:, 1] - self.origin.y) / self.resolution
+        ix = np.minimum(fx.astype(np.intp), self.nx - 2)
+        iy = np.minimum(fy.astype(np.intp), self.ny - 2)
+        tx = fx - ix
+        ty = fy - iy
+        weights = ((1 - tx) * (1 - ty), (1 - tx) * ty, tx * (1 - ty), tx * ty)
+        i00 = ix * self.ny + iy
+        indices = (i00, i00 + 1, i00 + self.ny, i00 + self.ny + 1)
+
+        def interpolate(values):
+            values = np.frombuffer(values, dtype=float)
+            return sum(values[i] * w for i, w in zip(indices, weights))
+
+        return TensorSamples(
+            interpolate(self.r),
+            np.stack((interpolate(self.m0), interpolate(self.m1)), axis=1)
+        )
+
+    def contains_points(self, points: np.ndarray) -> np.ndarray:
+        return (
+            (points[:, 0] >= self.origin.x) & (points[:, 0] <= self.max_x)
+            & (points[:, 1] >= self.origin.y) & (points[:, 1] <= self.max_y)
+        )
+
+    # Compares the interpolated field against the analytic field at 'n_samples' random
+    # points of the domain. Errors are angles (radians) between the baked and the analytic
+    # major eigenvectors, which are equal to the errors of the minor eigenvectors.
+    # Can be used to choose the resolution per city.
+    def error_report(self, n_samples=10000, seed=0) -> dict:
+        rng = np.random.default_rng(seed)
+        points = np.stack((
+            self.origin.x + rng.random(n_samples) * (self.max_x - self.origin.x),
+            self.origin.y + rng.random(n_samples) * (self.max_y - self.origin.y)
+        ), axis=1)
+        baked = self.sample_points(points)
+        analytic = self.field.evaluate_points(points)
+        # Eigenvectors are only defined up to sign, so the difference is wrapped to [-pi/2, pi/2).
+        error = np.abs((baked.theta - analytic.theta + math.pi / 2) % math.pi - math.pi / 2)
+        # Points without a defined direction in both fields have no error.
+        error[(baked.r == 0) & (analytic.r == 0)] = 0.0
+        return {
+            'resolution': self.resolution,
+            'grid_size': (self.nx, self.ny),
+            'n_samples': n_samples,
+            'mean_error': float(error.mean()),
+            'p99_error': float(np.percentile(error, 99)),
+            'max_error': float(error.max()),
+        }
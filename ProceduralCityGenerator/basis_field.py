@@ -1,5 +1,6 @@
 import math
-from ProceduralCityGenerator.tensor import Tensor
+import numpy as np
+from ProceduralCityGenerator.tensor import Tensor, TensorAccumulator, TensorSamples
 from mathutils import Vector
 
 
@@ -7,6 +8,12 @@ from mathutils import Vector
 #
 # Can be sampled to retrieve the tensor at a specified point of the domain.
 # 'get_weighted_tensor' returns the tensor weighted with the fields decay constant.
+# The '*_tensors' and '*_weights' methods are array kernels of the same computations, taking
+# an array of N points of shape (N, 2) and returning TensorSamples/arrays.
+# 'accumulate' adds the weighted tensor at a point directly to a TensorAccumulator, which
+# avoids creating Tensor and Vector objects on the sampling hot path.
+# 'get_support_radius' returns the distance from the center beyond which the weight is zero,
+# or below 'epsilon' for smooth fields.
 class BasisField:
     def __init__(self, center: Vector, size, decay):
         self.center = center.copy()
@@ -20,7 +27,10 @@ class BasisField:
         return Tensor.zero()
 
     def get_tensor_weight(self, point: Vector, smooth: bool):
-        norm_distance_to_center = Vector((point.x - self.center.x, point.y - self.center.y)).length / self.size
+        return self.get_distance_weight(Vector((point.x - self.center.x, point.y - self.center.y)).length, smooth)
+
+    def get_distance_weight(self, distance, smooth: bool):
+        norm_distance_to_center = distance / self.size
         if smooth:
             # return norm_distance_to_center ** -self.decay
             return math.exp(-self.decay * norm_distance_to_center ** 2)
@@ -28,15 +38,61 @@ class BasisField:
             return 0
         return max(0, (1 - norm_distance_to_center)) ** self.decay
 
+    def accumulate(self, acc: TensorAccumulator, x, y):
+        acc.add(0.0, 0.0, self.get_distance_weight(math.hypot(x - self.center.x, y - self.center.y), acc.smooth))
+
+    def get_support_radius(self, smooth: bool, epsilon=0.0):
+        if not smooth:
+            return self.size
+        if epsilon <= 0 or self.decay <= 0:
+            return math.inf
+        if epsilon >= 1:
+            return 0.0
+        return self.size * math.sqrt(-math.log(epsilon) / self.decay)
+
+    def get_weighted_tensors(self, points: np.ndarray, smooth=False) -> TensorSamples:
+        return self.get_tensors(points).scale(self.get_tensor_weights(points, smooth))
+
+    def get_tensors(self, points: np.ndarray) -> TensorSamples:
+        return TensorSamples.zero(len(points))
+
+    def get_tensor_weights(self, points: np.ndarray, smooth: bool) -> np.ndarray:
+        norm_distance_to_center = np.hypot(points[:, 0] - self.center.x, points[:, 1] - self.center.y) / self.size
+        if smooth:
+            return np.exp(-self.decay * norm_distance_to_center ** 2)
+        if self.decay == 0:
+            return np.where(norm_distance_to_center >= 1, 0.0, 1.0)
+        return np.maximum(0, (1 - norm_distance_to_center)) ** self.decay
+
 
 class GridBasisField(BasisField):
     def __init__(self, center: Vector, size, decay, theta):
         super().__init__(center, size, decay)
         self.theta = theta
 
+    @property
+    def theta(self):
+        return self._theta
+
+    @theta.setter
+    def theta(self, theta):
+        self._theta = theta
+        self._cos_2theta = math.cos(2 * theta)
+        self._sin_2theta = math.sin(2 * theta)
+
     def get_tensor(self, point: Vector):
         return Tensor(1, [math.cos(2 * self.theta), math.sin(2 * self.theta)])
 
+    def accumulate(self, acc: TensorAccumulator, x, y):
+        distance = math.hypot(x - self.center.x, y - self.center.y)
+        acc.add(self._cos_2theta, self._sin_2theta, self.get_distance_weight(distance, acc.smooth))
+
+    def get_tensors(self, points: np.ndarray) -> TensorSamples:
+        matrix = np.empty((len(points), 2))
+        matrix[:, 0] = math.cos(2 * self.theta)
+        matrix[:, 1] = math.sin(2 * self.theta)
+        return TensorSamples(np.ones(len(points)), matrix)
+
 
 class RadialBasisField(BasisField):
     def __init__(self, center: Vector, size, decay):
@@ -47,3 +103,14 @@ class RadialBasisField(BasisField):
         t1 = t.y ** 2 - t.x ** 2
         t2 = -2 * t.x * t.y
         return Tensor(1, [t1, t2])
+
+    def accumulate(self, acc: TensorAccumulator, x, y):
+        tx = x - self.center.x
+        ty = y - self.center.y
+        acc.add(ty * ty - tx * tx, -2 * tx * ty, self.get_distance_weight(math.hypot(tx, ty), acc.smooth))
+
+    def get_tensors(self, points: np.ndarray) -> TensorSamples:
+        tx = points[:, 0] - self.center.x
+        ty = points[:, 1] - self.center.y
+        matrix = np.stack((ty ** 2 - tx ** 2, -2 * tx * ty), axis=1)
+        return TensorSamples(np.ones(len(points)), matrix)
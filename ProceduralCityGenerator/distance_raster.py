@@ -0,0 +1,76 @@
+import math
+import numpy as np
+from mathutils import Vector
+
+
+# Raster of the distances from the cell centers to the closest stored sample, covering the
+# domain given by origin and dimensions with square cells of size 'resolution'.
+# Samples are stamped into all cells whose center is within 'max_distance' of the sample,
+# cells further away than that from all samples hold infinity.
+#
+# The distance of any point to the closest sample differs from the value of its cell by at
+# most half the cell diagonal, so a single lookup proves that a point is at least
+# 'distance' away from all samples ('is_far'). Points near that boundary are undecided and
+# must be checked exactly.
+#
+# Polylines are thinned before stamping: a point is only stamped if it is further than
+# 'slack' from the last stamped point, so the stamped points are within 'slack' of all
+# samples, which is subtracted from the looked up distances as well.
+class DistanceRaster:
+    def __init__(self, world_dimensions: Vector, origin: Vector, distance, resolution=None):
+        self.origin = origin.copy()
+        self.distance = distance
+        self.resolution = distance / 4 if resolution is None else resolution
+        self.slack = self.resolution / 2
+        # Maximum difference between the distance of a point and the value of its cell.
+        self.tolerance = self.resolution * math.sqrt(0.5) + self.slack
+        self.max_distance = distance + self.tolerance
+        self.nx = max(math.ceil(world_dimensions.x / self.resolution), 1)
+        self.ny = max(math.ceil(world_dimensions.y / self.resolution), 1)
+        self.values = np.full((self.nx, self.ny), math.inf)
+
+        window = math.ceil(self.max_distance / self.resolution)
+        self.offsets = np.arange(-window, window + 1)
+
+    # Stamps the samples of a polyline, given as sequence of (x, y) tuples, into the raster.
+    def stamp_polyline(self, points):
+        stamped = []
+        last_x = last_y = math.inf
+        slack_sq = self.slack * self.slack
+        for x, y in points:
+            if (x - last_x) ** 2 + (y - last_y) ** 2 > slack_sq:
+                stamped.append((x, y))
+                last_x = x
+                last_y = y
+        self.stamp(stamped)
+
+    # Stamps an array of N points of shape (N, 2) into the raster.
+    def stamp(self, points: np.ndarray):
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        if len(points) == 0:
+            return
+        x = points[:, 0, None, None]
+        y = points[:, 1, None, None]
+        cell_x = np.floor((x - self.origin.x) / self.resolution).astype(np.intp) + self.offsets[None, :, None]
+        cell_y = np.floor((y - self.origin.y) / self.resolution).astype(np.intp) + self.offsets[None, None, :]
+        distances = np.hypot(
+            self.origin.x + (cell_x + 0.5) * self.resolution - x,
+            self.origin.y + (cell_y + 0.5) * self.resolution - y)
+        mask = (
+            (distances <= self.max_distance)
+            & (cell_x >= 0) & (cell_x < self.nx)
+            & (cell_y >= 0) & (cell_y < self.ny)
+        )
+        flat_indices = (cell_x * self.ny + cell_y)[mask]
+        np.minimum.at(self.values.reshape(-1), flat_indices, distances[mask])
+
+    # Returns True if (x, y) is proven to be at least sqrt(d_sq) away from all samples.
+    # False means undecided, not necessarily too close.
+    # called every integration step
+    def is_far(self, x, y, d_sq) -> bool:
+        cell_x = math.floor((x - self.origin.x) / self.resolution)
+        cell_y = math.floor((y - self.origin.y) / self.resolution)
+        if cell_x < 0 or cell_y < 0 or cell_x >= self.nx or cell_y >= self.ny:
+            return False
+        lower_bound = min(self.values[cell_x, cell_y], self.max_distance) - self.tolerance
+        return lower_bound >= 0 and lower_bound * lower_bound >= d_sq
@@ -0,0 +1,133 @@
+import math
+import numpy as np
+from mathutils import Vector
+from ProceduralCityGenerator.graph import Graph
+from ProceduralCityGenerator.grid_storage import GridStorage
+from ProceduralCityGenerator.streamlines import StreamlineGenerator
+from ProceduralCityGenerator.tensor_field import TensorField
+
+
+# Applies edits of the basis fields of a TensorField to the streamlines of a generator, and
+# optionally to a Graph built from it, regenerating only the affected region: the support
+# regions of the edited basis field before and after the edit.
+# Streamlines passing through the region are removed and the region is re-seeded, together
+# with the paths of the removed streamlines outside of it. Kept streamlines with an end within
+# dlookahead of a removed streamline, which could have ended at it or been joined to it, are
+# joined again. All other streamlines are kept as they are. Fields with unbounded support
+# (smooth fields without 'smooth_epsilon') regenerate all streamlines.
+#
+# Outside of its support, a basis field contributes a zero tensor, which scales the tensors
+# summed before it (see 'Tensor.skip'). Adding a field, which is appended, and moving a field
+# therefore do not change the field outside of the region. Removing a field changes the
+# relative weight of the fields before and after it where they overlap, which is ignored.
+#
+# The bounding boxes of the streamlines are tracked, to find the streamlines in a region
+# without testing all of their points. Streamlines are only ever extended in place (by joins,
+# also outside of 'update'), so a box is valid as long as the number of points of its
+# streamline is unchanged.
+class FieldEditor:
+    def __init__(self, field: TensorField, generator: StreamlineGenerator, graph: Graph | None = None):
+        self.field = field
+        self.generator = generator
+        self.graph = graph
+        # id of streamline -> (number of points, (min_x, min_y, max_x, max_y))
+        self.bounding_boxes: dict[int, tuple[int, tuple[float, float, float, float]]] = {}
+
+    def add_field(self, basis_field):
+        self.field.add_field(basis_field)
+        self.update([self.field.get_support_region(basis_field)])
+
+    def remove_field(self, basis_field):
+        region = self.field.get_support_region(basis_field)
+        self.field.remove_field(basis_field)
+        self.update([region])
+
+    def move_field(self, basis_field, center: Vector):
+        region = self.field.get_support_region(basis_field)
+        self.field.move_field(basis_field, center)
+        self.update([region, self.field.get_support_region(basis_field)])
+
+    def get_bounding_box(self, streamline) -> tuple[float, float, float, float]:
+        length, box = self.bounding_boxes.get(id(streamline), (None, None))
+        if length != len(streamline):
+            xs = [p.x for p in streamline]
+            ys = [p.y for p in streamline]
+            box = (min(xs), min(ys), max(xs), max(ys))
+            self.bounding_boxes[id(streamline)] = (len(streamline), box)
+        return box
+
+    # Returns the streamlines with at least one point inside the discs given as
+    # (x, y, radius).
+    def get_streamlines_in_regions(self, regions) -> list:
+        streamlines = []
+        for streamline in self.generator.all_streamlines:
+            min_x, min_y, max_x, max_y = self.get_bounding_box(streamline)
+            for x, y, radius in regions:
+                dx = max(min_x - x, 0, x - max_x)
+                dy = max(min_y - y, 0, y - max_y)
+                if dx * dx + dy * dy > radius * radius:
+                    continue
+                points = np.array([p.to_tuple() for p in streamline])
+                if ((points[:, 0] - x) ** 2 + (points[:, 1] - y) ** 2 <= radius * radius).any():
+                    streamlines.append(streamline)
+                    break
+        return streamlines
+
+    # Returns discs (x, y, dsep) every dsep along the streamlines.
+    def get_path_regions(self, streamlines) -> list[tuple[float, float, float]]:
+        dsep = self.generator.parameters.dsep
+        regions = []
+        for streamline in streamlines:
+            distance = math.inf
+            previous = None
+            for p in streamline:
+                if previous is not None:
+                    distance += (p - previous).length
+                if distance >= dsep:
+                    regions.append((p.x, p.y, dsep))
+                    distance = 0
+                previous = p
+        return regions
+
+    # Returns the streamlines, except circles, with an end within the distance of a point of
+    # the given streamlines.
+    def get_streamlines_ending_near(self, streamlines, distance) -> list:
+        generator = self.generator
+        points = GridStorage(generator.world_dimensions, generator.origin, distance)
+        points.add_polyline(p for s in streamlines for p in s)
+        if len(points) == 0:
+            return []
+        return [
+            streamline
+            for streamline in generator.all_streamlines
+            if not streamline[0] == streamline[-1] and (
+                points.get_points_in_radius(streamline[0], distance)
+                or points.get_points_in_radius(streamline[-1], distance))
+        ]
+
+    # Regenerates the streamlines in the regions given as (x, y, radius).
+    def update(self, regions):
+        if any(radius == math.inf for _, _, radius in regions):
+            self.regenerate()
+            return
+
+        generator = self.generator
+        removed, removed_simple = generator.remove_streamlines(self.get_streamlines_in_regions(regions))
+        for streamline in removed:
+            self.bounding_boxes.pop(id(streamline), None)
+        kept = self.get_streamlines_ending_near(removed, generator.parameters.dlookahead)
+        added, added_simple = generator.create_region_streamlines(regions + self.get_path_regions(removed))
+        joined, previous_simple, joined_simple = generator.rejoin_streamlines(kept)
+        for streamline in joined:
+            self.bounding_boxes.pop(id(streamline), None)
+        if self.graph is not None:
+            self.graph.update(removed_simple + previous_simple, added_simple + joined_simple)
+
+    # Regenerates all streamlines. The Graph is updated in place, like in 'update'.
+    def regenerate(self):
+        generator = self.generator
+        removed, removed_simple = generator.remove_streamlines(list(generator.all_streamlines))
+        generator.create_all_streamlines()
+        self.bounding_boxes = {}
+        if self.graph is not None:
+            self.graph.update(removed_simple, list(generator.all_streamlines_simple))
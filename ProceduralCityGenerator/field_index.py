@@ -0,0 +1,49 @@
+import math
+from statistics import median
+
+
+# Spatial index over the support regions of basis fields, used to cull basis fields that
+# can not contribute to a sample.
+# The support region of each basis field is a disc around its center (see
+# 'BasisField.get_support_radius'), fields with unbounded support are candidates everywhere.
+#
+# The index is a hash grid: each cell holds the ascending indices of all basis fields whose
+# support region overlaps the cell. The order of the indices matches the order of the basis
+# fields in the TensorField, which keeps the accumulation order of tensors intact.
+class BasisFieldIndex:
+    def __init__(self, basis_fields, smooth: bool, epsilon=0.0):
+        self.centers = [(field.center.x, field.center.y) for field in basis_fields]
+        self.support_radii = [field.get_support_radius(smooth, epsilon) for field in basis_fields]
+        self.global_indices = tuple(i for i, r in enumerate(self.support_radii) if r == math.inf)
+        self.cells: dict[tuple[int, int], tuple[int, ...]] = {}
+
+        finite_radii = [r for r in self.support_radii if r < math.inf]
+        self.cell_size = max(median(finite_radii), 1.0) if finite_radii else 1.0
+
+        cells: dict[tuple[int, int], list[int]] = {}
+        for i, (field, r) in enumerate(zip(basis_fields, self.support_radii)):
+            if r == math.inf:
+                continue
+            for x in range(self.cell_coord(field.center.x - r), self.cell_coord(field.center.x + r) + 1):
+                for y in range(self.cell_coord(field.center.y - r), self.cell_coord(field.center.y + r) + 1):
+                    cells.setdefault((x, y), []).append(i)
+        for key, indices in cells.items():
+            self.cells[key] = tuple(sorted(indices + list(self.global_indices)))
+
+    def cell_coord(self, v) -> int:
+        return math.floor(v / self.cell_size)
+
+    # Returns the ascending indices of all basis fields that can contribute at (x, y).
+    def get_candidates(self, x, y) -> tuple[int, ...]:
+        return self.cells.get((math.floor(x / self.cell_size), math.floor(y / self.cell_size)), self.global_indices)
+
+    # Returns True if the support region of the basis field with index i overlaps the axis
+    # aligned box given by its min and max coordinates.
+    def overlaps_box(self, i, min_x, min_y, max_x, max_y) -> bool:
+        r = self.support_radii[i]
+        if r == math.inf:
+            return True
+        x, y = self.centers[i]
+        dx = max(min_x - x, 0, x - max_x)
+        dy = max(min_y - y, 0, y - max_y)
+        return dx * dx + dy * dy < r * r
@@ -0,0 +1,155 @@
+import math
+import numpy as np
+from mathutils import Vector
+from ProceduralCityGenerator.distance_raster import DistanceRaster
+
+
+# Set of the cells of the domain that can still hold a seed point, i.e. a point at least dsep
+# away from all samples of a storage (GridStorage or KDTreeStorage).
+# Cells are removed as soon as a DistanceRaster proves that all of their points are closer
+# than dsep to a stamped sample. The union of several samples can cover a cell without any
+# single sample doing so, so cells in which a seed was rejected are refined with exact
+# distances at REFINE_SAMPLES x REFINE_SAMPLES points, and dropped after MAX_FAILURES
+# rejected seeds.
+#
+# The first 'size' entries of the int32 array 'cells' are the free cells, in any order, and
+# 'positions' holds the index of each cell in 'cells' (-1 for removed cells), for O(1) random
+# choice and swap-removal. Both take 4 bytes per raster cell, without Python objects per cell.
+class FreeSpace:
+    REFINE_SAMPLES = 4
+    MAX_FAILURES = 8
+
+    def __init__(self, storage, resolution=None):
+        self.storage = storage
+        self.dsep = storage.dsep
+        self.origin = storage.origin.copy()
+        self.world_dimensions = storage.world_dimensions.copy()
+        self.raster = DistanceRaster(
+            self.world_dimensions,
+            self.origin,
+            self.dsep,
+            self.dsep / 8 if resolution is None else resolution)
+        self.resolution = self.raster.resolution
+        self.half_diagonal = self.resolution * math.sqrt(0.5)
+        self.ny = self.raster.ny
+
+        self.size = self.raster.nx * self.raster.ny
+        self.cells = np.arange(self.size, dtype=np.int32)
+        self.positions = np.arange(self.size, dtype=np.int32)
+        self.failures: dict[int, int] = {}
+
+        self.stamp_polyline([(v.x, v.y) for v in storage.get_samples()])
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, cell):
+        return self.positions[cell] >= 0
+
+    def stamp_polyline(self, points):
+        points = list(points)
+        self.raster.stamp_polyline(points)
+        self.update(points)
+
+    def stamp(self, x, y):
+        self.raster.stamp((x, y))
+        self.update([(x, y)])
+
+    # Removes all free cells around the points that are covered by a single sample.
+    def update(self, points):
+        if not points:
+            return
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        min_x, min_y = np.floor((points.min(axis=0) - self.dsep - (self.origin.x, self.origin.y)) / self.resolution)
+        max_x, max_y = np.floor((points.max(axis=0) + self.dsep - (self.origin.x, self.origin.y)) / self.resolution)
+        min_x = max(int(min_x), 0)
+        min_y = max(int(min_y), 0)
+        max_x = min(int(max_x) + 1, self.raster.nx)
+        max_y = min(int(max_y) + 1, self.raster.ny)
+        if min_x >= max_x or min_y >= max_y:
+            return
+
+        # The distance of each point of a cell to the closest sample is at most the distance
+        # of the cell center to the closest stamped point plus half the cell diagonal.
+        covered = self.raster.values[min_x:max_x, min_y:max_y] + self.half_diagonal < self.dsep
+        covered &= self.positions.reshape(self.raster.nx, self.ny)[min_x:max_x, min_y:max_y] >= 0
+        i, j = np.nonzero(covered)
+        self.remove_all((min_x + i) * self.ny + min_y + j)
+
+    def remove(self, cell):
+        self.remove_all(np.array([cell]))
+
+    # Removes an array of distinct free cells. The free cells at the end of 'cells' are moved
+    # into the positions of the removed cells before the new end.
+    def remove_all(self, cells: np.ndarray):
+        if len(cells) == 0:
+            return
+        holes = self.positions[cells]
+        self.positions[cells] = -1
+        size = self.size - len(cells)
+        tail = self.cells[size:self.size]
+        moved = tail[self.positions[tail] >= 0]
+        holes = holes[holes < size]
+        self.cells[holes] = moved
+        self.positions[moved] = holes
+        self.size = size
+        if self.failures:
+            for cell in cells.tolist():
+                self.failures.pop(cell, None)
+
+    # Returns the cell of the world coordinates (x, y), clamped to the domain.
+    def get_cell(self, x, y) -> int:
+        cell_x = min(max(math.floor((x - self.origin.x) / self.resolution), 0), self.raster.nx - 1)
+        cell_y = min(max(math.floor((y - self.origin.y) / self.resolution), 0), self.ny - 1)
+        return cell_x * self.ny + cell_y
+
+    # Returns the bounds (min_x, min_y, max_x, max_y) of the cell, clipped to the domain.
+    def get_cell_bounds(self, cell):
+        min_x = self.origin.x + (cell // self.ny) * self.resolution
+        min_y = self.origin.y + (cell % self.ny) * self.resolution
+        return (
+            min_x,
+            min_y,
+            min(min_x + self.resolution, self.origin.x + self.world_dimensions.x),
+            min(min_y + self.resolution, self.origin.y + self.world_dimensions.y)
+        )
+
+    # Returns a random point of a random free cell and the cell, or None if there are no free
+    # cells left. 'rng' is a RandomStream or a NumPy Generator.
+    def sample_point(self, rng):
+        if self.size == 0:
+            return None
+        cell = int(self.cells[min(int(rng.random() * self.size), self.size - 1)])
+        min_x, min_y, max_x, max_y = self.get_cell_bounds(cell)
+        return Vector((
+            min_x + rng.random() * (max_x - min_x),
+            min_y + rng.random() * (max_y - min_y))
+        ), cell
+
+    # Called for seeds sampled in the cell that turned out to be too close to a sample.
+    def reject(self, cell):
+        if cell not in self:
+            return
+        self.failures[cell] = self.failures.get(cell, 0) + 1
+        if self.failures[cell] >= self.MAX_FAILURES or self.is_covered(cell):
+            self.remove(cell)
+
+    # Returns True if exact distances prove that the cell holds no point at least dsep away
+    # from all samples.
+    def is_covered(self, cell) -> bool:
+        min_x, min_y, max_x, max_y = self.get_cell_bounds(cell)
+        n = self.REFINE_SAMPLES
+        step_x = (max_x - min_x) / n
+        step_y = (max_y - min_y) / n
+        sub_half_diagonal = math.hypot(step_x, step_y) / 2
+        points = self.storage.get_coords_in_radius(
+            (min_x + max_x) / 2, (min_y + max_y) / 2, self.dsep + self.resolution)
+        if len(points) == 0:
+            return False
+
+        xs = min_x + (np.arange(n) + 0.5) * step_x
+        ys = min_y + (np.arange(n) + 0.5) * step_y
+        sub_x, sub_y = (a.ravel() for a in np.meshgrid(xs, ys, indexing='ij'))
+        distance_sq = (points[None, :, 0] - sub_x[:, None]) ** 2 + (points[None, :, 1] - sub_y[:, None]) ** 2
+        max_distance = math.sqrt(distance_sq.min(axis=1).max())
+        return max_distance + sub_half_diagonal < self.dsep
@@ -1,4 +1,5 @@
 import math
+import numpy as np
 from mathutils import Vector
 from mathutils import geometry
 from collections import deque
@@ -8,6 +9,7 @@ from enum import Enum
 # from . streamline_parameters import StreamlineParameters
 # from . simplify import simplify
 from ProceduralCityGenerator.streamlines import StreamlineGenerator
+from ProceduralCityGenerator.streamline_store import StreamlineStore
 
 
 class NodeType(Enum):
@@ -64,16 +66,34 @@ class Neighbor():
 # Intersection detection uses brute-force implementation, testing all streamline segments against each other.
 # Graph generation is based on simplified streamlines by default. Using the complex streamlines as a base
 # takes a very long time with the current implementation.
+# With 'store', the graph is built from the streamlines of a StreamlineStore instead, the generator only
+# provides the domain and parameters. Intersection tests then work on the coordinate arrays of the store
+# (see 'add_store_segments'), only the streamline being split is turned into Vectors. Graphs of a store
+# can not be updated.
+# With 'generate' False, the graph is left empty, to be generated in steps by GraphStepper.
 class Graph():
-    def __init__(self, streamlines: StreamlineGenerator, complex=False):
+    def __init__(
+            self,
+            streamlines: StreamlineGenerator,
+            complex=False,
+            store: StreamlineStore | None = None,
+            generate=True):
         self.streamlines = streamlines
-        self.all_streamlines = streamlines.all_streamlines if complex else streamlines.all_streamlines_simple
+        self.store = store
+        if store is not None:
+            self.all_streamlines = store
+            self.add_store_segments(store)
+        else:
+            self.all_streamlines = streamlines.all_streamlines if complex else streamlines.all_streamlines_simple
         streamline_sections = deque([])
         for i in range(len(self.all_streamlines)):
             streamline_sections.append(deque([]))
         self.streamline_sections = streamline_sections
+        # Streamlines in the order of 'streamline_sections', see 'update'.
+        self.sectioned_streamlines = list(self.all_streamlines)
         self.nodes: list[Node] = []
-        self.generate_graph()
+        if generate:
+            self.generate_graph()
 
     def generate_graph(self):
         self.generate_streamline_sections()
@@ -89,47 +109,124 @@ class Graph():
     # Depending on the magnitute of the segment, multiple other streamlines can intersect the same segment.
     def generate_streamline_sections(self):
         for i in range(len(self.all_streamlines)):
-            streamline = self.all_streamlines[i]
-            section = deque([streamline[0]])
-            # Extend start of streamline slightly, to check for T-intersection.
-            # Also tests for intersections with itself, which can happen in the current implementation,
-            # probably due to inaccuracies in the current integration around circular elements in the tensor field.
-            if not (self.streamline_is_circle(streamline) or self.point_on_world_border(streamline[0])):
-                direction = streamline[0] - streamline[1]
+            self.generate_sections(i)
+
+    # Generates the sections of streamline i, see 'generate_streamline_sections'.
+    def generate_sections(self, i):
+        if self.store is not None:
+            self.streamline_sections[i] = self.get_streamline_sections(self.store.to_polyline(i), i)
+        else:
+            self.streamline_sections[i] = self.get_streamline_sections(self.all_streamlines[i])
+
+    # Returns the sections of a single streamline, see 'generate_streamline_sections'.
+    # 'store_index' is the index of the streamline in the store of the graph, if any.
+    def get_streamline_sections(self, streamline: deque[Vector], store_index=None) -> deque[deque[Vector]]:
+        sections = deque([])
+        section = deque([streamline[0]])
+        # Extend start of streamline slightly, to check for T-intersection.
+        # Also tests for intersections with itself, which can happen in the current implementation,
+        # probably due to inaccuracies in the current integration around circular elements in the tensor field.
+        if not (self.streamline_is_circle(streamline) or self.point_on_world_border(streamline[0])):
+            direction = streamline[0] - streamline[1]
+            direction.normalize()
+            segment_end = streamline[0] + (direction * self.streamlines.parameters.dstep * 1.5)
+            segment_start = streamline[0]
+            intersections = self.find_intersections(segment_start, segment_end, streamline, -1, store_index)
+            if intersections:
+                section.appendleft(intersections[0])
+        # Test each segment of the streamline for intersections.
+        for j in range(len(streamline) - 1):
+            segment_start = streamline[j]
+            segment_end = streamline[j + 1]
+            intersections = self.find_intersections(segment_start, segment_end, streamline, j, store_index)
+            if intersections:
+                for intersection in intersections:
+                    section.append(intersection)
+                    sections.append(section)
+                    section = deque([intersection])
+                section.append(segment_end)
+            else:
+                section.append(segment_end)
+        # Join start and end section of circular streamlines, if they should connect.
+        if self.streamline_is_circle(streamline) and sections:
+            section.pop()
+            sections[0].extendleft(reversed(section))
+        else:
+            # Extend end of streamline slightly, to check for T-intersections.
+            if not self.point_on_world_border(streamline[-1]):
+                direction = streamline[-1] - streamline[-2]
                 direction.normalize()
-                segment_end = streamline[0] + (direction * self.streamlines.parameters.dstep * 1.5)
-                segment_start = streamline[0]
-                intersections = self.find_intersections(segment_start, segment_end, streamline, -1)
-                if intersections:
-                    section.appendleft(intersections[0])
-            # Test each segment of the streamline for intersections.
-            for j in range(len(streamline) - 1):
-                segment_start = streamline[j]
-                segment_end = streamline[j + 1]
-                intersections = self.find_intersections(segment_start, segment_end, streamline, j)
+                segment_end = streamline[-1] + (direction * self.streamlines.parameters.dstep * 1.5)
+                segment_start = streamline[-1]
+                intersections = self.find_intersections(
+                    segment_start, segment_end, streamline, len(streamline) - 2, store_index)
                 if intersections:
-                    for intersection in intersections:
-                        section.append(intersection)
-                        self.streamline_sections[i].append(section)
-                        section = deque([intersection])
-                    section.append(segment_end)
-                else:
-                    section.append(segment_end)
-            # Join start and end section of circular streamlines, if they should connect.
-            if self.streamline_is_circle(self.all_streamlines[i]) and self.streamline_sections[i]:
-                section.pop()
-                self.streamline_sections[i][0].extendleft(reversed(section))
-            else:
-                # Extend end of streamline slightly, to check for T-intersections.
-                if not self.point_on_world_border(streamline[-1]):
-                    direction = streamline[-1] - streamline[-2]
-                    direction.normalize()
-                    segment_end = streamline[-1] + (direction * self.streamlines.parameters.dstep * 1.5)
-                    segment_start = streamline[-1]
-                    intersections = self.find_intersections(segment_start, segment_end, streamline, len(streamline) - 2)
-                    if intersections:
-                        section.append(intersections[0])
-                self.streamline_sections[i].append(section)
+                    section.append(intersections[0])
+            sections.append(section)
+        return sections
+
+    # Updates the graph after the generator removed and added streamlines, e.g. after a local
+    # edit of the tensor field. Sections are only recomputed for the added streamlines and the
+    # streamlines with a segment close to a segment of a removed or added one, all other
+    # sections are kept. Nodes are regenerated from the sections.
+    def update(self, removed, added):
+        margin = self.streamlines.parameters.dstep * 1.5
+        changed = [
+            (self.get_bounding_box(s, margin), self.get_segment_boxes(s, margin))
+            for s in list(removed) + list(added)
+        ]
+        previous_sections = {
+            id(s): sections for s, sections in zip(self.sectioned_streamlines, self.streamline_sections)
+        }
+
+        streamline_sections = deque([])
+        for streamline in self.all_streamlines:
+            sections = previous_sections.get(id(streamline))
+            if sections is None or self.touches_streamlines(streamline, changed):
+                sections = self.get_streamline_sections(streamline)
+            streamline_sections.append(sections)
+        self.streamline_sections = streamline_sections
+        self.sectioned_streamlines = list(self.all_streamlines)
+        self.nodes = []
+        self.generate_nodes()
+        self.add_border_connections()
+
+    # Returns (min_x, min_y, max_x, max_y) of the streamline, grown by the margin.
+    def get_bounding_box(self, streamline: deque[Vector], margin) -> tuple[float, float, float, float]:
+        xs = [p.x for p in streamline]
+        ys = [p.y for p in streamline]
+        return min(xs) - margin, min(ys) - margin, max(xs) + margin, max(ys) + margin
+
+    # Returns the bounding boxes of the segments of the streamline, grown by the margin, as
+    # array of shape (N - 1, 4).
+    def get_segment_boxes(self, streamline: deque[Vector], margin) -> np.ndarray:
+        points = np.array([p.to_tuple() for p in streamline]).reshape(-1, 2)
+        return np.hstack((
+            np.minimum(points[:-1], points[1:]) - margin,
+            np.maximum(points[:-1], points[1:]) + margin))
+
+    # Returns True if a segment of the streamline can intersect a segment of one of the
+    # streamlines given by their bounding and segment boxes.
+    def touches_streamlines(self, streamline: deque[Vector], streamlines) -> bool:
+        box = self.get_bounding_box(streamline, 0)
+        segment_boxes = None
+        for other_box, other_segment_boxes in streamlines:
+            if not (
+                box[0] <= other_box[2] and other_box[0] <= box[2]
+                and box[1] <= other_box[3] and other_box[1] <= box[3]
+            ):
+                continue
+            if segment_boxes is None:
+                segment_boxes = self.get_segment_boxes(streamline, 0)
+            a = segment_boxes[:, None]
+            b = other_segment_boxes[None, :]
+            overlaps = (
+                (a[..., 0] <= b[..., 2]) & (b[..., 0] <= a[..., 2])
+                & (a[..., 1] <= b[..., 3]) & (b[..., 1] <= a[..., 3])
+            )
+            if overlaps.any():
+                return True
+        return False
 
     # Finds intersections of given segment, denoted by segment_start and segment_end, and all other segments.
     # Skips segments on the same streamline and connected to the given segment.
@@ -139,7 +236,10 @@ class Graph():
             segment_end: Vector,
             streamline: deque[Vector],
             index,
+            store_index=None,
     ) -> Vector:
+        if self.store is not None:
+            return self.find_store_intersections(segment_start, segment_end, store_index, index, len(streamline))
         intersections = deque([])
         for s in self.all_streamlines:
             if s is streamline and self.streamline_is_circle(s):
@@ -169,52 +269,145 @@ class Graph():
             )
         return intersections
 
+    # Collects the segment data of the streamlines of a store for 'find_store_intersections': the bounding
+    # boxes of all segments, and of the extensions of the ends of open streamlines that don't lie at the
+    # border of the domain, as arrays of shape (N, 4). Boxes are grown by dstep / 2, so that the boxes of
+    # segments that touch within the precision of the intersection test overlap.
+    def add_store_segments(self, store: StreamlineStore):
+        margin = self.streamlines.parameters.dstep / 2
+        points = store.points.astype(float)
+        offsets = store.offsets
+        self.store_circles = [self.streamline_is_circle(store.to_polyline(i)) for i in range(len(store))]
+
+        # Segment k starts at point 'segment_points[k]', the last points of the streamlines start no segment.
+        inner = np.ones(max(len(points) - 1, 0), dtype=bool)
+        inner[offsets[1:-1][offsets[1:-1] > 0] - 1] = False
+        self.segment_points = np.flatnonzero(inner)
+        self.segment_streamlines = np.searchsorted(offsets, self.segment_points, side='right') - 1
+        starts = points[self.segment_points]
+        ends = points[self.segment_points + 1]
+        self.segment_boxes = np.hstack((np.minimum(starts, ends) - margin, np.maximum(starts, ends) + margin))
+
+        # End k is the start (k even) or end (k odd) of streamline k // 2.
+        end_points = []
+        end_streamlines = []
+        for i in range(len(store)):
+            if self.store_circles[i]:
+                continue
+            for point, previous in [(offsets[i], offsets[i] + 1), (offsets[i + 1] - 1, offsets[i + 1] - 2)]:
+                if not self.point_on_world_border(Vector(store.points[point])):
+                    end_points.append((point, previous))
+                    end_streamlines.append(i)
+        self.end_points = np.array(end_points, dtype=np.intp).reshape(-1, 2)
+        self.end_streamlines = np.array(end_streamlines, dtype=np.intp)
+        reach = self.streamlines.parameters.dstep * 1.5 + margin
+        ends = points[self.end_points[:, 0]]
+        self.end_boxes = np.hstack((ends - reach, ends + reach))
+
+    # 'find_intersections' for the streamlines of the store, 'store_index' is the index of the streamline
+    # of the given segment, with 'length' points. Only segments and extended ends with an overlapping
+    # bounding box are tested, in the order of the brute-force search.
+    def find_store_intersections(
+            self,
+            segment_start: Vector,
+            segment_end: Vector,
+            store_index,
+            index,
+            length,
+    ) -> Vector:
+        low_x = min(segment_start.x, segment_end.x)
+        low_y = min(segment_start.y, segment_end.y)
+        high_x = max(segment_start.x, segment_end.x)
+        high_y = max(segment_start.y, segment_end.y)
+        points = self.store.points
+        offsets = self.store.offsets
+        found = []
+
+        boxes = self.segment_boxes
+        hits = (boxes[:, 0] <= high_x) & (boxes[:, 2] >= low_x) & (boxes[:, 1] <= high_y) & (boxes[:, 3] >= low_y)
+        for k in np.flatnonzero(hits).tolist():
+            s = int(self.segment_streamlines[k])
+            point = int(self.segment_points[k])
+            if s == store_index and (self.store_circles[s] or point - offsets[s] in range(index - 1, index + 2)):
+                continue
+            intersection = geometry.intersect_line_line_2d(
+                segment_start, segment_end, Vector(points[point]), Vector(points[point + 1]))
+            if intersection is not None:
+                found.append(((s, 0, point), intersection))
+
+        # Ends of the same streamline that are part of the given segment are skipped.
+        own_points = {max(index, 0), min(index + 1, length - 1)}
+        boxes = self.end_boxes
+        hits = (boxes[:, 0] <= high_x) & (boxes[:, 2] >= low_x) & (boxes[:, 1] <= high_y) & (boxes[:, 3] >= low_y)
+        for k in np.flatnonzero(hits).tolist():
+            s = int(self.end_streamlines[k])
+            point, previous = self.end_points[k].tolist()
+            if s == store_index and point - offsets[s] in own_points:
+                continue
+            intersection = self.find_endpoint_intersections(
+                Vector(points[point]), Vector(points[previous]), segment_start, segment_end)
+            if intersection is not None:
+                found.append(((s, 1, point), intersection))
+
+        found.sort(key=lambda item: item[0])
+        intersections = [intersection for _, intersection in found]
+        if len(intersections) > 1:
+            intersections = sorted(
+                intersections,
+                key=lambda p: math.sqrt((p.x - segment_start.x) ** 2 + (p.y - segment_start.y) ** 2)
+            )
+        return intersections
+
     # Takes the generated streamline sections and turns start and end points into nodes and neighbors.
     # New nodes are saved to list of existing nodes.
     def generate_nodes(self):
+        for sections in self.streamline_sections:
+            self.add_section_nodes(sections)
+
+    # Adds the nodes and neighbors of the sections of a single streamline, see 'generate_nodes'.
+    def add_section_nodes(self, sections: deque[deque[Vector]]):
         dstep = self.streamlines.parameters.dstep
         tolerance = dstep / 2
         origin = self.streamlines.origin
         dimensions = self.streamlines.world_dimensions
-        for streamline in self.streamline_sections:
-            for section in streamline:
-                start = section[0]
-                start_node = None
-                end = section[-1]
-                end_node = None
-                # Check if any already existing nodes are close enough to the section start/end point to be
-                # considered the same.
-                for node in self.nodes:
-                    if (
-                        start_node is None
-                        and math.sqrt((node.co.x - start.x) ** 2 + (node.co.y - start.y) ** 2) <= tolerance
-                    ):
-                        start_node = node
-                    elif (
-                        end_node is None
-                        and math.sqrt((node.co.x - end.x) ** 2 + (node.co.y - end.y) ** 2) <= tolerance
-                    ):
-                        end_node = node
-                    if start_node is not None and end_node is not None:
-                        break
-                # If no existing nodes match start/end points, create new node.
-                if start_node is None:
-                    start_node = Node(start, origin, dimensions, dstep)
-                    self.nodes.append(start_node)
-                if end_node is None:
-                    end_node = Node(end, origin, dimensions, dstep)
-                    self.nodes.append(end_node)
-                # Adds the start/end node of the current section as a neighbor to the respective other node.
-                # The polyline section between the node and the neighbor is saved as well.
-                # The section leading from end node to start node is reversed to ensure that the connections are
-                # consistent and the polyline points are in the correct order from node to neighbor.
-                connection = section.copy()
-                connection.pop()
-                connection.popleft()
-                connection_reversed = connection.copy()
-                connection_reversed.reverse()
-                start_node.add_neighbor(Neighbor(end_node, connection))
-                end_node.add_neighbor(Neighbor(start_node, connection_reversed))
+        for section in sections:
+            start = section[0]
+            start_node = None
+            end = section[-1]
+            end_node = None
+            # Check if any already existing nodes are close enough to the section start/end point to be
+            # considered the same.
+            for node in self.nodes:
+                if (
+                    start_node is None
+                    and math.sqrt((node.co.x - start.x) ** 2 + (node.co.y - start.y) ** 2) <= tolerance
+                ):
+                    start_node = node
+                elif (
+                    end_node is None
+                    and math.sqrt((node.co.x - end.x) ** 2 + (node.co.y - end.y) ** 2) <= tolerance
+                ):
+                    end_node = node
+                if start_node is not None and end_node is not None:
+                    break
+            # If no existing nodes match start/end points, create new node.
+            if start_node is None:
+                start_node = Node(start, origin, dimensions, dstep)
+                self.nodes.append(start_node)
+            if end_node is None:
+                end_node = Node(end, origin, dimensions, dstep)
+                self.nodes.append(end_node)
+            # Adds the start/end node of the current section as a neighbor to the respective other node.
+            # The polyline section between the node and the neighbor is saved as well.
+            # The section leading from end node to start node is reversed to ensure that the connections are
+            # consistent and the polyline points are in the correct order from node to neighbor.
+            connection = section.copy()
+            connection.pop()
+            connection.popleft()
+            connection_reversed = connection.copy()
+            connection_reversed.reverse()
+            start_node.add_neighbor(Neighbor(end_node, connection))
+            end_node.add_neighbor(Neighbor(start_node, connection_reversed))
 
     # Finds all nodes and corner points along each border of the domain and adds the nearest neighbors along
     # the border as a border_neighbor to all border nodes.
@@ -244,14 +437,19 @@ class Graph():
         bottom_nodes.sort(key=lambda n: n.co.x)
         right_nodes.sort(key=lambda n: n.co.y)
         top_nodes.sort(key=lambda n: n.co.x)
-        left_nodes[0].add_border_neighbor(Neighbor(bottom_left, deque([])))
-        left_nodes[-1].add_border_neighbor(Neighbor(top_left, deque([])))
-        bottom_nodes[0].add_border_neighbor(Neighbor(bottom_left, deque([])), )
-        bottom_nodes[-1].add_border_neighbor(Neighbor(bottom_right, deque([])))
-        right_nodes[0].add_border_neighbor(Neighbor(bottom_right, deque([])))
-        right_nodes[-1].add_border_neighbor(Neighbor(top_right, deque([])))
-        top_nodes[0].add_border_neighbor(Neighbor(top_left, deque([])))
-        top_nodes[-1].add_border_neighbor(Neighbor(top_right, deque([])))
+        # Borders without nodes, e.g. of small tiles, are skipped.
+        if left_nodes:
+            left_nodes[0].add_border_neighbor(Neighbor(bottom_left, deque([])))
+            left_nodes[-1].add_border_neighbor(Neighbor(top_left, deque([])))
+        if bottom_nodes:
+            bottom_nodes[0].add_border_neighbor(Neighbor(bottom_left, deque([])), )
+            bottom_nodes[-1].add_border_neighbor(Neighbor(bottom_right, deque([])))
+        if right_nodes:
+            right_nodes[0].add_border_neighbor(Neighbor(bottom_right, deque([])))
+            right_nodes[-1].add_border_neighbor(Neighbor(top_right, deque([])))
+        if top_nodes:
+            top_nodes[0].add_border_neighbor(Neighbor(top_left, deque([])))
+            top_nodes[-1].add_border_neighbor(Neighbor(top_right, deque([])))
         for border in [left_nodes, bottom_nodes, right_nodes, top_nodes]:
             self.add_neighboring_node_connections(border)
 
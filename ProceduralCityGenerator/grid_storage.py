@@ -1,57 +1,416 @@
 import math
+import numpy as np
 from mathutils import Vector
+from ProceduralCityGenerator.distance_raster import DistanceRaster
+from ProceduralCityGenerator.free_space import FreeSpace
+
+
+# Base class of the spatial indices of streamline samples (GridStorage, KDTreeStorage), with
+# the parts that don't depend on the index: adding samples from lists, polylines and other
+# storages, and keeping the optional DistanceRaster and FreeSpace up to date.
+# Subclasses store the samples in 'store_sample' and 'store_points', and provide
+# 'get_samples', 'get_samples_and_coords' and 'get_coords_in_radius'.
+class SampleStorage:
+    # Sparse storages only allocate memory where samples are, the DistanceRaster and FreeSpace
+    # are dense rasters over the whole domain and can not be added to them.
+    SPARSE = False
+
+    def __init__(self, world_dimensions: Vector, origin: Vector, dsep):
+        self.world_dimensions: Vector = world_dimensions
+        self.origin: Vector = origin
+        self.dsep = dsep
+        self.dsep_sq = self.dsep ** 2
+        self.distance_raster: DistanceRaster | None = None
+        self.free_space: FreeSpace | None = None
+
+    # Adds a DistanceRaster for separation tests up to 'distance', stamped with all samples
+    # stored so far and all samples added later.
+    def add_distance_raster(self, distance, resolution=None) -> DistanceRaster:
+        if self.SPARSE:
+            raise ValueError(f"{type(self).__name__} can not keep a dense DistanceRaster")
+        self.distance_raster = DistanceRaster(self.world_dimensions, self.origin, distance, resolution)
+        self.distance_raster.stamp([(v.x, v.y) for v in self.get_samples()])
+        return self.distance_raster
+
+    # Adds a FreeSpace tracking the cells that can still hold seed points, see 'FreeSpace'.
+    def add_free_space(self, resolution=None) -> FreeSpace:
+        if self.SPARSE:
+            raise ValueError(f"{type(self).__name__} can not keep a dense FreeSpace")
+        self.free_space = FreeSpace(self, resolution)
+        return self.free_space
+
+    def add_all(self, storage):
+        self.add_points(*storage.get_samples_and_coords())
+
+    # Adds the samples of another storage, which can have a different origin and extent.
+    # Only samples within 'margin' (default dsep) of the domain are added, further samples
+    # can not affect separation tests inside the domain.
+    def merge(self, storage, margin=None):
+        margin = self.dsep if margin is None else margin
+        samples, points = storage.get_samples_and_coords()
+        inside = np.flatnonzero(
+            (points[:, 0] >= self.origin.x - margin)
+            & (points[:, 0] <= self.origin.x + self.world_dimensions.x + margin)
+            & (points[:, 1] >= self.origin.y - margin)
+            & (points[:, 1] <= self.origin.y + self.world_dimensions.y + margin))
+        self.add_points([samples[i] for i in inside.tolist()], points[inside])
+
+    # Adds a list of samples with their coordinates as array of shape (N, 2), see
+    # 'store_points'.
+    def add_points(self, samples, points: np.ndarray):
+        if len(samples) == 0:
+            return
+        self.store_points(samples, points)
+        if self.distance_raster is not None:
+            self.distance_raster.stamp_polyline(points.tolist())
+        if self.free_space is not None:
+            self.free_space.stamp_polyline(points.tolist())
+
+    def add_polyline(self, line):
+        line = list(line)
+        self.add_points(line, np.array([(v.x, v.y) for v in line]).reshape(-1, 2))
+
+    def add_sample(self, v, coords=None):
+        self.store_sample(v, coords)
+        if self.distance_raster is not None:
+            self.distance_raster.stamp((v.x, v.y))
+        if self.free_space is not None:
+            self.free_space.stamp(v.x, v.y)
+
+    # Adds the sample to the index, without updating the distance raster and free space.
+    def store_sample(self, v, coords=None):
+        pass
+
+    # Adds a non-empty list of samples with their coordinates to the index, without updating
+    # the distance raster and free space.
+    def store_points(self, samples, points: np.ndarray):
+        pass
+
+    # Vectorized 'is_valid_sample' for an array of points of shape (N, 2), returns an array of
+    # N bools. Samples equal to the points are ignored. The samples around all points are
+    # gathered once, so the points should be close to each other, e.g. consecutive points of
+    # a streamline.
+    def are_valid_samples(self, points: np.ndarray, d_sq=None) -> np.ndarray:
+        if d_sq is None:
+            d_sq = self.dsep_sq
+        if len(points) == 0:
+            return np.ones(0, dtype=bool)
+        low = points.min(axis=0)
+        high = points.max(axis=0)
+        center_x, center_y = ((low + high) / 2).tolist()
+        half_diagonal = math.hypot(*((high - low) / 2).tolist())
+        samples = self.get_coords_in_radius(center_x, center_y, half_diagonal + math.sqrt(d_sq))
+        if len(samples) == 0:
+            return np.ones(len(points), dtype=bool)
+        dx = points[:, 0, np.newaxis] - samples[:, 0]
+        dy = points[:, 1, np.newaxis] - samples[:, 1]
+        distance_sq = dx * dx + dy * dy
+        return ~((distance_sq < d_sq) & (distance_sq > 0)).any(axis=1)
+
+
+# Level of a GridStorage: square cells of size 'cell_size' covering the domain, each holding
+# the coordinates of its samples in a NumPy buffer of shape (capacity, 2), indexed by the
+# flat cell index x * ny + y. Buffers grow by doubling, so appends are amortized O(1).
+#
+# Points outside of the domain are assigned to the nearest cell.
+class GridLevel:
+    INITIAL_CELL_CAPACITY = 16
+
+    def __init__(self, world_dimensions: Vector, origin: Vector, cell_size):
+        self.origin: Vector = origin
+        self.cell_size = cell_size
+        self.nx = max(math.ceil(world_dimensions.x / cell_size), 1)
+        self.ny = max(math.ceil(world_dimensions.y / cell_size), 1)
+        self.cell_points: list[np.ndarray] = [np.empty((0, 2))] * (self.nx * self.ny)
+        self.cell_counts: list[int] = [0] * (self.nx * self.ny)
+
+    # Returns the cell of the world coordinates (x, y), clamped to the grid.
+    # called every integration step
+    def cell_coords(self, x, y) -> tuple[int, int]:
+        cell_x = math.floor((x - self.origin.x) / self.cell_size)
+        cell_y = math.floor((y - self.origin.y) / self.cell_size)
+        return min(max(cell_x, 0), self.nx - 1), min(max(cell_y, 0), self.ny - 1)
+
+    def add(self, x, y, cell_x, cell_y):
+        i = cell_x * self.ny + cell_y
+        n = self.cell_counts[i]
+        points = self.cell_points[i]
+        if n == len(points):
+            grown = np.empty((max(2 * n, self.INITIAL_CELL_CAPACITY), 2))
+            grown[:n] = points[:n]
+            self.cell_points[i] = points = grown
+        points[n] = (x, y)
+        self.cell_counts[i] = n + 1
+
+    # Appends an array of points of shape (N, 2) to the buffer of the cell.
+    def extend(self, cell, points: np.ndarray):
+        n = self.cell_counts[cell]
+        buffer = self.cell_points[cell]
+        if n + len(points) > len(buffer):
+            grown = np.empty((max(2 * n, n + len(points), self.INITIAL_CELL_CAPACITY), 2))
+            grown[:n] = buffer[:n]
+            self.cell_points[cell] = buffer = grown
+        buffer[n:n + len(points)] = points
+        self.cell_counts[cell] = n + len(points)
+
+    # Bins an array of points of shape (N, 2) at once, keeping their order within each cell.
+    # Returns the flat index of each occupied cell with the indices of its points.
+    def add_points(self, points: np.ndarray) -> list[tuple[int, np.ndarray]]:
+        cell_x = np.clip(np.floor((points[:, 0] - self.origin.x) / self.cell_size), 0, self.nx - 1)
+        cell_y = np.clip(np.floor((points[:, 1] - self.origin.y) / self.cell_size), 0, self.ny - 1)
+        cells = cell_x.astype(np.intp) * self.ny + cell_y.astype(np.intp)
+        order = np.argsort(cells, kind='stable')
+        sorted_cells = cells[order]
+        starts = np.flatnonzero(np.r_[True, sorted_cells[1:] != sorted_cells[:-1]])
+        ends = np.r_[starts[1:], len(order)]
+
+        groups = []
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            cell = int(sorted_cells[start])
+            indices = order[start:end]
+            self.extend(cell, points[indices])
+            groups.append((cell, indices))
+        return groups
+
+    # Returns the coordinates of all samples in the cells within 'radius' cells around the
+    # cell of (x, y) as array of shape (N, 2), or None if there are none.
+    # The array is a view into the cell buffers if only a single cell is occupied, and
+    # must not be kept.
+    def get_nearby_coords(self, x, y, radius):
+        cell_x, cell_y = self.cell_coords(x, y)
+        ny = self.ny
+        counts = self.cell_counts
+        cell_points = self.cell_points
+        blocks = []
+        for i in range(max(cell_x - radius, 0), min(cell_x + radius + 1, self.nx)):
+            for j in range(i * ny + max(cell_y - radius, 0), i * ny + min(cell_y + radius + 1, ny)):
+                n = counts[j]
+                if n:
+                    blocks.append(cell_points[j][:n])
+        if not blocks:
+            return None
+        if len(blocks) == 1:
+            return blocks[0]
+        return np.concatenate(blocks)
+
+    # Returns the coordinates of the samples of the cell as array of shape (N, 2), a view into
+    # the cell buffer.
+    def get_cell_points(self, cell) -> np.ndarray:
+        return self.cell_points[cell][:self.cell_counts[cell]]
+
+    # Number of cells around the cell of a point that can hold points closer than 'distance'.
+    def get_radius(self, distance) -> int:
+        return max(math.ceil(distance / self.cell_size), 1)
+
+
+# GridLevel allocating its cells lazily in chunks of CHUNK_SIZE x CHUNK_SIZE cells, kept in a
+# dict keyed by chunk coordinates. Memory scales with the number of occupied chunks instead of
+# the domain area, lookups cost one dict access per cell.
+# Cells are still addressed by the flat cell index x * ny + y of the whole domain.
+class SparseGridLevel(GridLevel):
+    CHUNK_BITS = 4
+    CHUNK_SIZE = 1 << CHUNK_BITS
+
+    def __init__(self, world_dimensions: Vector, origin: Vector, cell_size):
+        self.origin: Vector = origin
+        self.cell_size = cell_size
+        self.nx = max(math.ceil(world_dimensions.x / cell_size), 1)
+        self.ny = max(math.ceil(world_dimensions.y / cell_size), 1)
+        # Chunk coordinates -> (cell buffers, cell counts), indexed by 'chunk_index'.
+        self.chunks: dict[tuple[int, int], tuple[list[np.ndarray], list[int]]] = {}
+
+    @classmethod
+    def chunk_index(cls, cell_x, cell_y) -> int:
+        mask = cls.CHUNK_SIZE - 1
+        return ((cell_x & mask) << cls.CHUNK_BITS) | (cell_y & mask)
+
+    def get_chunk(self, cell_x, cell_y) -> tuple[list[np.ndarray], list[int]]:
+        key = (cell_x >> self.CHUNK_BITS, cell_y >> self.CHUNK_BITS)
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            size = self.CHUNK_SIZE * self.CHUNK_SIZE
+            self.chunks[key] = chunk = ([np.empty((0, 2))] * size, [0] * size)
+        return chunk
+
+    def add(self, x, y, cell_x, cell_y):
+        cell_points, cell_counts = self.get_chunk(cell_x, cell_y)
+        i = self.chunk_index(cell_x, cell_y)
+        n = cell_counts[i]
+        points = cell_points[i]
+        if n == len(points):
+            grown = np.empty((max(2 * n, self.INITIAL_CELL_CAPACITY), 2))
+            grown[:n] = points[:n]
+            cell_points[i] = points = grown
+        points[n] = (x, y)
+        cell_counts[i] = n + 1
+
+    def extend(self, cell, points: np.ndarray):
+        cell_x, cell_y = divmod(cell, self.ny)
+        cell_points, cell_counts = self.get_chunk(cell_x, cell_y)
+        i = self.chunk_index(cell_x, cell_y)
+        n = cell_counts[i]
+        buffer = cell_points[i]
+        if n + len(points) > len(buffer):
+            grown = np.empty((max(2 * n, n + len(points), self.INITIAL_CELL_CAPACITY), 2))
+            grown[:n] = buffer[:n]
+            cell_points[i] = buffer = grown
+        buffer[n:n + len(points)] = points
+        cell_counts[i] = n + len(points)
+
+    # See 'GridLevel.get_nearby_coords'.
+    def get_nearby_coords(self, x, y, radius):
+        cell_x, cell_y = self.cell_coords(x, y)
+        bits = self.CHUNK_BITS
+        mask = self.CHUNK_SIZE - 1
+        chunks = self.chunks
+        blocks = []
+        for i in range(max(cell_x - radius, 0), min(cell_x + radius + 1, self.nx)):
+            for j in range(max(cell_y - radius, 0), min(cell_y + radius + 1, self.ny)):
+                chunk = chunks.get((i >> bits, j >> bits))
+                if chunk is None:
+                    continue
+                k = ((i & mask) << bits) | (j & mask)
+                n = chunk[1][k]
+                if n:
+                    blocks.append(chunk[0][k][:n])
+        if not blocks:
+            return None
+        if len(blocks) == 1:
+            return blocks[0]
+        return np.concatenate(blocks)
+
+    def get_cell_points(self, cell) -> np.ndarray:
+        cell_x, cell_y = divmod(cell, self.ny)
+        chunk = self.chunks.get((cell_x >> self.CHUNK_BITS, cell_y >> self.CHUNK_BITS))
+        if chunk is None:
+            return np.empty((0, 2))
+        i = self.chunk_index(cell_x, cell_y)
+        return chunk[0][i][:chunk[1][i]]
 
 
 # Cartesian grid data structure based on the open source implementation of ProbableTrain.
 # Used to find nearby points and check separation distance, by dividing domain into grid
 # of cells containing points.
 #
+# The samples themselves are kept in the cells of size dsep ('grid', returned by
+# 'get_nearby_points'). Their coordinates are additionally stored in GridLevels for
+# vectorized separation tests: a level with cell size dsep and, if 'fine_cell_size' is
+# smaller than dsep, a fine level. Each separation test uses the finest level that covers
+# its distance with a 3x3 block of cells, e.g. the fine level with cell size dtest for the
+# checks during integration and the dsep level for seed checks.
+#
+# An optional DistanceRaster (see 'add_distance_raster') answers most separation tests up to
+# its distance with a single lookup, only undecided points are checked against the samples.
+# An optional FreeSpace (see 'add_free_space') tracks where seed points can still be placed.
+#
+# SparseGridStorage allocates its cells lazily for very large domains, KDTreeStorage (see
+# spatial_index.py) offers the same interface backed by KD-trees.
+#
 # - Note: would like to replace this with a proper spatial index that could then be used
 #   for improved intersection detection as well (Quadtree, [Hilbert] R-Tree, PH-Tree).
-class GridStorage:
-    def __init__(self, world_dimensions: Vector, origin: Vector, dsep):
+class GridStorage(SampleStorage):
+    def __init__(self, world_dimensions: Vector, origin: Vector, dsep, fine_cell_size=None):
         # Grid assumes origin point (0.0, 0.0).
         # dsep represents separation distance between samples.
-        self.world_dimensions: Vector = world_dimensions
-        self.origin: Vector = origin
-        self.dsep = dsep
-        self.dsep_sq = self.dsep ** 2
+        super().__init__(world_dimensions, origin, dsep)
         self.grid_dimensions = Vector((world_dimensions.x / dsep, world_dimensions.y / dsep))
+        self.coarse = self.create_level(dsep)
+        self.nx = self.coarse.nx
+        self.ny = self.coarse.ny
+        self.create_cells()
+        self.size = 0
+
+        self.fine = None
+        if fine_cell_size is not None and fine_cell_size < dsep:
+            self.fine = self.create_level(fine_cell_size)
+        self.levels = [self.coarse] if self.fine is None else [self.fine, self.coarse]
+
+    def __len__(self):
+        return self.size
+
+    def create_level(self, cell_size) -> GridLevel:
+        return GridLevel(self.world_dimensions, self.origin, cell_size)
+
+    def create_cells(self):
         self.grid = []
-        for x in range(0, math.ceil(self.grid_dimensions.x)):
+        for x in range(0, self.nx):
             self.grid.append([])
-            for y in range(0, math.ceil(self.grid_dimensions.y)):
+            for y in range(0, self.ny):
                 self.grid[x].append([])
 
-    def add_all(self, grid_storage):
-        for row in grid_storage.grid:
-            for cell in row:
-                for sample in cell:
-                    self.add_sample(sample)
+    # Returns the list of samples of the dsep cell (x, y).
+    def get_cell(self, x, y) -> list:
+        return self.grid[x][y]
 
-    def add_polyline(self, line):
-        for v in line:
-            self.add_sample(v)
+    # Returns the list of samples of the dsep cell (x, y), to append samples to.
+    def get_cell_for_insert(self, x, y) -> list:
+        return self.grid[x][y]
 
-    def add_sample(self, v, coords=None):
+    # Yields the coordinates and the samples of all occupied dsep cells.
+    def get_cells(self):
+        for x, row in enumerate(self.grid):
+            for y, cell in enumerate(row):
+                if cell:
+                    yield x, y, cell
+
+    def get_samples(self):
+        for _, _, cell in self.get_cells():
+            yield from cell
+
+    # Returns all samples and their coordinates as array of shape (N, 2), in the same order.
+    def get_samples_and_coords(self) -> tuple[list, np.ndarray]:
+        samples = []
+        blocks = []
+        for x, y, cell in self.get_cells():
+            samples.extend(cell)
+            blocks.append(self.coarse.get_cell_points(x * self.ny + y))
+        return samples, np.concatenate(blocks) if blocks else np.empty((0, 2))
+
+    # Bins all samples at once.
+    def store_points(self, samples, points: np.ndarray):
+        self.size += len(samples)
+        for cell, indices in self.coarse.add_points(points):
+            self.get_cell_for_insert(*divmod(cell, self.ny)).extend(samples[i] for i in indices.tolist())
+        if self.fine is not None:
+            self.fine.add_points(points)
+
+    def store_sample(self, v, coords=None):
         if coords is None:
-            coords = self.get_sample_coords(v)
-        self.grid[int(coords.x)][int(coords.y)].append(v)
+            x, y = self.cell_coords(v.x, v.y)
+        else:
+            x, y = int(coords.x), int(coords.y)
+        self.get_cell_for_insert(x, y).append(v)
+        self.size += 1
+        self.coarse.add(v.x, v.y, x, y)
+        if self.fine is not None:
+            self.fine.add(v.x, v.y, *self.fine.cell_coords(v.x, v.y))
 
     def is_valid_sample(self, v, d_sq=None) -> bool:
         if d_sq is None:
             d_sq = self.dsep_sq
-        coords = self.get_sample_coords(v)
-
-        for x in range(-1, 2):
-            for y in range(-1, 2):
-                cell = Vector((coords.x + x, coords.y + y))
-                if not self.vector_out_of_bounds(cell, self.grid_dimensions):
-                    if not self.vector_far_from_vectors(v, self.grid[int(cell.x)][int(cell.y)], d_sq):
-                        return False
-        return True
+        if self.distance_raster is not None and self.distance_raster.is_far(v.x, v.y, d_sq):
+            return True
+        level, radius = self.get_level(d_sq)
+        points = level.get_nearby_coords(v.x, v.y, radius)
+        if points is None:
+            return True
+
+        dx = points[:, 0] - v.x
+        dy = points[:, 1] - v.y
+        distance_sq = dx * dx + dy * dy
+        # Samples equal to v are ignored.
+        return not ((distance_sq < d_sq) & (distance_sq > 0)).any()
+
+    # Returns the finest level whose cells are not smaller than the distance (sqrt of d_sq),
+    # so a 3x3 block of cells is scanned, and the search radius in cells on that level.
+    # Falls back to the dsep level with a larger radius for distances above dsep.
+    def get_level(self, d_sq) -> tuple[GridLevel, int]:
+        distance = math.sqrt(d_sq)
+        for level in self.levels:
+            if level.cell_size >= distance:
+                return level, 1
+        return self.coarse, self.coarse.get_radius(distance)
 
-    # called every integration step
     def vector_far_from_vectors(self, v, vectors, d_sq) -> bool:
         for sample in vectors:
             if sample != v:
@@ -62,16 +421,111 @@ class GridStorage:
 
     def get_nearby_points(self, v, distance):
         radius = math.ceil((distance / self.dsep) - 0.5)
-        coords = self.get_sample_coords(v)
+        cell_x, cell_y = self.cell_coords(v.x, v.y)
         out = []
-        for x in range(-1 * radius, 1 * radius + 1):
-            for y in range(-1 * radius, 1 * radius + 1):
-                cell = Vector((coords.x + x, coords.y + y))
-                if not self.vector_out_of_bounds(cell, self.grid_dimensions):
-                    for v2 in self.grid[int(cell.x)][int(cell.y)]:
-                        out.append(v2)
+        for x in range(max(cell_x - radius, 0), min(cell_x + radius + 1, self.nx)):
+            for y in range(max(cell_y - radius, 0), min(cell_y + radius + 1, self.ny)):
+                out.extend(self.get_cell(x, y))
         return out
 
+    # Returns the coordinates of the samples of 'get_nearby_points', in the same order, as
+    # array of shape (N, 2).
+    def get_nearby_points_coords(self, x, y, distance) -> np.ndarray:
+        points = self.coarse.get_nearby_coords(x, y, math.ceil((distance / self.dsep) - 0.5))
+        return np.empty((0, 2)) if points is None else points
+
+    # Returns all samples within the distance of v.
+    def get_points_in_radius(self, v, distance):
+        return self.get_points_in_cells(v, distance, self.coarse.get_radius(distance))[0]
+
+    # Returns the k samples closest to v, ordered by distance.
+    # Rings of cells around the cell of v are scanned outwards, each cell once, until the k-th
+    # closest sample is within the distance covered by the scanned block, or all samples have
+    # been seen.
+    def get_nearest_points(self, v, k):
+        if k <= 0:
+            return []
+        cell_x, cell_y = self.cell_coords(v.x, v.y)
+        samples = []
+        distances = []
+        radius = 0
+        while True:
+            for x, y in self.get_ring_cells(cell_x, cell_y, radius):
+                self.add_cell_points(v, x, y, math.inf, samples, distances)
+            covered = self.get_covered_distance(v, cell_x, cell_y, radius)
+            found = np.concatenate(distances) if distances else np.empty(0)
+            if len(samples) >= self.size or covered == math.inf or (
+                    len(samples) >= k and np.partition(found, k - 1)[k - 1] <= covered ** 2):
+                order = np.argsort(found, kind='stable')[:k]
+                return [samples[i] for i in order]
+            radius += 1
+
+    # Yields the cells at exactly 'radius' cells (Chebyshev distance) around the cell
+    # (cell_x, cell_y), clipped to the grid.
+    def get_ring_cells(self, cell_x, cell_y, radius):
+        if radius == 0:
+            yield cell_x, cell_y
+            return
+        low_y = max(cell_y - radius, 0)
+        high_y = min(cell_y + radius, self.ny - 1)
+        for x in (cell_x - radius, cell_x + radius):
+            if 0 <= x < self.nx:
+                for y in range(low_y, high_y + 1):
+                    yield x, y
+        for y in (cell_y - radius, cell_y + radius):
+            if 0 <= y < self.ny:
+                for x in range(max(cell_x - radius + 1, 0), min(cell_x + radius, self.nx)):
+                    yield x, y
+
+    # Returns the distance from v to the border of the block of cells within 'radius' cells
+    # around the cell (cell_x, cell_y). Sides on the border of the grid are open, since points
+    # outside of the domain are assigned to the nearest cell.
+    def get_covered_distance(self, v, cell_x, cell_y, radius):
+        covered = math.inf
+        if cell_x - radius > 0:
+            covered = min(covered, v.x - (self.origin.x + (cell_x - radius) * self.dsep))
+        if cell_x + radius < self.nx - 1:
+            covered = min(covered, self.origin.x + (cell_x + radius + 1) * self.dsep - v.x)
+        if cell_y - radius > 0:
+            covered = min(covered, v.y - (self.origin.y + (cell_y - radius) * self.dsep))
+        if cell_y + radius < self.ny - 1:
+            covered = min(covered, self.origin.y + (cell_y + radius + 1) * self.dsep - v.y)
+        return covered
+
+    # Appends the samples of the dsep cell (x, y) within the distance of v to 'samples', and
+    # the array of their squared distances to 'distances'.
+    def add_cell_points(self, v, x, y, distance, samples: list, distances: list):
+        cell = self.get_cell(x, y)
+        if not cell:
+            return
+        points = self.coarse.get_cell_points(x * self.ny + y)
+        distance_sq = (points[:, 0] - v.x) ** 2 + (points[:, 1] - v.y) ** 2
+        inside = np.flatnonzero(distance_sq <= distance ** 2)
+        samples.extend(cell[i] for i in inside)
+        distances.append(distance_sq[inside])
+
+    # Returns the samples within 'radius' cells around v that are within the distance of v,
+    # and their squared distances.
+    def get_points_in_cells(self, v, distance, radius) -> tuple[list, np.ndarray]:
+        cell_x, cell_y = self.cell_coords(v.x, v.y)
+        samples = []
+        distances = []
+        for x in range(max(cell_x - radius, 0), min(cell_x + radius + 1, self.nx)):
+            for y in range(max(cell_y - radius, 0), min(cell_y + radius + 1, self.ny)):
+                self.add_cell_points(v, x, y, distance, samples, distances)
+        return samples, np.concatenate(distances) if distances else np.empty(0)
+
+    # Returns the coordinates of all samples that can be within the distance of (x, y), as
+    # array of shape (N, 2).
+    def get_coords_in_radius(self, x, y, distance) -> np.ndarray:
+        points = self.coarse.get_nearby_coords(x, y, self.coarse.get_radius(distance))
+        return np.empty((0, 2)) if points is None else points
+
+    # Coordinates of the samples in the dsep cells within 'radius' cells around (x, y),
+    # see 'GridLevel.get_nearby_coords'.
+    def get_nearby_coords(self, x, y, radius):
+        return self.coarse.get_nearby_coords(x, y, radius)
+
     def world_to_grid(self, v) -> Vector:
         return v - self.origin
 
@@ -81,9 +535,82 @@ class GridStorage:
     def vector_out_of_bounds(self, grid_v: Vector, bounds: Vector):
         return grid_v.x < 0 or grid_v.y < 0 or grid_v.x >= bounds.x or grid_v.y >= bounds.y
 
-    # called every integration step
     def get_sample_coords(self, world_v: Vector) -> Vector:
-        v = self.world_to_grid(world_v)
-        if self.vector_out_of_bounds(v, self.world_dimensions):
-            return Vector((0.0, 0.0))
-        return Vector((math.floor(v.x / self.dsep), math.floor(v.y / self.dsep)))
+        return Vector(self.cell_coords(world_v.x, world_v.y))
+
+    # Returns the dsep cell of the world coordinates (x, y), clamped to the grid.
+    def cell_coords(self, x, y) -> tuple[int, int]:
+        return self.coarse.cell_coords(x, y)
+
+
+# GridStorage allocating its cells lazily in chunks (see SparseGridLevel), for domains too
+# large for a dense grid of dsep cells. The sample lists of the dsep cells are kept in chunks
+# alongside the coordinates of the coarse level.
+# The dense DistanceRaster and FreeSpace can not be added, see 'SampleStorage.SPARSE'.
+class SparseGridStorage(GridStorage):
+    SPARSE = True
+    EMPTY_CELL = ()
+
+    def create_level(self, cell_size) -> SparseGridLevel:
+        return SparseGridLevel(self.world_dimensions, self.origin, cell_size)
+
+    def create_cells(self):
+        # Chunk coordinates -> sample lists, indexed by 'SparseGridLevel.chunk_index'.
+        self.chunks: dict[tuple[int, int], list[list]] = {}
+
+    def get_cell(self, x, y):
+        chunk = self.chunks.get((x >> SparseGridLevel.CHUNK_BITS, y >> SparseGridLevel.CHUNK_BITS))
+        if chunk is None:
+            return self.EMPTY_CELL
+        return chunk[SparseGridLevel.chunk_index(x, y)]
+
+    def get_cell_for_insert(self, x, y) -> list:
+        key = (x >> SparseGridLevel.CHUNK_BITS, y >> SparseGridLevel.CHUNK_BITS)
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            self.chunks[key] = chunk = [[] for _ in range(SparseGridLevel.CHUNK_SIZE ** 2)]
+        return chunk[SparseGridLevel.chunk_index(x, y)]
+
+    # Returns the k samples closest to v, ordered by distance.
+    # Only the occupied chunks are visited, in the order of their distance to v, until no chunk
+    # can hold a sample closer than the k-th closest sample found so far.
+    def get_nearest_points(self, v, k):
+        if k <= 0 or not self.chunks:
+            return []
+        size = SparseGridLevel.CHUNK_SIZE
+        keys = list(self.chunks)
+        chunk_coords = np.array(keys).reshape(-1, 2)
+        chunk_size = size * self.dsep
+        low = self.origin.x + chunk_coords[:, 0] * chunk_size, self.origin.y + chunk_coords[:, 1] * chunk_size
+        high = low[0] + chunk_size, low[1] + chunk_size
+        dx = np.maximum(np.maximum(low[0] - v.x, v.x - high[0]), 0)
+        dy = np.maximum(np.maximum(low[1] - v.y, v.y - high[1]), 0)
+        # Chunks on the border of the grid also hold the samples outside of the domain.
+        dx[(chunk_coords[:, 0] == 0) & (v.x < low[0])] = 0
+        dx[((chunk_coords[:, 0] + 1) * size >= self.nx) & (v.x > high[0])] = 0
+        dy[(chunk_coords[:, 1] == 0) & (v.y < low[1])] = 0
+        dy[((chunk_coords[:, 1] + 1) * size >= self.ny) & (v.y > high[1])] = 0
+        chunk_distances = dx * dx + dy * dy
+
+        samples = []
+        distances = []
+        for i in np.argsort(chunk_distances, kind='stable').tolist():
+            if len(samples) >= k and (
+                    np.partition(np.concatenate(distances), k - 1)[k - 1] < chunk_distances[i]):
+                break
+            chunk_x, chunk_y = keys[i]
+            for j, cell in enumerate(self.chunks[keys[i]]):
+                if cell:
+                    self.add_cell_points(
+                        v, chunk_x * size + j // size, chunk_y * size + j % size, math.inf, samples, distances)
+        found = np.concatenate(distances) if distances else np.empty(0)
+        order = np.argsort(found, kind='stable')[:k]
+        return [samples[i] for i in order]
+
+    # Yields the occupied cells chunk by chunk.
+    def get_cells(self):
+        size = SparseGridLevel.CHUNK_SIZE
+        for (chunk_x, chunk_y), chunk in self.chunks.items():
+            for i, cell in enumerate(chunk):
+                if cell:
+                    yield chunk_x * size + i // size, chunk_y * size + i % size, cell
@@ -1,37 +1,127 @@
+import math
+import numpy as np
+from collections import OrderedDict
 from ProceduralCityGenerator.tensor_field import TensorField
 from mathutils import Vector
 from ProceduralCityGenerator.streamline_parameters import StreamlineParameters
 
 
+# Bounded LRU memo of field samples, mapping quantized point coordinates to the major and
+# minor eigenvectors at that point.
+# Points closer than 'resolution' can share an entry, so the resolution should be well
+# below the integration step size. Entries are sampled at the quantized point, not at the
+# point of the first query, so samples don't depend on the order of queries or on which
+# entries were evicted. Entries are discarded when the field changes.
+class SampleCache:
+    def __init__(self, max_size, resolution):
+        self.max_size = max_size
+        self.resolution = resolution
+        self.entries: OrderedDict[tuple[int, int], tuple[Vector, Vector]] = OrderedDict()
+        self.field_version = None
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, point: Vector) -> tuple[int, int]:
+        return round(point.x / self.resolution), round(point.y / self.resolution)
+
+    def point(self, key) -> Vector:
+        return Vector((key[0] * self.resolution, key[1] * self.resolution))
+
+    def get(self, key, field_version):
+        if field_version != self.field_version:
+            self.entries.clear()
+            self.field_version = field_version
+        vectors = self.entries.get(key)
+        if vectors is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return vectors
+
+    def put(self, key, vectors: tuple[Vector, Vector]):
+        self.entries[key] = vectors
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+
 # Integrators are used for iterative approximate discretization/integration of stream-
 # lines.
+# 'integrate_many' integrates an array of N points of shape (N, 2) at once, using batch
+# sampling of the tensor field, and returns the steps as array of the same shape.
+#
+# With a 'cache_size' above 0, single point samples are memoized in a SampleCache with the
+# given size and resolution.
 class FieldIntegrator:
-    def __init__(self, field: TensorField):
+    # Steps of integrators with adaptive step size are longer than dstep.
+    ADAPTIVE_STEP = False
+
+    def __init__(self, field: TensorField, cache_size=0, cache_resolution=1e-3):
         self.field = field
+        self.cache = SampleCache(cache_size, cache_resolution) if cache_size > 0 else None
 
     def integrate(self, point: Vector, major: bool):
         pass
 
+    # Integrates a step like 'integrate', carrying the step size of integrators that adapt it
+    # along a streamline. 'step_size' is the value returned for the previous step of the same
+    # front (None for its first step), the step size for its next step is returned with the
+    # step. Fixed step integrators pass it through.
+    def integrate_step(self, point: Vector, major: bool, step_size=None) -> tuple[Vector, float | None]:
+        return self.integrate(point, major), step_size
+
+    def integrate_many(self, points: np.ndarray, major: bool) -> np.ndarray:
+        return np.array([self.integrate(Vector(p), major).to_tuple() for p in points]).reshape(-1, 2)
+
     def sample_field_vector(self, point: Vector, major: bool) -> Vector:
-        tensor = self.field.sample_point(point)
+        if self.cache is not None:
+            return self.sample_eigenvectors(point)[0 if major else 1]
         if major:
-            return tensor.get_major()
-        return tensor.get_minor()
+            return self.field.sample_major(point)
+        return self.field.sample_minor(point)
+
+    # Returns the major and minor eigenvector at the given point from a single field evaluation.
+    def sample_eigenvectors(self, point: Vector) -> tuple[Vector, Vector]:
+        if self.cache is None:
+            return self.field.sample_eigenvectors(point)
+
+        key = self.cache.key(point)
+        vectors = self.cache.get(key, self.field.version)
+        if vectors is None:
+            vectors = self.field.sample_eigenvectors(self.cache.point(key))
+            for v in vectors:
+                v.freeze()
+            self.cache.put(key, vectors)
+        return vectors
+
+    def sample_field_vectors(self, points: np.ndarray, major: bool) -> np.ndarray:
+        tensors = self.field.sample_points(points)
+        if major:
+            return tensors.get_major()
+        return tensors.get_minor()
 
 
 class EulerIntegrator(FieldIntegrator):
-    def __init__(self, field: TensorField, parameters: StreamlineParameters):
-        super().__init__(field)
+    def __init__(self, field: TensorField, parameters: StreamlineParameters, cache_size=0, cache_resolution=1e-3):
+        super().__init__(field, cache_size, cache_resolution)
         self.parameters = parameters
 
     def integrate(self, point: Vector, major: bool) -> Vector:
         return self.sample_field_vector(point, major).xy * self.parameters.dstep
 
+    def integrate_many(self, points: np.ndarray, major: bool) -> np.ndarray:
+        return self.sample_field_vectors(points, major) * self.parameters.dstep
+
 
 # The classic Runge-Kutta method, RK4.
 class RK4Integrator(FieldIntegrator):
-    def __init__(self, field: TensorField, parameters: StreamlineParameters):
-        super().__init__(field)
+    def __init__(self, field: TensorField, parameters: StreamlineParameters, cache_size=0, cache_resolution=1e-3):
+        super().__init__(field, cache_size, cache_resolution)
         self.parameters = parameters
 
     def integrate(self, point: Vector, major: bool) -> Vector:
@@ -41,3 +131,115 @@ class RK4Integrator(FieldIntegrator):
         k4 = self.sample_field_vector(
             point + Vector((self.parameters.dstep, self.parameters.dstep)), major)
         return (k1 + (k23 * 4) + k4) * (self.parameters.dstep / 6)
+
+    # All sub-step points of the batch are sampled with a single call to the tensor field.
+    def integrate_many(self, points: np.ndarray, major: bool) -> np.ndarray:
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        n = len(points)
+        dstep = self.parameters.dstep
+        samples = self.sample_field_vectors(np.concatenate((points, points + dstep / 2, points + dstep)), major)
+        k1 = samples[:n]
+        k23 = samples[n:2 * n]
+        k4 = samples[2 * n:]
+        return (k1 + (k23 * 4) + k4) * (dstep / 6)
+
+
+# Embedded Runge-Kutta method of Dormand and Prince, RK5(4), with adaptive step size.
+# Each step is integrated with order 5 and compared against the embedded order 4 solution,
+# the difference estimates the local error (in world units). Steps with an error above
+# 'tolerance' are retried with a smaller step size, and the step size for the next step
+# grows where the field is uniform.
+# The embedded estimate can not see sharp turns of the field between stage samples (e.g.
+# where blended basis fields cancel out), so the error also includes the deviation of the
+# step from a circular arc through the directions at its start and end (sagitta).
+# The tolerance defaults to the simplify tolerance, below which deviations are removed from
+# the simplified streamlines anyway.
+#
+# Step sizes are bounded by dstep and 'max_step', which defaults to dtest, so consecutive
+# streamline points are never further than dtest apart.
+# The step size is state of a single integration front, not of the integrator: it is passed
+# in and out of 'integrate_step', and 'integrate' always starts from dstep.
+# Samples at the end of a step are reused as first sample of the next step through the
+# sample cache (first same as last).
+class DormandPrinceIntegrator(FieldIntegrator):
+    A = [
+        [1 / 5],
+        [3 / 40, 9 / 40],
+        [44 / 45, -56 / 15, 32 / 9],
+        [19372 / 6561, -25360 / 2187, 64448 / 6561, -212 / 729],
+        [9017 / 3168, -355 / 33, 46732 / 5247, 49 / 176, -5103 / 18656],
+        [35 / 384, 0, 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84],
+    ]
+    # Weights of the order 5 solution, equal to the last row of A.
+    B = [35 / 384, 0, 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84, 0]
+    # Difference between the weights of the order 5 and order 4 solutions.
+    E = [71 / 57600, 0, -71 / 16695, 71 / 1920, -17253 / 339200, 22 / 525, -1 / 40]
+    ADAPTIVE_STEP = True
+
+    def __init__(
+            self,
+            field: TensorField,
+            parameters: StreamlineParameters,
+            tolerance=None,
+            max_step=None,
+            cache_size=16,
+            cache_resolution=1e-3):
+        super().__init__(field, cache_size, cache_resolution)
+        self.parameters = parameters
+        self.tolerance = parameters.simplify_tolerance if tolerance is None else tolerance
+        self.min_step = parameters.dstep
+        self.max_step = parameters.dtest if max_step is None else max_step
+
+    def integrate(self, point: Vector, major: bool) -> Vector:
+        return self.integrate_step(point, major)[0]
+
+    def integrate_step(self, point: Vector, major: bool, step_size=None) -> tuple[Vector, float]:
+        k1 = self.sample_field_vector(point, major)
+        if k1.length_squared == 0:
+            return Vector((0.0, 0.0)), self.min_step
+
+        h = self.min_step if step_size is None else min(max(step_size, self.min_step), self.max_step)
+        while True:
+            step, error = self.dormand_prince_step(point, k1, h, major)
+            if error <= self.tolerance or h <= self.min_step:
+                break
+            h = max(self.min_step, h * max(0.2, 0.9 * (self.tolerance / error) ** 0.2))
+
+        growth = 5.0 if error == 0 else min(5.0, 0.9 * (self.tolerance / error) ** 0.2)
+        return step, min(max(h * growth, self.min_step), self.max_step)
+
+    # Returns the order 5 step of size h and its error estimate.
+    # The last stage is sampled at the end of the step.
+    # Stage samples are flipped to point in the direction of k1, since eigenvectors are
+    # only defined up to sign.
+    def dormand_prince_step(self, point: Vector, k1: Vector, h, major: bool) -> tuple[Vector, float]:
+        kx = [k1.x]
+        ky = [k1.y]
+        for row in self.A:
+            k = self.sample_field_vector(Vector((
+                point.x + h * sum(a * x for a, x in zip(row, kx)),
+                point.y + h * sum(a * y for a, y in zip(row, ky)))), major)
+            if k.x * k1.x + k.y * k1.y < 0:
+                kx.append(-k.x)
+                ky.append(-k.y)
+            else:
+                kx.append(k.x)
+                ky.append(k.y)
+
+        error_x = h * sum(e * x for e, x in zip(self.E, kx))
+        error_y = h * sum(e * y for e, y in zip(self.E, ky))
+        turn = math.atan2(abs(k1.x * ky[-1] - k1.y * kx[-1]), k1.x * kx[-1] + k1.y * ky[-1])
+        step = Vector((h * sum(b * x for b, x in zip(self.B, kx)), h * sum(b * y for b, y in zip(self.B, ky))))
+        return step, max(math.hypot(error_x, error_y), h * turn / 8)
+
+    # Integrates all points with a single step of size dstep, without step size control.
+    def integrate_many(self, points: np.ndarray, major: bool) -> np.ndarray:
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        h = self.min_step
+        k1 = self.sample_field_vectors(points, major)
+        ks = [k1]
+        for row in self.A[:-1]:
+            k = self.sample_field_vectors(points + h * sum(a * k for a, k in zip(row, ks)), major)
+            k[(k * k1).sum(axis=1) < 0] *= -1
+            ks.append(k)
+        return h * sum(b * k for b, k in zip(self.B, ks))
@@ -0,0 +1,114 @@
+import math
+import numpy as np
+from array import array
+
+
+# Tileable 2D gradient noise, precomputed once into a texture and sampled by bilinear
+# lookup instead of evaluating the noise function per sample.
+# The noise lattice has 'period' x 'period' cells with random gradients, wrapping around at
+# its borders, and is rendered with 'texels_per_cell' texels per cell. Coordinates are given
+# in lattice cells, the texture repeats every 'period' cells. Values are in [-1, 1].
+#
+# Values are stored in a flat 'array.array' buffer like the BakedTensorField, viewed as NumPy
+# array for batch lookups.
+class NoiseTexture:
+    def __init__(self, period=16, texels_per_cell=8, seed=0):
+        self.period = period
+        self.texels_per_cell = texels_per_cell
+        self.n = period * texels_per_cell
+
+        rng = np.random.default_rng(seed)
+        angles = rng.random((period, period)) * 2 * math.pi
+        gradients = np.stack((np.cos(angles), np.sin(angles)), axis=2)
+
+        coordinates = np.arange(self.n) / texels_per_cell
+        u, v = np.meshgrid(coordinates, coordinates, indexing='ij')
+        i0 = u.astype(np.intp)
+        j0 = v.astype(np.intp)
+        fu = u - i0
+        fv = v - j0
+        i1 = (i0 + 1) % period
+        j1 = (j0 + 1) % period
+
+        def corner(i, j, du, dv):
+            g = gradients[i, j]
+            return g[..., 0] * du + g[..., 1] * dv
+
+        # Quintic fade curve of improved Perlin noise.
+        su = fu ** 3 * (fu * (fu * 6 - 15) + 10)
+        sv = fv ** 3 * (fv * (fv * 6 - 15) + 10)
+        n0 = corner(i0, j0, fu, fv) * (1 - su) + corner(i1, j0, fu - 1, fv) * su
+        n1 = corner(i0, j1, fu, fv - 1) * (1 - su) + corner(i1, j1, fu - 1, fv - 1) * su
+        values = np.clip((n0 * (1 - sv) + n1 * sv) * math.sqrt(2), -1.0, 1.0)
+
+        # Flat index of texel (i, j) is i * n + j.
+        self.values = array('d', values.ravel().tobytes())
+
+    def sample(self, u, v) -> float:
+        n = self.n
+        fu = u * self.texels_per_cell
+        fv = v * self.texels_per_cell
+        iu = math.floor(fu)
+        iv = math.floor(fv)
+        tu = fu - iu
+        tv = fv - iv
+        iu %= n
+        iv %= n
+        iu1 = (iu + 1) % n
+        iv1 = (iv + 1) % n
+        values = self.values
+        return (
+            (values[iu * n + iv] * (1 - tv) + values[iu * n + iv1] * tv) * (1 - tu)
+            + (values[iu1 * n + iv] * (1 - tv) + values[iu1 * n + iv1] * tv) * tu
+        )
+
+    def sample_points(self, u: np.ndarray, v: np.ndarray) -> np.ndarray:
+        n = self.n
+        fu = u * self.texels_per_cell
+        fv = v * self.texels_per_cell
+        iu = np.floor(fu)
+        iv = np.floor(fv)
+        tu = fu - iu
+        tv = fv - iv
+        iu = iu.astype(np.intp) % n
+        iv = iv.astype(np.intp) % n
+        iu1 = (iu + 1) % n
+        iv1 = (iv + 1) % n
+        values = np.frombuffer(self.values, dtype=float)
+        return (
+            (values[iu * n + iv] * (1 - tv) + values[iu * n + iv1] * tv) * (1 - tu)
+            + (values[iu1 * n + iv] * (1 - tv) + values[iu1 * n + iv1] * tv) * tu
+        )
+
+
+# Rotational noise applied to the summed tensor field, rotating tensors by the noise value
+# times 'angle' (radians), i.e. by up to 'angle' in either direction.
+# 'size' is the size of a noise lattice cell in world units.
+# Layers with a 'center' and 'radius' only apply inside that disc (e.g. parks), layers
+# without a center apply everywhere (global noise).
+class NoiseLayer:
+    def __init__(self, texture: NoiseTexture, size, angle, center=None, radius=math.inf):
+        self.texture = texture
+        self.size = size
+        self.angle = angle
+        self.center = center.copy() if center is not None else None
+        self.radius = radius
+
+    def contains(self, x, y) -> bool:
+        if self.center is None:
+            return True
+        return (x - self.center.x) ** 2 + (y - self.center.y) ** 2 < self.radius ** 2
+
+    # Returns the rotation angle at (x, y), 0 outside of the layer.
+    def get_angle(self, x, y) -> float:
+        if not self.contains(x, y):
+            return 0.0
+        return self.texture.sample(x / self.size, y / self.size) * self.angle
+
+    # Batch version of 'get_angle' for an array of N points of shape (N, 2).
+    def get_angles(self, points: np.ndarray) -> np.ndarray:
+        angles = self.texture.sample_points(points[:, 0] / self.size, points[:, 1] / self.size) * self.angle
+        if self.center is not None:
+            outside = (points[:, 0] - self.center.x) ** 2 + (points[:, 1] - self.center.y) ** 2 >= self.radius ** 2
+            angles[outside] = 0.0
+        return angles
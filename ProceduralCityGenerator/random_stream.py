@@ -0,0 +1,26 @@
+import numpy as np
+
+
+# Stream of uniform random numbers in [0, 1), drawn from a NumPy Generator in batches of
+# 'buffer_size' numbers instead of one at a time.
+# Streams created from the same seed produce the same numbers, regardless of the buffer
+# size. 'spawn' creates independent streams from a single seed.
+class RandomStream:
+    def __init__(self, seed=None, buffer_size=1024):
+        self.rng = np.random.default_rng(seed)
+        self.buffer_size = buffer_size
+        self.buffer: list[float] = []
+        self.index = 0
+
+    @classmethod
+    def spawn(cls, seed, n, buffer_size=1024) -> list['RandomStream']:
+        return [cls(s, buffer_size) for s in np.random.SeedSequence(seed).spawn(n)]
+
+    def random(self) -> float:
+        if self.index == len(self.buffer):
+            # Python floats are cheaper to index and to compute with than NumPy scalars.
+            self.buffer = self.rng.random(self.buffer_size).tolist()
+            self.index = 0
+        value = self.buffer[self.index]
+        self.index += 1
+        return value
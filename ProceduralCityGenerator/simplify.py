@@ -1,3 +1,4 @@
+import numpy as np
 from mathutils import Vector
 from collections import deque
 
@@ -57,3 +58,39 @@ def simplify(points: deque[Vector], tolerance=1.0) -> deque[Vector]:
     sq_tolerance = tolerance * tolerance
 
     return simplify_douglas_peucker(points, sq_tolerance)
+
+
+# Douglas-Peucker simplification of an array of points of shape (N, 2), e.g. a streamline of a
+# StreamlineStore. Keeps the same points as 'simplify', the distances of all points of a
+# segment are computed at once. Returns the kept points as a new array.
+def simplify_array(points: np.ndarray, tolerance=1.0) -> np.ndarray:
+    if len(points) <= 2:
+        return points.copy()
+    sq_tolerance = tolerance * tolerance
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        x, y = points[first]
+        dx = points[last, 0] - x
+        dy = points[last, 1] - y
+        inner = points[first + 1:last]
+        if dx != 0 or dy != 0:
+            # Closest points on the segment, see 'get_square_segment_distance'.
+            t = ((inner[:, 0] - x) * dx + (inner[:, 1] - y) * dy) / (dx * dx + dy * dy)
+            closest_x = np.where(t > 1, points[last, 0], np.where(t > 0, x + dx * t, x))
+            closest_y = np.where(t > 1, points[last, 1], np.where(t > 0, y + dy * t, y))
+        else:
+            closest_x = x
+            closest_y = y
+        sq_dist = (inner[:, 0] - closest_x) ** 2 + (inner[:, 1] - closest_y) ** 2
+        index = int(np.argmax(sq_dist))
+        if sq_dist[index] > sq_tolerance:
+            index += first + 1
+            keep[index] = True
+            stack.append((index, last))
+            stack.append((first, index))
+    return points[keep]
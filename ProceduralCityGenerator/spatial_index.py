@@ -0,0 +1,233 @@
+import heapq
+import numpy as np
+from mathutils import Vector
+from ProceduralCityGenerator.grid_storage import SampleStorage
+
+
+# Static 2D KD-tree, bulk loaded from an array of points of shape (N, 2) and their ids.
+# Nodes are split at the median of the wider side of their bounding box, until at most
+# LEAF_SIZE points remain. The points of each node are the contiguous range [start, end)
+# of the reordered 'points' and 'ids', so leaves are checked with vectorized distance tests.
+# Nodes are stored in flat lists, children are -1 for leaves.
+class KDTree:
+    LEAF_SIZE = 32
+
+    def __init__(self, points: np.ndarray, ids: np.ndarray):
+        self.points = np.array(points, dtype=float).reshape(-1, 2)
+        self.ids = np.array(ids, dtype=np.intp)
+        self.start: list[int] = []
+        self.end: list[int] = []
+        self.left: list[int] = []
+        self.right: list[int] = []
+        # Bounding boxes as (min_x, min_y, max_x, max_y).
+        self.boxes: list[tuple[float, float, float, float]] = []
+        if len(self.points) > 0:
+            self.build(0, len(self.points))
+
+    def __len__(self):
+        return len(self.points)
+
+    def build(self, start, end) -> int:
+        node = len(self.start)
+        points = self.points[start:end]
+        min_x, min_y = points.min(axis=0)
+        max_x, max_y = points.max(axis=0)
+        self.start.append(start)
+        self.end.append(end)
+        self.left.append(-1)
+        self.right.append(-1)
+        self.boxes.append((float(min_x), float(min_y), float(max_x), float(max_y)))
+
+        if end - start > self.LEAF_SIZE:
+            axis = 0 if max_x - min_x >= max_y - min_y else 1
+            mid = (end - start) // 2
+            order = np.argpartition(points[:, axis], mid)
+            self.points[start:end] = points[order]
+            self.ids[start:end] = self.ids[start:end][order]
+            left = self.build(start, start + mid)
+            right = self.build(start + mid, end)
+            self.left[node] = left
+            self.right[node] = right
+        return node
+
+    # Squared distance from (x, y) to the bounding box of the node.
+    def box_distance_sq(self, node, x, y):
+        min_x, min_y, max_x, max_y = self.boxes[node]
+        dx = min_x - x if x < min_x else (x - max_x if x > max_x else 0.0)
+        dy = min_y - y if y < min_y else (y - max_y if y > max_y else 0.0)
+        return dx * dx + dy * dy
+
+    # Returns the point ranges [start, end) of all leaves within squared distance d_sq of
+    # (x, y).
+    def get_leaf_ranges(self, x, y, d_sq) -> list[tuple[int, int]]:
+        ranges = []
+        if not self.start:
+            return ranges
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            if self.box_distance_sq(node, x, y) > d_sq:
+                continue
+            if self.left[node] < 0:
+                ranges.append((self.start[node], self.end[node]))
+            else:
+                stack.append(self.right[node])
+                stack.append(self.left[node])
+        return ranges
+
+
+# Spatial index storing samples in KD-trees, a SampleStorage with the public interface of
+# GridStorage, so both can be used by the StreamlineGenerator.
+# Inserts are collected in a buffer of BUFFER_SIZE points, which is checked by brute force
+# and bulk loaded into a KD-tree once full. Trees of similar size are merged into a single
+# tree (logarithmic method), so there are O(log n) trees and each point is rebuilt O(log n)
+# times.
+#
+# In contrast to GridStorage, 'get_nearby_points' returns exactly the samples within the
+# distance, instead of the samples of the surrounding cells.
+class KDTreeStorage(SampleStorage):
+    BUFFER_SIZE = 256
+
+    # 'fine_cell_size' is accepted for compatibility with GridStorage and ignored.
+    def __init__(self, world_dimensions: Vector, origin: Vector, dsep, fine_cell_size=None):
+        super().__init__(world_dimensions, origin, dsep)
+        self.samples = []
+        self.buffer = np.empty((self.BUFFER_SIZE, 2))
+        self.buffer_count = 0
+        self.trees: list[KDTree] = []
+
+    def __len__(self):
+        return len(self.samples)
+
+    def get_samples(self):
+        return iter(self.samples)
+
+    # See 'GridStorage.get_samples_and_coords'.
+    def get_samples_and_coords(self) -> tuple[list, np.ndarray]:
+        points = np.empty((len(self.samples), 2))
+        for tree in self.trees:
+            points[tree.ids] = tree.points
+        points[len(self.samples) - self.buffer_count:] = self.buffer[:self.buffer_count]
+        return list(self.samples), points
+
+    # Fills the buffer in chunks.
+    def store_points(self, samples, points: np.ndarray):
+        start = 0
+        while start < len(points):
+            end = min(start + self.BUFFER_SIZE - self.buffer_count, len(points))
+            # Buffered samples are always the last samples, see 'flush'.
+            self.samples.extend(samples[start:end])
+            self.buffer[self.buffer_count:self.buffer_count + end - start] = points[start:end]
+            self.buffer_count += end - start
+            start = end
+            if self.buffer_count == self.BUFFER_SIZE:
+                self.flush()
+
+    def store_sample(self, v, coords=None):
+        self.buffer[self.buffer_count] = (v.x, v.y)
+        self.samples.append(v)
+        self.buffer_count += 1
+        if self.buffer_count == self.BUFFER_SIZE:
+            self.flush()
+
+    # Bulk loads the buffered points into a new tree, merged with all trees that are not
+    # larger than it.
+    def flush(self):
+        if self.buffer_count == 0:
+            return
+        points = self.buffer[:self.buffer_count].copy()
+        ids = np.arange(len(self.samples) - self.buffer_count, len(self.samples))
+        while self.trees and len(self.trees[-1]) <= len(points):
+            tree = self.trees.pop()
+            points = np.concatenate((tree.points, points))
+            ids = np.concatenate((tree.ids, ids))
+        self.trees.append(KDTree(points, ids))
+        self.buffer_count = 0
+
+    # Returns coordinates and ids of all points which can be within squared distance d_sq
+    # of (x, y), as arrays of shape (N, 2) and (N,).
+    def get_candidates(self, x, y, d_sq) -> tuple[np.ndarray, np.ndarray]:
+        points = [self.buffer[:self.buffer_count]]
+        ids = [np.arange(len(self.samples) - self.buffer_count, len(self.samples))]
+        for tree in self.trees:
+            for start, end in tree.get_leaf_ranges(x, y, d_sq):
+                points.append(tree.points[start:end])
+                ids.append(tree.ids[start:end])
+        if len(points) == 1:
+            return points[0], ids[0]
+        return np.concatenate(points), np.concatenate(ids)
+
+    # Returns the coordinates of all samples that can be within the distance of (x, y), as
+    # array of shape (N, 2).
+    def get_coords_in_radius(self, x, y, distance) -> np.ndarray:
+        return self.get_candidates(x, y, distance ** 2)[0]
+
+    def is_valid_sample(self, v, d_sq=None) -> bool:
+        if d_sq is None:
+            d_sq = self.dsep_sq
+        if self.distance_raster is not None and self.distance_raster.is_far(v.x, v.y, d_sq):
+            return True
+        points, _ = self.get_candidates(v.x, v.y, d_sq)
+        dx = points[:, 0] - v.x
+        dy = points[:, 1] - v.y
+        distance_sq = dx * dx + dy * dy
+        # Samples equal to v are ignored.
+        return not ((distance_sq < d_sq) & (distance_sq > 0)).any()
+
+    def get_nearby_points(self, v, distance):
+        return self.get_points_in_radius(v, distance)
+
+    # See 'GridStorage.get_nearby_points_coords'.
+    def get_nearby_points_coords(self, x, y, distance) -> np.ndarray:
+        d_sq = distance ** 2
+        points, _ = self.get_candidates(x, y, d_sq)
+        dx = points[:, 0] - x
+        dy = points[:, 1] - y
+        return points[dx * dx + dy * dy <= d_sq]
+
+    # Returns all samples within the distance of v.
+    def get_points_in_radius(self, v, distance):
+        d_sq = distance ** 2
+        points, ids = self.get_candidates(v.x, v.y, d_sq)
+        dx = points[:, 0] - v.x
+        dy = points[:, 1] - v.y
+        return [self.samples[i] for i in ids[dx * dx + dy * dy <= d_sq]]
+
+    # Returns the k samples closest to v, ordered by distance.
+    # Leaves of all trees are visited in the order of their distance to v, until no leaf
+    # can hold a point closer than the current k-th closest point.
+    def get_nearest_points(self, v, k):
+        if k <= 0:
+            return []
+        x = v.x
+        y = v.y
+        buffer = self.buffer[:self.buffer_count]
+        best_ids = np.arange(len(self.samples) - self.buffer_count, len(self.samples))
+        best_distances = (buffer[:, 0] - x) ** 2 + (buffer[:, 1] - y) ** 2
+
+        def keep_best(distances, ids):
+            if len(distances) > k:
+                keep = np.argpartition(distances, k - 1)[:k]
+                return distances[keep], ids[keep]
+            return distances, ids
+
+        best_distances, best_ids = keep_best(best_distances, best_ids)
+        heap = [(tree.box_distance_sq(0, x, y), i, 0) for i, tree in enumerate(self.trees) if len(tree) > 0]
+        heapq.heapify(heap)
+        while heap:
+            box_distance_sq, i, node = heapq.heappop(heap)
+            if len(best_distances) == k and box_distance_sq > best_distances.max():
+                break
+            tree = self.trees[i]
+            if tree.left[node] < 0:
+                points = tree.points[tree.start[node]:tree.end[node]]
+                distances = (points[:, 0] - x) ** 2 + (points[:, 1] - y) ** 2
+                best_distances, best_ids = keep_best(
+                    np.concatenate((best_distances, distances)),
+                    np.concatenate((best_ids, tree.ids[tree.start[node]:tree.end[node]])))
+            else:
+                for child in (tree.left[node], tree.right[node]):
+                    heapq.heappush(heap, (tree.box_distance_sq(child, x, y), i, child))
+
+        order = np.argsort(best_distances, kind='stable')
+        return [self.samples[i] for i in best_ids[order]]
@@ -0,0 +1,223 @@
+import time
+from collections import deque
+from ProceduralCityGenerator.streamlines import StreamlineGenerator, DanglingEndJoin
+from ProceduralCityGenerator.baked_field import BakedTensorField
+from ProceduralCityGenerator.graph import Graph
+
+
+# Base class of work that runs in steps of at most 'budget_ms' milliseconds, e.g. from a
+# bpy.app.timers callback (see 'timer'), so the UI stays responsive.
+# Subclasses split the work into phases and small units of work ('run_unit'). Each step runs
+# whole units until the budget is used up, so a step can exceed the budget by one unit.
+# 'on_progress' is called after each step and 'on_finished' once, after the last one.
+class Stepper:
+    DONE = 'done'
+
+    # Seconds between two timer calls.
+    TIMER_INTERVAL = 0.01
+
+    def __init__(self, budget_ms=20, on_progress=None, on_finished=None):
+        self.budget_ms = budget_ms
+        self.on_progress = on_progress
+        self.on_finished = on_finished
+        self.phase = self.DONE
+
+    @property
+    def done(self) -> bool:
+        return self.phase == self.DONE
+
+    # Runs units of work until the budget (default 'budget_ms') is used up. Returns True if
+    # there is work left.
+    def step(self, budget_ms=None) -> bool:
+        budget_ms = self.budget_ms if budget_ms is None else budget_ms
+        deadline = time.perf_counter() + budget_ms / 1000
+        while not self.done:
+            self.run_unit()
+            if time.perf_counter() >= deadline:
+                break
+        if self.on_progress is not None:
+            self.on_progress(self)
+        if self.done and self.on_finished is not None:
+            self.on_finished(self)
+        return not self.done
+
+    def run_unit(self):
+        pass
+
+    # Estimated completed fraction of the work, from 0 to 1.
+    @property
+    def progress(self) -> float:
+        return 1.0
+
+    # Callback for bpy.app.timers.register, runs a step and returns the delay until the next
+    # call, or None when done, which unregisters the timer.
+    def timer(self):
+        if self.step():
+            return self.TIMER_INTERVAL
+        return None
+
+
+# Runs 'StreamlineGenerator.create_all_streamlines' in steps, see Stepper. The result
+# equals a single 'create_all_streamlines' call.
+#
+# Generation runs in three phases: tracing streamlines until no seed is left, one streamline
+# per unit of work, joining their dangling ends, JOIN_ENDS ends per unit (see DanglingEndJoin),
+# and simplifying the extended streamlines again, one streamline per unit. The simplified
+# streamlines are replaced in place and reported to the listeners like by
+# 'join_dangling_streamlines'. With 'bake_resolution', the tensor field of the integrator is
+# first baked for the generator domain (see 'TensorField.bake'), BAKE_COLUMNS raster columns
+# per unit.
+#
+# 'progress' estimates the completed fraction of the work. During tracing, it is based on
+# the covered fraction of the FreeSpace of the grids, without free space seeds it stays at 0
+# until tracing is done.
+class StreamlineStepper(Stepper):
+    BAKING = 'baking'
+    TRACING = 'tracing'
+    JOINING = 'joining'
+    SIMPLIFYING = 'simplifying'
+
+    # Share of the phases in 'progress'. Baking only takes a share if it is requested.
+    BAKING_SHARE = 0.1
+    TRACING_SHARE = 0.9
+    JOINING_SHARE = 0.05
+
+    # Raster columns baked per unit of work.
+    BAKE_COLUMNS = 8
+    # Dangling ends joined per unit of work, their best next points are found in one batch.
+    JOIN_ENDS = 64
+
+    def __init__(
+            self,
+            generator: StreamlineGenerator,
+            budget_ms=20,
+            on_progress=None,
+            on_finished=None,
+            bake_resolution=None):
+        super().__init__(budget_ms, on_progress, on_finished)
+        self.generator = generator
+
+        self.phase = self.TRACING
+        self.baked: BakedTensorField | None = None
+        if bake_resolution is not None:
+            self.baked = BakedTensorField(
+                generator.integrator.field,
+                generator.origin,
+                generator.world_dimensions,
+                bake_resolution,
+                deferred=True)
+            self.phase = self.BAKING
+        self.major = True
+        self.join: DanglingEndJoin | None = None
+        # Extended streamlines left to simplify as (index, major), and their number.
+        self.simplify_queue: deque[tuple[int, bool]] = deque([])
+        self.simplify_count = 0
+        self.initial_free_cells = [
+            len(grid.free_space) if grid.free_space is not None else 0
+            for grid in [generator.major_grid, generator.minor_grid]
+        ]
+        generator.streamlines_done = False
+
+    def run_unit(self):
+        generator = self.generator
+        if self.phase == self.BAKING:
+            if self.baked.bake_columns(self.BAKE_COLUMNS):
+                return
+            generator.integrator.field.baked = self.baked
+            self.phase = self.TRACING
+        elif self.phase == self.TRACING:
+            if generator.create_streamline(self.major):
+                self.major = not self.major
+                return
+            generator.streamlines_done = True
+            self.join = DanglingEndJoin(generator, generator.get_dangling_ends())
+            self.phase = self.JOINING
+        elif self.phase == self.JOINING:
+            if self.join.join_ends(self.JOIN_ENDS):
+                return
+            indices = {id(s): i for i, s in enumerate(generator.all_streamlines)}
+            self.simplify_queue = deque((indices[id(s)], major) for s, major in self.join.joined.values())
+            self.simplify_count = len(self.simplify_queue)
+            self.phase = self.SIMPLIFYING
+        elif self.phase == self.SIMPLIFYING:
+            if self.simplify_queue:
+                generator.resimplify_streamline(*self.simplify_queue.popleft())
+                return
+            self.phase = self.DONE
+
+    @property
+    def progress(self) -> float:
+        if self.baked is None:
+            return self.get_streamline_progress()
+        if self.phase == self.BAKING:
+            return self.BAKING_SHARE * self.baked.baked_columns / self.baked.nx
+        return self.BAKING_SHARE + (1 - self.BAKING_SHARE) * self.get_streamline_progress()
+
+    def get_streamline_progress(self) -> float:
+        if self.phase == self.TRACING:
+            return self.TRACING_SHARE * self.get_tracing_progress()
+        if self.phase == self.JOINING:
+            joined = self.join.index / len(self.join.ends) if self.join.ends else 1
+            return self.TRACING_SHARE + self.JOINING_SHARE * joined
+        if self.phase == self.SIMPLIFYING:
+            simplified = 1 - len(self.simplify_queue) / self.simplify_count if self.simplify_count else 1
+            return self.TRACING_SHARE + self.JOINING_SHARE + (1 - self.TRACING_SHARE - self.JOINING_SHARE) * simplified
+        return 1.0
+
+    # Tracing ends once either grid has no free space left, the fuller grid is used.
+    def get_tracing_progress(self) -> float:
+        grids = [self.generator.major_grid, self.generator.minor_grid]
+        return max(
+            (1 - len(grid.free_space) / initial if grid.free_space is not None and initial else 0.0)
+            for grid, initial in zip(grids, self.initial_free_cells)
+        )
+
+
+# Builds the Graph of the streamlines of a generator in steps, see Stepper. The result equals
+# 'Graph(generator, complex)'.
+# The sections and then the nodes are generated one streamline per unit of work, followed
+# by the border connections in a single unit.
+class GraphStepper(Stepper):
+    SECTIONING = 'sectioning'
+    NODES = 'nodes'
+    BORDERS = 'borders'
+
+    # Share of the phases in 'progress', intersection tests take most of the time.
+    SECTIONING_SHARE = 0.9
+    NODES_SHARE = 0.09
+
+    def __init__(self, generator: StreamlineGenerator, budget_ms=20, on_progress=None, on_finished=None, complex=False):
+        super().__init__(budget_ms, on_progress, on_finished)
+        self.graph = Graph(generator, complex, generate=False)
+        self.phase = self.SECTIONING
+        self.index = 0
+
+    def run_unit(self):
+        graph = self.graph
+        if self.phase == self.SECTIONING:
+            if self.index < len(graph.all_streamlines):
+                graph.generate_sections(self.index)
+                self.index += 1
+                return
+            self.index = 0
+            self.phase = self.NODES
+        elif self.phase == self.NODES:
+            if self.index < len(graph.streamline_sections):
+                graph.add_section_nodes(graph.streamline_sections[self.index])
+                self.index += 1
+                return
+            self.phase = self.BORDERS
+        elif self.phase == self.BORDERS:
+            graph.add_border_connections()
+            self.phase = self.DONE
+
+    @property
+    def progress(self) -> float:
+        done = self.index / max(len(self.graph.all_streamlines), 1)
+        if self.phase == self.SECTIONING:
+            return self.SECTIONING_SHARE * done
+        if self.phase == self.NODES:
+            return self.SECTIONING_SHARE + self.NODES_SHARE * done
+        if self.phase == self.BORDERS:
+            return self.SECTIONING_SHARE + self.NODES_SHARE
+        return 1.0
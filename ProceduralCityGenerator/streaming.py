@@ -0,0 +1,105 @@
+import os
+import numpy as np
+from ProceduralCityGenerator.graph import Graph
+from ProceduralCityGenerator.streamlines import StreamlineGenerator
+from ProceduralCityGenerator.tiling import TiledStreamlineGenerator
+
+
+# Concatenates polylines of Vectors into an array of shape (N, 2) and the offsets of the
+# polylines, so polyline i is points[offsets[i]:offsets[i + 1]].
+def pack_polylines(polylines) -> tuple[np.ndarray, np.ndarray]:
+    lengths = [len(polyline) for polyline in polylines]
+    offsets = np.zeros(len(lengths) + 1, dtype=np.intp)
+    np.cumsum(lengths, out=offsets[1:])
+    points = np.array([p.to_tuple() for polyline in polylines for p in polyline]).reshape(-1, 2)
+    return points, offsets
+
+
+# Reads a tile written by StreamingStreamlineGenerator, returns a dict of its arrays.
+def read_tile(path) -> dict[str, np.ndarray]:
+    with np.load(path) as data:
+        return dict(data)
+
+
+# Generates the streamlines of a domain too large to be kept in memory, tile by tile, and
+# writes each finished tile to 'directory' as 'tile_<x>_<y>.npz':
+#   - 'points', 'offsets': the streamlines, see 'pack_polylines'
+#   - 'major': major flag of each streamline
+#   - 'simple_points', 'simple_offsets': the simplified streamlines
+#   - 'nodes', 'node_types': the nodes of the graph fragment of the tile and their NodeType
+#   - 'section_points', 'section_offsets', 'section_streamlines': the sections of the graph
+#     fragment and the index of the streamline of each section
+#
+# Tiles are traced one after another, column by column. Only the boundary samples of the
+# last tiles_y + 1 tiles, the samples within dsep of their borders, are kept as halo for the
+# following tiles (see TiledStreamlineGenerator), so peak memory is bounded by a single tile
+# instead of the whole domain.
+# In contrast to TiledStreamlineGenerator, streamlines are not joined across the seams of
+# tiles traced before their neighbours, and graph fragments are not connected.
+class StreamingStreamlineGenerator(TiledStreamlineGenerator):
+    # Also write the graph fragment of each tile.
+    WRITE_GRAPH = True
+
+    def get_tile_path(self, directory, tile) -> str:
+        x, y = divmod(tile, self.tiles_y)
+        return os.path.join(directory, f"tile_{x}_{y}.npz")
+
+    # Traces all tiles and writes them to the directory, returns the paths of the tiles.
+    def create_all_streamlines(self, directory) -> list[str]:
+        os.makedirs(directory, exist_ok=True)
+        self.tile_streamlines = {}
+        paths = []
+        for tile in range(self.tiles_x * self.tiles_y):
+            generator = self.trace_tile_generator(tile, self.get_halo(tile))
+            paths.append(self.write_tile(self.get_tile_path(directory, tile), generator))
+            self.tile_streamlines[tile] = self.get_boundary_samples(tile, generator)
+
+            # Tiles before the first neighbour of the next tile are no longer needed.
+            for finished in list(self.tile_streamlines):
+                if finished < tile - self.tiles_y:
+                    del self.tile_streamlines[finished]
+        return paths
+
+    # Returns the major and minor samples of the tile generator within dsep of the tile
+    # borders, in the format of 'tile_streamlines'.
+    def get_boundary_samples(self, tile, generator: StreamlineGenerator) -> list[tuple[bool, np.ndarray]]:
+        origin = self.get_tile_origin(tile)
+        margin = self.parameters.dsep
+        boundary = []
+        for major in [True, False]:
+            points, _ = pack_polylines(generator.streamlines(major))
+            near_border = (
+                (points[:, 0] < origin.x + margin)
+                | (points[:, 0] > origin.x + self.tile_dimensions.x - margin)
+                | (points[:, 1] < origin.y + margin)
+                | (points[:, 1] > origin.y + self.tile_dimensions.y - margin)
+            )
+            boundary.append((major, points[near_border]))
+        return boundary
+
+    def write_tile(self, path, generator: StreamlineGenerator) -> str:
+        points, offsets = pack_polylines(generator.all_streamlines)
+        simple_points, simple_offsets = pack_polylines(generator.all_streamlines_simple)
+        major_streamlines = {id(s) for s in generator.streamlines_major}
+        arrays = {
+            'points': points,
+            'offsets': offsets,
+            'major': np.array([id(s) in major_streamlines for s in generator.all_streamlines], dtype=bool),
+            'simple_points': simple_points,
+            'simple_offsets': simple_offsets,
+        }
+        if self.WRITE_GRAPH and generator.all_streamlines_simple:
+            graph = Graph(generator)
+            sections = [section for streamline in graph.streamline_sections for section in streamline]
+            section_points, section_offsets = pack_polylines(sections)
+            arrays.update({
+                'nodes': np.array([node.co.to_tuple() for node in graph.nodes]).reshape(-1, 2),
+                'node_types': np.array([node.node_type.value for node in graph.nodes], dtype=np.int8),
+                'section_points': section_points,
+                'section_offsets': section_offsets,
+                'section_streamlines': np.repeat(
+                    np.arange(len(graph.streamline_sections)),
+                    [len(streamline) for streamline in graph.streamline_sections]),
+            })
+        np.savez(path, **arrays)
+        return path
@@ -0,0 +1,116 @@
+import numpy as np
+from collections import deque
+from mathutils import Vector
+from ProceduralCityGenerator.simplify import simplify_array
+
+
+# Compact storage of streamlines: the points of all streamlines in one contiguous coordinate
+# buffer of shape (capacity, 2), and the offsets of the streamlines, so streamline i is
+# points[offsets[i]:offsets[i + 1]]. Each streamline has a major flag and a circle flag (first
+# and last point are equal). Buffers grow by doubling, so appends are amortized O(1).
+#
+# A point takes 16 bytes with float64 coordinates (8 with float32) instead of a Vector object,
+# and the store can be pickled. Streamlines are returned as views into the buffer, which must
+# not be kept across appends.
+class StreamlineStore:
+    INITIAL_CAPACITY = 1024
+
+    def __init__(self, dtype=np.float64):
+        self.buffer = np.empty((self.INITIAL_CAPACITY, 2), dtype=dtype)
+        self.count = 0
+        self.offset_buffer = np.zeros(self.INITIAL_CAPACITY + 1, dtype=np.intp)
+        self.major_buffer = np.empty(self.INITIAL_CAPACITY, dtype=bool)
+        self.circle_buffer = np.empty(self.INITIAL_CAPACITY, dtype=bool)
+        self.size = 0
+
+    # Creates a store of the streamlines of a StreamlineGenerator, in the order of
+    # 'all_streamlines'. With 'simple', the simplified streamlines are stored instead.
+    @classmethod
+    def from_generator(cls, generator, simple=False, dtype=np.float64) -> 'StreamlineStore':
+        store = cls(dtype)
+        major_streamlines = {id(s) for s in generator.streamlines_major}
+        streamlines = generator.all_streamlines_simple if simple else generator.all_streamlines
+        for streamline, original in zip(streamlines, generator.all_streamlines):
+            store.append(streamline, id(original) in major_streamlines)
+        return store
+
+    def __len__(self):
+        return self.size
+
+    # Returns the points of streamline i as a view of shape (N, 2).
+    def __getitem__(self, i) -> np.ndarray:
+        if i < 0:
+            i += self.size
+        if not 0 <= i < self.size:
+            raise IndexError("streamline index out of range")
+        return self.buffer[self.offset_buffer[i]:self.offset_buffer[i + 1]]
+
+    def __iter__(self):
+        for i in range(self.size):
+            yield self.buffer[self.offset_buffer[i]:self.offset_buffer[i + 1]]
+
+    # Points of all streamlines, as a view of shape (N, 2).
+    @property
+    def points(self) -> np.ndarray:
+        return self.buffer[:self.count]
+
+    @property
+    def offsets(self) -> np.ndarray:
+        return self.offset_buffer[:self.size + 1]
+
+    @property
+    def major(self) -> np.ndarray:
+        return self.major_buffer[:self.size]
+
+    @property
+    def circle(self) -> np.ndarray:
+        return self.circle_buffer[:self.size]
+
+    @property
+    def nbytes(self) -> int:
+        return self.buffer.nbytes + self.offset_buffer.nbytes + self.major_buffer.nbytes + self.circle_buffer.nbytes
+
+    # Appends a streamline, given as array of shape (N, 2) or as sequence of Vectors.
+    def append(self, streamline, major: bool):
+        if isinstance(streamline, np.ndarray):
+            points = streamline.reshape(-1, 2)
+        else:
+            points = np.array([p.to_tuple() for p in streamline]).reshape(-1, 2)
+        if self.count + len(points) > len(self.buffer):
+            self.buffer = self.grow(self.buffer, self.count, self.count + len(points))
+        if self.size + 1 > len(self.major_buffer):
+            self.offset_buffer = self.grow(self.offset_buffer, self.size + 1, self.size + 2)
+            self.major_buffer = self.grow(self.major_buffer, self.size, self.size + 1)
+            self.circle_buffer = self.grow(self.circle_buffer, self.size, self.size + 1)
+
+        self.buffer[self.count:self.count + len(points)] = points
+        self.count += len(points)
+        self.offset_buffer[self.size + 1] = self.count
+        self.major_buffer[self.size] = major
+        self.circle_buffer[self.size] = len(points) > 0 and bool((points[0] == points[-1]).all())
+        self.size += 1
+
+    # Returns a copy of the array with at least 'size' entries and twice the capacity, keeping
+    # its first 'used' entries.
+    def grow(self, array: np.ndarray, used, size) -> np.ndarray:
+        grown = np.empty((max(2 * len(array), size),) + array.shape[1:], dtype=array.dtype)
+        grown[:used] = array[:used]
+        return grown
+
+    # Returns the indices of the major or minor streamlines.
+    def streamlines(self, major: bool) -> np.ndarray:
+        return np.flatnonzero(self.major == major)
+
+    # Returns streamline i as a deque of Vectors, as used by StreamlineGenerator and Graph.
+    def to_polyline(self, i) -> deque[Vector]:
+        return deque(Vector(p) for p in self[i].tolist())
+
+    def to_polylines(self) -> list[deque[Vector]]:
+        return [self.to_polyline(i) for i in range(self.size)]
+
+    # Returns a store of the simplified streamlines, see 'simplify_array'.
+    def simplify(self, tolerance=1.0) -> 'StreamlineStore':
+        store = StreamlineStore(self.buffer.dtype)
+        for i, streamline in enumerate(self):
+            store.append(simplify_array(streamline, tolerance), self.major_buffer[i])
+        return store
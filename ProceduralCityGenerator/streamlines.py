@@ -1,11 +1,26 @@
+import copy
+import itertools
 import math
 import numpy as np
 from mathutils import Vector
 from collections import deque
-from ProceduralCityGenerator.grid_storage import GridStorage
+from ProceduralCityGenerator.grid_storage import GridStorage, SparseGridStorage
 from ProceduralCityGenerator.integrator import FieldIntegrator
 from ProceduralCityGenerator.streamline_parameters import StreamlineParameters
 from ProceduralCityGenerator.simplify import simplify
+from ProceduralCityGenerator.streamline_store import StreamlineStore
+from ProceduralCityGenerator.random_stream import RandomStream
+
+
+# Compares arrays of points of shape (N, 2) like Vector ==, which considers coordinates equal
+# if their float32 values are at most one representable value apart.
+def vectors_equal(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    a = a.astype(np.float32).view(np.int32).astype(np.int64)
+    b = b.astype(np.float32).view(np.int32).astype(np.int64)
+    # Order the bit patterns of negative floats like their values.
+    a = np.where(a < 0, -0x80000000 - a, a)
+    b = np.where(b < 0, -0x80000000 - b, b)
+    return (np.abs(a - b) <= 1).all(axis=1)
 
 
 class StreamlineIntegration:
@@ -16,13 +31,109 @@ class StreamlineIntegration:
             streamline: deque[Vector],
             previous_direction: Vector,
             previous_point: Vector,
-            valid: bool):
+            valid: bool,
+            step_size=None):
         self.seed = seed
         self.original_direction = original_direction
         self.streamline = streamline
         self.previous_direction = previous_direction
         self.previous_point = previous_point
         self.valid = valid
+        # Step size of adaptive integrators for the next step of this front, see
+        # 'FieldIntegrator.integrate_step'.
+        self.step_size = step_size
+
+
+# Both integration fronts of a streamline traced from a seed, with the state of the
+# tracing loop.
+class StreamlineTrace:
+    def __init__(
+            self,
+            forward: StreamlineIntegration,
+            backwards: StreamlineIntegration,
+            collide_both: bool):
+        self.forward = forward
+        self.backwards = backwards
+        self.collide_both = collide_both
+        self.count = 0
+        self.points_escaped = False
+        self.done = not (forward.valid or backwards.valid)
+
+
+# Streamline accepted by the StreamlineGenerator, with its simplified form and its index in
+# 'all_streamlines'. Streamlines whose ends were extended by the join pass are reported to
+# the listeners a second time, with 'updated' set and the new simplified form.
+class AcceptedStreamline:
+    def __init__(self, streamline: deque[Vector], simple: deque[Vector], major: bool, index: int, updated=False):
+        self.streamline = streamline
+        self.simple = simple
+        self.major = major
+        self.index = index
+        self.updated = updated
+
+
+# Joins the dangling ends (streamline, major, start) of a StreamlineGenerator in order, in
+# batches of ends ('join_ends'), so the join pass can be split into units of work (see
+# StreamlineStepper).
+# The best next points of a batch are found in a single query against the grids
+# ('get_best_next_points'). An end is queried again if an earlier join of its batch added
+# samples near it, the samples of earlier batches are already in the grids. So the result
+# equals joining the streamlines one after another with 'join_dangling_streamline'.
+class DanglingEndJoin:
+    def __init__(self, generator: 'StreamlineGenerator', ends: list[tuple[deque[Vector], bool, bool]]):
+        self.generator = generator
+        self.ends = ends
+        # Number of ends joined so far.
+        self.index = 0
+        # Extended streamlines as (streamline, major) by id, in the order of their first join.
+        self.joined: dict[int, tuple[deque[Vector], bool]] = {}
+        # Candidates of an end lie within this many cells of it (see 'GridStorage.get_nearby_points'),
+        # with a margin for samples just outside of the domain, clamped into the border cells.
+        self.radius = math.ceil(generator.parameters.dlookahead / generator.parameters.dsep - 0.5) + 2
+
+    @property
+    def done(self) -> bool:
+        return self.index >= len(self.ends)
+
+    # Joins the next 'count' ends. Returns True if there are ends left.
+    def join_ends(self, count: int) -> bool:
+        generator = self.generator
+        ends = self.ends[self.index:self.index + count]
+        self.index += len(ends)
+        best_points = generator.get_best_next_points(
+            [generator.get_end(streamline, start) for streamline, _, start in ends])
+
+        # Samples added by the joins of this batch, in cells of size dsep not clamped to the domain.
+        joined_samples: dict[tuple[int, int], list[tuple[float, float]]] = {}
+        radius = self.radius
+        for (streamline, major, start), best_point in zip(ends, best_points):
+            point, previous_point = generator.get_end(streamline, start)
+            if joined_samples:
+                cell_x, cell_y = generator.get_join_cell(point)
+                samples = [
+                    sample
+                    for x in range(cell_x - radius, cell_x + radius + 1)
+                    for y in range(cell_y - radius, cell_y + radius + 1)
+                    for sample in joined_samples.get((x, y), ())
+                ]
+                # The best point can only change if one of the added samples is a candidate.
+                if samples:
+                    near, in_cone, _ = generator.test_join_candidates(
+                        [(point, previous_point)], np.array(samples), np.array([0, len(samples)]))
+                    if (near | in_cone).any():
+                        best_point = generator.get_best_next_point(point, previous_point)
+            if best_point is None:
+                continue
+
+            for p in generator.points_between(point, best_point, generator.parameters.dstep):
+                if start:
+                    streamline.appendleft(p)
+                else:
+                    streamline.append(p)
+                generator.grid(major).add_sample(p)
+                joined_samples.setdefault(generator.get_join_cell(p), []).append(p.to_tuple())
+                self.joined[id(streamline)] = (streamline, major)
+        return not self.done
 
 
 # The StreamlineGenerator is responsible for streamline tracing/discretization, creating
@@ -32,24 +143,52 @@ class StreamlineIntegration:
 # required as input parameter.
 # Integration algorithm used is specified by the FieldIntegrator input parameter
 #   -> FieldIntegrator provides global tensor field to be sampled
+# Samples are stored in the spatial index given by 'storage', GridStorage or KDTreeStorage.
+# Sparse storages (SparseGridStorage) for large domains must be used without distance raster
+# and free space seeds, which would allocate rasters over the whole domain.
+# With 'distance_raster', the grids keep a DistanceRaster for dtest, which accepts most
+# integration steps with a single lookup.
+# With 'free_space_seeds', random seeds are only sampled in the FreeSpace of the grids, and
+# generation ends once there is none left.
+# Random numbers for seed points and collide_early are drawn from two RandomStreams created
+# from 'seed', so generation with a fixed seed is deterministic.
+# Accepted streamlines are passed to the callables in 'streamline_listeners' as
+# AcceptedStreamline, 'iter_streamlines' yields them while generating.
 class StreamlineGenerator:
     def __init__(
             self,
             integrator: FieldIntegrator,
             origin: Vector,
             world_dimensions: Vector,
-            parameters: StreamlineParameters):
+            parameters: StreamlineParameters,
+            storage=GridStorage,
+            distance_raster=False,
+            free_space_seeds=True,
+            seed=None):
 
         self.SEED_AT_ENDPOINTS = False
+        # Advance both fronts of a streamline with a single batch integration per step.
+        # Requires an integrator whose 'integrate_many' matches 'integrate' (Euler, RK4).
+        # Batching pays off with many fronts, see 'integrate_streamlines'.
+        self.BATCH_FRONTS = False
         self.NEAR_EDGE = 3
+        # Trace the streamlines of this many seeds at once in 'create_all_streamlines', see
+        # 'create_streamlines_speculative'. Only used without free space seeds and
+        # SEED_AT_ENDPOINTS, and only pays off together with BATCH_FRONTS.
+        self.SPECULATIVE_BATCH = 0
+        # Integrate this many steps of each front ahead and test them at once, see
+        # 'integrate_streamline_chunked'. Not used with BATCH_FRONTS.
+        self.INTEGRATION_CHUNK = 0
 
         self.clear_streamlines()
 
+        self.streamline_listeners: list = []
         self.candidate_seeds_major: deque[Vector] = deque([])
         self.candidate_seeds_minor: deque[Vector] = deque([])
         self.streamlines_done = True
         self.last_streamline_major = True
         self.integrator = integrator
+        self.seed_random, self.collide_random = RandomStream.spawn(seed, 2)
         self.origin = origin
         self.world_dimensions = world_dimensions
         self.parameters = parameters
@@ -63,10 +202,25 @@ class StreamlineGenerator:
         # Number of samples to ignore backwards when checking streamline collision with itself.
         self.n_streamline_look_back = 2 * self.n_streamline_step
 
-        self.major_grid = GridStorage(self.world_dimensions, self.origin, parameters.dsep)
-        self.minor_grid = GridStorage(self.world_dimensions, self.origin, parameters.dsep)
+        self.storage = storage
+        self.use_distance_raster = distance_raster
+        self.free_space_seeds = free_space_seeds
+        self.major_grid = self.create_grid()
+        self.minor_grid = self.create_grid()
         self.parameters_sq = self.parameters.copy_sq()
 
+    def create_grid(self):
+        if self.storage.SPARSE and (self.use_distance_raster or self.free_space_seeds):
+            raise ValueError(
+                f"{self.storage.__name__} allocates no rasters over the domain, "
+                "use it with distance_raster=False and free_space_seeds=False")
+        grid = self.storage(self.world_dimensions, self.origin, self.parameters.dsep, self.parameters.dtest)
+        if self.use_distance_raster:
+            grid.add_distance_raster(self.parameters.dtest)
+        if self.free_space_seeds:
+            grid.add_free_space()
+        return grid
+
     def clear_streamlines(self):
         self.all_streamlines = deque([])
         self.streamlines_major = deque([])
@@ -82,28 +236,88 @@ class StreamlineGenerator:
     def simplify_streamline(self, streamline: deque[Vector]):
         return simplify(streamline, self.parameters.simplify_tolerance)
 
-    def join_dangling_streamlines(self):
-        for major in [True, False]:
-            for streamline in self.streamlines(major):
-                # Ignore circles.
-                if streamline[0] == streamline[-1]:
-                    continue
+    # Joins the ends of all streamlines, and simplifies the extended streamlines again. Returns
+    # the streamlines whose ends were extended.
+    # The ends are joined in order by a DanglingEndJoin, in a single batch, so the result equals
+    # joining the streamlines one after another with 'join_dangling_streamline'.
+    # 'ends' restricts the pass to some of the ends of 'get_dangling_ends'. Without 'resimplify',
+    # the simplified streamlines are left to the caller.
+    def join_dangling_streamlines(self, ends=None, resimplify=True) -> list[deque[Vector]]:
+        join = DanglingEndJoin(self, self.get_dangling_ends() if ends is None else ends)
+        join.join_ends(len(join.ends))
 
-                new_start = self.get_best_next_point(streamline[0], streamline[4])
-                if new_start is not None:
-                    for p in self.points_between(streamline[0], new_start, self.parameters.dstep):
-                        streamline.appendleft(p)
-                        self.grid(major).add_sample(p)
+        if resimplify:
+            # Only the extended streamlines are simplified again, if the simplified streamlines
+            # are complete. The deque is changed in place, as it can be shared with a Graph.
+            if len(self.all_streamlines_simple) != len(self.all_streamlines):
+                simple = [self.simplify_streamline(s) for s in self.all_streamlines]
+                self.all_streamlines_simple.clear()
+                self.all_streamlines_simple.extend(simple)
+            self.resimplify_joined_streamlines(join.joined.values())
+        return [streamline for streamline, _ in join.joined.values()]
 
-                new_end = self.get_best_next_point(streamline[-1], streamline[-4])
-                if new_end is not None:
-                    for p in self.points_between(streamline[-1], new_end, self.parameters.dstep):
-                        streamline.append(p)
-                        self.grid(major).add_sample(p)
+    # Simplifies the streamlines extended by a join, given as (streamline, major), again and
+    # reports them to the 'streamline_listeners' with 'updated' set.
+    def resimplify_joined_streamlines(self, joined):
+        indices = {id(s): i for i, s in enumerate(self.all_streamlines)}
+        for streamline, major in joined:
+            self.resimplify_streamline(indices[id(streamline)], major)
 
-        self.all_streamlines_simple = deque([])
-        for s in self.all_streamlines:
-            self.all_streamlines_simple.append(self.simplify_streamline(s))
+    # Replaces the simplified form of the streamline at 'index' of 'all_streamlines' in place,
+    # as the deque can be shared with a Graph.
+    def resimplify_streamline(self, index: int, major: bool):
+        streamline = self.all_streamlines[index]
+        self.all_streamlines_simple[index] = self.simplify_streamline(streamline)
+        if self.streamline_listeners:
+            updated = AcceptedStreamline(streamline, self.all_streamlines_simple[index], major, index, updated=True)
+            for listener in self.streamline_listeners:
+                listener(updated)
+
+    # Returns the open ends of all streamlines as (streamline, major, start), in the order of
+    # 'join_dangling_streamlines'.
+    def get_dangling_ends(self) -> list[tuple[deque[Vector], bool, bool]]:
+        return [
+            (streamline, major, start)
+            for major in [True, False]
+            for streamline in self.streamlines(major)
+            # Ignore circles.
+            if not streamline[0] == streamline[-1]
+            for start in [True, False]
+        ]
+
+    # Returns the end point of the streamline and the point used for its direction, which is
+    # closer to the end on streamlines of a few adaptive steps.
+    def get_end(self, streamline: deque[Vector], start: bool) -> tuple[Vector, Vector]:
+        if start:
+            return streamline[0], streamline[min(4, len(streamline) - 1)]
+        return streamline[-1], streamline[-min(4, len(streamline))]
+
+    def get_join_cell(self, v: Vector) -> tuple[int, int]:
+        return (
+            math.floor((v.x - self.origin.x) / self.parameters.dsep),
+            math.floor((v.y - self.origin.y) / self.parameters.dsep),
+        )
+
+    # Extends both ends of the streamline to the best nearby sample, if any. Returns True if
+    # the streamline was extended.
+    def join_dangling_streamline(self, streamline: deque[Vector], major: bool) -> bool:
+        # Ignore circles.
+        if streamline[0] == streamline[-1]:
+            return False
+
+        length = len(streamline)
+        new_start = self.get_best_next_point(*self.get_end(streamline, True))
+        if new_start is not None:
+            for p in self.points_between(streamline[0], new_start, self.parameters.dstep):
+                streamline.appendleft(p)
+                self.grid(major).add_sample(p)
+
+        new_end = self.get_best_next_point(*self.get_end(streamline, False))
+        if new_end is not None:
+            for p in self.points_between(streamline[-1], new_end, self.parameters.dstep):
+                streamline.append(p)
+                self.grid(major).add_sample(p)
+        return len(streamline) != length
 
     def points_between(self, v1: Vector, v2: Vector, dstep):
         d = math.sqrt((v1.x - v2.x) ** 2 + (v1.y - v2.y) ** 2)
@@ -111,108 +325,380 @@ class StreamlineGenerator:
         if n_points == 0:
             return []
 
-        step_vector = v2 - v1
+        # All points are integrated in a single batch, the result ends before the first
+        # point without a valid field direction.
+        fractions = np.arange(1, n_points + 1) / n_points
+        points = np.array(v1.to_tuple()) + np.outer(fractions, (v2 - v1).to_tuple())
+        steps = self.integrator.integrate_many(points, True)
+        valid = (steps ** 2).sum(axis=1) > 0.001
+        n_valid = n_points if valid.all() else int(np.argmin(valid))
 
-        out = []
-
-        i = 1
-        next = v1 + (step_vector * (i / n_points))
-        for i in range(1, n_points + 1):
-            if self.integrator.integrate(next, True).length_squared > 0.001:
-                out.append(next)
-            else:
-                return out
-            next = v1 + (step_vector * (i / n_points))
-
-        return out
+        return [Vector(p) for p in points[:n_valid]]
 
     def get_best_next_point(self, point: Vector, previous_point: Vector):
-        nearby_points = self.major_grid.get_nearby_points(point, self.parameters.dlookahead)
-        nearby_points.extend(self.minor_grid.get_nearby_points(point, self.parameters.dlookahead))
-        direction = point - previous_point
+        return self.get_best_next_points([(point, previous_point)])[0]
 
-        closest_sample = None
-        closest_distance = math.inf
+    # Returns the best next point of each end, given as (point, previous_point), or None.
+    # Candidates are the samples of both grids around the end ('get_nearby_points' within
+    # dlookahead) in front of it: the first one closer than sqrt(2) * dstep, otherwise the
+    # closest one within joinangle of the direction of the end. The point returned lies slightly beyond the candidate.
+    # The tests of all candidates of all ends are run on arrays at once. They follow Vector
+    # arithmetic: differences in float32, coordinates within one float32 step are equal.
+    def get_best_next_points(self, ends: list[tuple[Vector, Vector]]) -> list[Vector | None]:
+        if not ends:
+            return []
+        blocks = []
+        for point, _ in ends:
+            for grid in [self.major_grid, self.minor_grid]:
+                blocks.append(grid.get_nearby_points_coords(point.x, point.y, self.parameters.dlookahead))
+        # Candidates of end i are samples[offsets[i]:offsets[i + 1]].
+        offsets = np.zeros(len(ends) + 1, dtype=np.intp)
+        np.cumsum([len(major) + len(minor) for major, minor in zip(blocks[::2], blocks[1::2])], out=offsets[1:])
+        samples = np.concatenate(blocks).reshape(-1, 2)
+        if len(samples) == 0:
+            return [None] * len(ends)
+        near, in_cone, distance_sq = self.test_join_candidates(ends, samples, offsets)
 
-        for sample in nearby_points:
-            if sample != point and sample != previous_point:
-                difference_vector = sample - point
-                if difference_vector.dot(direction) < 0:
+        best_points = []
+        for i, (start, end) in enumerate(zip(offsets[:-1].tolist(), offsets[1:].tolist())):
+            closest = np.flatnonzero(near[start:end])
+            if len(closest) == 0:
+                cone = np.flatnonzero(in_cone[start:end])
+                if len(cone) == 0:
+                    best_points.append(None)
                     continue
+                closest = cone[np.argmin(distance_sq[start:end][cone])]
+            else:
+                closest = closest[0]
+            point, previous_point = ends[i]
+            direction = point - previous_point
+            direction.normalize()
+            best_points.append(
+                Vector(samples[start + int(closest)].tolist()) + direction * (self.parameters.simplify_tolerance * 4))
+        return best_points
 
-                distance_to_sample = (point.x - sample.x) ** 2 + (point.y - sample.y) ** 2
-                if distance_to_sample < 2 * self.parameters_sq.dstep:
-                    closest_sample = sample
-                    break
-
-                angle_between = direction.angle(difference_vector)
-                if angle_between < self.parameters.joinangle and distance_to_sample < closest_distance:
-                    closest_distance = distance_to_sample
-                    closest_sample = sample
+    # Tests the samples given for each end as in 'get_best_next_points'. Returns the masks of
+    # the samples closer than sqrt(2) * dstep and within joinangle, and the squared distances.
+    def test_join_candidates(
+            self,
+            ends: list[tuple[Vector, Vector]],
+            samples: np.ndarray,
+            offsets: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        owners = np.repeat(np.arange(len(ends)), np.diff(offsets))
+        points = np.array([point.to_tuple() for point, _ in ends])[owners]
+        previous_points = np.array([previous_point.to_tuple() for _, previous_point in ends])[owners]
+        direction = np.array([(point - previous_point).to_tuple() for point, previous_point in ends])[owners]
 
-        if closest_sample is not None:
-            direction.normalize()
-            closest_sample = closest_sample + direction * (self.parameters.simplify_tolerance * 4)
+        differences = (samples.astype(np.float32) - points.astype(np.float32)).astype(float)
+        dot = differences[:, 0] * direction[:, 0] + differences[:, 1] * direction[:, 1]
+        candidate = (
+            ~vectors_equal(samples, points)
+            & ~vectors_equal(samples, previous_points)
+            & (dot >= 0)
+        )
+        distance_sq = (points[:, 0] - samples[:, 0]) ** 2 + (points[:, 1] - samples[:, 1]) ** 2
+        near = candidate & (distance_sq < 2 * self.parameters_sq.dstep)
 
-        return closest_sample
+        # 'Vector.angle', with the cosine rounded to float32.
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cos = dot / (
+                np.sqrt(direction[:, 0] * direction[:, 0] + direction[:, 1] * direction[:, 1])
+                * np.sqrt(differences[:, 0] * differences[:, 0] + differences[:, 1] * differences[:, 1]))
+        angle = np.arccos(np.clip(cos.astype(np.float32), -1, 1))
+        in_cone = candidate & (angle < self.parameters.joinangle)
+        return near, in_cone, distance_sq
 
     def add_existing_streamlines(self, s: 'StreamlineGenerator'):
-        self.major_grid.extend(s.major_grid)
-        self.minor_grid.extend(s.minor_grid)
+        self.major_grid.merge(s.major_grid)
+        self.minor_grid.merge(s.minor_grid)
+
+    # Returns the streamlines as StreamlineStore, see 'StreamlineStore.from_generator'.
+    def get_store(self, simple=False, dtype=np.float64) -> StreamlineStore:
+        return StreamlineStore.from_generator(self, simple, dtype)
+
+    # Adds the streamlines of a StreamlineStore, e.g. of a finished generator, to the
+    # streamlines and grids, and their simplified streamlines to 'all_streamlines_simple'.
+    def add_store(self, store: StreamlineStore):
+        for i in range(len(store)):
+            major = bool(store.major[i])
+            streamline = store.to_polyline(i)
+            self.grid(major).add_points(list(streamline), store[i])
+            self.streamlines(major).append(streamline)
+            self.all_streamlines.append(streamline)
+            self.all_streamlines_simple.append(self.simplify_streamline(streamline))
 
     def set_grid(self, s: 'StreamlineGenerator'):
         self.major_grid = s.major_grid
         self.minor_grid = s.minor_grid
 
+    # Creates a single streamline per call, after 'streamlines_done' was reset, and joins the
+    # dangling streamlines once no seed is left. Returns False when done.
+    # See StreamlineStepper for a time budgeted version.
     def update(self):
         if not self.streamlines_done:
             self.last_streamline_major = not self.last_streamline_major
             if not self.create_streamline(self.last_streamline_major):
                 self.streamlines_done = True
-                self.resolve()
+                self.join_dangling_streamlines()
             return True
         return False
 
     # Creates all possible streamlines at once.
     def create_all_streamlines(self):
         self.streamlines_done = False
-        major = True
-        while self.create_streamline(major):
-            major = not major
+        if self.SPECULATIVE_BATCH > 1 and self.can_speculate():
+            major = True
+            while major is not None:
+                major = self.create_streamlines_speculative(self.SPECULATIVE_BATCH, major)
+        else:
+            major = True
+            while self.create_streamline(major):
+                major = not major
         self.join_dangling_streamlines()
 
+    # Speculation requires seeds that only depend on the random streams and the grids.
+    def can_speculate(self) -> bool:
+        return (
+            not self.SEED_AT_ENDPOINTS
+            and self.major_grid.free_space is None
+            and self.minor_grid.free_space is None
+        )
+
+    # Creates the next streamlines of 'create_all_streamlines' speculatively: the seeds of the
+    # next 'batch_size' streamlines are drawn from copies of the random streams against the
+    # current grids, and traced against these grids (see 'trace_seeds').
+    # The streamlines are then committed in seed order. A streamline is kept if the sequential
+    # run draws the same seed and none of its points is closer than dtest to a streamline
+    # committed earlier in the batch, so all of its separation tests pass as before. It is
+    # traced again otherwise, and the rest of the batch is discarded if the seeds diverge.
+    # The result equals the sequential run. 'major' is the family of the first streamline,
+    # returns the family of the next streamline or None once no seed is left.
+    def create_streamlines_speculative(self, batch_size, major: bool) -> bool | None:
+        seed_random = self.seed_random
+        collide_random = self.collide_random
+        self.seed_random = copy.deepcopy(seed_random)
+        speculative_collide_random = copy.deepcopy(collide_random)
+        seeds = []
+        try:
+            for i in range(batch_size):
+                seed = self.get_seed(major if i % 2 == 0 else not major)
+                if seed is None:
+                    break
+                seeds.append((seed, speculative_collide_random.random() < self.parameters.collide_early))
+        finally:
+            self.seed_random = seed_random
+
+        speculative = {}
+        for family in [major, not major]:
+            family_seeds = [
+                (i, seed, collide_both)
+                for i, (seed, collide_both) in enumerate(seeds)
+                if (i % 2 == 0) == (family == major)
+            ]
+            streamlines = self.trace_seeds(
+                [seed for _, seed, _ in family_seeds], family, [collide_both for _, _, collide_both in family_seeds])
+            for (i, _, _), streamline in zip(family_seeds, streamlines):
+                speculative[i] = streamline
+
+        committed = {
+            family: SparseGridStorage(self.world_dimensions, self.origin, self.parameters.dsep, self.parameters.dtest)
+            for family in [True, False]
+        }
+        for i in range(batch_size):
+            family = major if i % 2 == 0 else not major
+            seed = self.get_seed(family)
+            if seed is None:
+                return None
+            collide_both = self.collide_random.random() < self.parameters.collide_early
+            if i < len(seeds) and seed == seeds[i][0]:
+                streamline = speculative[i]
+                if self.conflicts(streamline, committed[family], committed[not family] if collide_both else None):
+                    streamline = self.integrate_streamline(seed, family, collide_both)
+            else:
+                streamline = self.integrate_streamline(seed, family, collide_both)
+            self.accept_streamline(streamline, family)
+            if self.valid_streamline(streamline):
+                committed[family].add_polyline(streamline)
+            if i >= len(seeds) or seed != seeds[i][0]:
+                return not family
+        return major if batch_size % 2 == 0 else not major
+
+    # Traces the streamlines of the seeds with the given collide_early decisions, all at once
+    # with BATCH_FRONTS, one after another otherwise.
+    def trace_seeds(self, seeds: list[Vector], major: bool, collide_both: list[bool]) -> list[deque[Vector]]:
+        if self.BATCH_FRONTS:
+            return self.integrate_streamlines(seeds, major, collide_both)
+        return [self.integrate_streamline(seed, major, collide) for seed, collide in zip(seeds, collide_both)]
+
+    # Returns True if a point of the streamline is closer than dtest to a sample of the grids.
+    def conflicts(self, streamline: deque[Vector], grid, other_grid=None) -> bool:
+        for grid in [grid, other_grid]:
+            if grid is None:
+                continue
+            for p in streamline:
+                if not grid.is_valid_sample(p, self.parameters_sq.dtest):
+                    return True
+        return False
+
+    # Removes the streamlines, in full or simplified form, and rebuilds the grids from the
+    # remaining streamlines. Returns the removed streamlines and their simplified forms.
+    def remove_streamlines(self, streamlines) -> tuple[list[deque[Vector]], list[deque[Vector]]]:
+        removed_ids = {id(s) for s in streamlines}
+        kept = []
+        removed = []
+        for streamline, simple in zip(self.all_streamlines, self.all_streamlines_simple):
+            if id(streamline) in removed_ids or id(simple) in removed_ids:
+                removed.append((streamline, simple))
+            else:
+                kept.append((streamline, simple))
+        if not removed:
+            return [], []
+
+        # The deques are changed in place, as they can be shared with a Graph.
+        removed_ids = {id(streamline) for streamline, _ in removed}
+        for streamlines in [self.streamlines_major, self.streamlines_minor]:
+            remaining = [s for s in streamlines if id(s) not in removed_ids]
+            streamlines.clear()
+            streamlines.extend(remaining)
+        self.all_streamlines.clear()
+        self.all_streamlines.extend(streamline for streamline, _ in kept)
+        self.all_streamlines_simple.clear()
+        self.all_streamlines_simple.extend(simple for _, simple in kept)
+
+        # Samples can not be removed from the grids, distance rasters and free spaces.
+        self.major_grid = self.create_grid()
+        self.minor_grid = self.create_grid()
+        for major in [True, False]:
+            self.grid(major).add_polyline(p for s in self.streamlines(major) for p in s)
+        return [streamline for streamline, _ in removed], [simple for _, simple in removed]
+
+    # Creates streamlines from random seeds inside the discs given as (x, y, radius), of each
+    # family until no seed is found within seed_tries, and joins their dangling ends.
+    # Used to fill regions whose streamlines were removed. Returns the new streamlines and
+    # their simplified forms.
+    def create_region_streamlines(self, regions) -> tuple[list[deque[Vector]], list[deque[Vector]]]:
+        count = len(self.all_streamlines)
+        families = [True, False]
+        while families:
+            major = families.pop(0)
+            seed = self.get_region_seed(major, regions)
+            if seed is not None:
+                self.create_streamline(major, seed)
+                families.append(major)
+
+        added = list(self.all_streamlines)[count:]
+        major_streamlines = {id(s) for s in self.streamlines_major}
+        simple = []
+        for streamline in added:
+            self.join_dangling_streamline(streamline, id(streamline) in major_streamlines)
+            simple.append(self.simplify_streamline(streamline))
+        for _ in added:
+            self.all_streamlines_simple.pop()
+        self.all_streamlines_simple.extend(simple)
+        return added, simple
+
+    # Joins the dangling ends of the given streamlines again, e.g. after the streamlines they
+    # ended at were removed, and simplifies the extended streamlines again. Returns the
+    # extended streamlines with their previous and their new simplified forms.
+    def rejoin_streamlines(self, streamlines) -> tuple[list[deque[Vector]], list[deque[Vector]], list[deque[Vector]]]:
+        indices = {id(s): i for i, s in enumerate(self.all_streamlines)}
+        major_streamlines = {id(s) for s in self.streamlines_major}
+        joined = []
+        previous = []
+        simple = []
+        for streamline in streamlines:
+            if self.join_dangling_streamline(streamline, id(streamline) in major_streamlines):
+                index = indices[id(streamline)]
+                joined.append(streamline)
+                previous.append(self.all_streamlines_simple[index])
+                self.all_streamlines_simple[index] = self.simplify_streamline(streamline)
+                simple.append(self.all_streamlines_simple[index])
+        return joined, previous, simple
+
+    # Returns a random valid seed inside one of the discs given as (x, y, radius), or None
+    # after seed_tries invalid seeds.
+    def get_region_seed(self, major: bool, regions):
+        for i in range(self.parameters.seed_tries + 1):
+            x, y, radius = regions[min(int(self.seed_random.random() * len(regions)), len(regions) - 1)]
+            distance = radius * math.sqrt(self.seed_random.random())
+            angle = 2 * math.pi * self.seed_random.random()
+            seed = Vector((x + distance * math.cos(angle), y + distance * math.sin(angle)))
+            if self.point_in_bounds(seed) and self.is_valid_sample(major, seed, self.parameters_sq.dsep):
+                return seed
+        return None
+
+    # Creates all streamlines like 'create_all_streamlines', yielding an AcceptedStreamline for
+    # each streamline as soon as it is accepted, and for each streamline extended by the join
+    # pass afterwards.
+    def iter_streamlines(self):
+        accepted: list[AcceptedStreamline] = []
+        self.streamline_listeners.append(accepted.append)
+        try:
+            self.streamlines_done = False
+            major = True
+            while self.create_streamline(major):
+                major = not major
+                yield from accepted
+                accepted.clear()
+            self.streamlines_done = True
+            # The join pass reports the extended streamlines to the listeners.
+            self.join_dangling_streamlines()
+        finally:
+            self.streamline_listeners.remove(accepted.append)
+        yield from accepted
+
     # Creates a single streamline.
-    # Finds seed point and adds new seed candidates afterwards.
-    def create_streamline(self, major: bool):
-        seed = self.get_seed(major)
+    # Finds seed point, unless given, and adds new seed candidates afterwards.
+    # A seed whose streamline is too short to be accepted counts as rejected seed of its free
+    # space cell, otherwise the cell would never be removed and generation would not end.
+    def create_streamline(self, major: bool, seed: Vector | None = None):
+        if seed is None:
+            seed = self.get_seed(major)
         if seed is None:
             return False
-        streamline = self.integrate_streamline(seed, major)
-        if self.valid_streamline(streamline):
-            self.grid(major).add_polyline(streamline)
-            self.streamlines(major).append(streamline)
-            self.all_streamlines.append(streamline)
+        free_space = self.grid(major).free_space
+        if not self.accept_streamline(self.integrate_streamline(seed, major), major) and free_space is not None:
+            free_space.reject(free_space.get_cell(seed.x, seed.y))
+        return True
 
-            self.all_streamlines_simple.append(self.simplify_streamline(streamline))
+    # Adds the streamline to the grids and the streamlines, if it is valid. Returns True if
+    # it was added.
+    def accept_streamline(self, streamline: deque[Vector], major: bool) -> bool:
+        if not self.valid_streamline(streamline):
+            return False
+        self.grid(major).add_polyline(streamline)
+        self.streamlines(major).append(streamline)
+        self.all_streamlines.append(streamline)
 
-            if not streamline[0] == streamline[-1]:
-                self.candidate_seeds(not major).append(streamline[0])
-                self.candidate_seeds(not major).append(streamline[-1])
+        self.all_streamlines_simple.append(self.simplify_streamline(streamline))
+        if self.streamline_listeners:
+            accepted = AcceptedStreamline(
+                streamline, self.all_streamlines_simple[-1], major, len(self.all_streamlines) - 1)
+            for listener in self.streamline_listeners:
+                listener(accepted)
 
+        if not streamline[0] == streamline[-1]:
+            self.candidate_seeds(not major).append(streamline[0])
+            self.candidate_seeds(not major).append(streamline[-1])
         return True
 
+    # Streamlines need more than 5 points. Steps of adaptive integrators can be up to dtest
+    # long, so their streamlines need an arc length above 5 * dstep instead.
     def valid_streamline(self, s: deque[Vector]):
+        if self.integrator.ADAPTIVE_STEP:
+            length = sum((b - a).length for a, b in zip(s, itertools.islice(s, 1, None)))
+            return length > 5 * self.parameters.dstep
         return len(s) > 5
 
     # Returns random seed point.
     # Performance of this implementation can become an issue in the future,
     # if more points in the domain become invalid for streamline placement,
     # based on parameters or input maps (water, density,...).
+    #   -> see 'get_free_space_seed'
     def sample_point(self):
-        rng = np.random.default_rng()
         return Vector((
-            rng.random() * self.world_dimensions.x + self.origin.x,
-            rng.random() * self.world_dimensions.y + self.origin.y)
+            self.seed_random.random() * self.world_dimensions.x + self.origin.x,
+            self.seed_random.random() * self.world_dimensions.y + self.origin.y)
         )
 
     # Retruns seed point from candidate seeds, if available, and checks validity.
@@ -224,6 +710,9 @@ class StreamlineGenerator:
                 if self.is_valid_sample(major, seed, self.parameters_sq.dsep):
                     return seed
 
+        if self.grid(major).free_space is not None:
+            return self.get_free_space_seed(major)
+
         seed = self.sample_point()
         i = 0
         while not self.is_valid_sample(major, seed, self.parameters_sq.dsep):
@@ -233,6 +722,20 @@ class StreamlineGenerator:
             i += 1
         return seed
 
+    # Samples seeds only in cells of the grid which can still hold a seed. Rejected seeds
+    # refine the free space, returns None once it is empty or after seed_tries rejections.
+    def get_free_space_seed(self, major: bool):
+        free_space = self.grid(major).free_space
+        for i in range(self.parameters.seed_tries + 1):
+            sample = free_space.sample_point(self.seed_random)
+            if sample is None:
+                return None
+            seed, cell = sample
+            if self.is_valid_sample(major, seed, self.parameters_sq.dsep):
+                return seed
+            free_space.reject(cell)
+        return None
+
     def is_valid_sample(self, major: bool, point: Vector, d_sq, both_grids=False):
         grid_valid = self.grid(major).is_valid_sample(point, d_sq)
         if both_grids:
@@ -248,6 +751,18 @@ class StreamlineGenerator:
             and self.origin.y <= v.y < self.world_dimensions.y + self.origin.y
         )
 
+    # Returns the point where the segment from the in-bounds point v1 to v2 leaves the domain.
+    def clip_to_bounds(self, v1: Vector, v2: Vector) -> Vector:
+        t = 1.0
+        for i in range(2):
+            lower = self.origin[i]
+            upper = self.origin[i] + self.world_dimensions[i]
+            if v2[i] < lower:
+                t = min(t, (lower - v1[i]) / (v2[i] - v1[i]))
+            elif v2[i] >= upper:
+                t = min(t, (upper - v1[i]) / (v2[i] - v1[i]))
+        return v1 + (v2 - v1) * t
+
     # Checks if the streamline has turned more than 180 degrees, to find circles.
     def streamline_turned(self, seed: Vector, original_direction: Vector, point: Vector, direction: Vector):
         if original_direction.dot(direction) < 0:
@@ -260,46 +775,216 @@ class StreamlineGenerator:
     def streamline_integration_step(self, parameters: StreamlineIntegration, major: bool, collide_both: bool):
         if parameters.valid:
             parameters.streamline.append(parameters.previous_point)
-            next_direction: Vector = self.integrator.integrate(parameters.previous_point, major)
+            next_direction, parameters.step_size = self.integrator.integrate_step(
+                parameters.previous_point, major, parameters.step_size)
+            self.apply_integration_step(parameters, next_direction, major, collide_both)
 
-            if next_direction.length_squared < 0.01:
-                parameters.valid = False
-                return
+    # Advances all valid fronts of the traces by one step. The points of all fronts are
+    # integrated in a single batch, with one field evaluation per integrator stage.
+    def streamline_integration_steps(self, traces: list[StreamlineTrace], major: bool):
+        fronts = [
+            (parameters, trace.collide_both)
+            for trace in traces
+            for parameters in (trace.forward, trace.backwards)
+            if parameters.valid
+        ]
+        if not fronts:
+            return
 
-            if next_direction.dot(parameters.previous_direction) < 0:
+        steps = self.integrator.integrate_many(
+            np.array([parameters.previous_point.to_tuple() for parameters, _ in fronts]), major)
+        for (parameters, collide_both), step in zip(fronts, steps):
+            parameters.streamline.append(parameters.previous_point)
+            self.apply_integration_step(parameters, Vector(step), major, collide_both)
+
+    def apply_integration_step(
+            self,
+            parameters: StreamlineIntegration,
+            next_direction: Vector,
+            major: bool,
+            collide_both: bool):
+        if next_direction.length_squared < 0.01:
+            parameters.valid = False
+            return
+
+        if next_direction.dot(parameters.previous_direction) < 0:
+            next_direction = next_direction * -1
+
+        next_point = parameters.previous_point + next_direction
+
+        if not self.point_in_bounds(next_point):
+            # Streamlines end on the border of the domain, regardless of the step size.
+            parameters.streamline.append(self.clip_to_bounds(parameters.previous_point, next_point))
+            parameters.valid = False
+        elif (
+            self.is_valid_sample(major, next_point, self.parameters_sq.dtest, collide_both)
+            and not self.streamline_turned(
+                parameters.seed,
+                parameters.original_direction,
+                next_point,
+                next_direction)
+        ):
+            parameters.previous_point = next_point
+            parameters.previous_direction = next_direction
+        else:
+            parameters.streamline.append(next_point)
+            parameters.valid = False
+
+    def integrate_streamline(self, seed: Vector, major: bool, collide_both=None) -> deque[Vector]:
+        if self.BATCH_FRONTS:
+            return self.integrate_streamlines([seed], major, [collide_both])[0]
+        if self.INTEGRATION_CHUNK > 0:
+            return self.integrate_streamline_chunked(seed, major, collide_both)
+
+        trace = self.start_streamline(seed, major, collide_both)
+        while not trace.done:
+            self.streamline_integration_step(trace.forward, major, trace.collide_both)
+            self.streamline_integration_step(trace.backwards, major, trace.collide_both)
+            self.finish_step(trace)
+        return self.end_streamline(trace)
+
+    # Traces the streamline like 'integrate_streamline', but integrates INTEGRATION_CHUNK steps
+    # of both fronts ahead before testing them (see 'integrate_ahead'). The bounds, separation
+    # and turn tests of a chunk are run on arrays at once ('count_valid_steps'), and each front
+    # is truncated at its first failing step. Steps integrated beyond it are discarded.
+    def integrate_streamline_chunked(self, seed: Vector, major: bool, collide_both=None) -> deque[Vector]:
+        trace = self.start_streamline(seed, major, collide_both)
+        while not trace.done:
+            steps = min(self.INTEGRATION_CHUNK, self.parameters.path_iterations - trace.count)
+            chunks = []
+            for parameters in (trace.forward, trace.backwards):
+                points, directions, step_sizes = self.integrate_ahead(parameters, major, steps)
+                valid_steps = self.count_valid_steps(parameters, points, directions, major, trace.collide_both)
+                chunks.append((parameters, points, directions, step_sizes, valid_steps))
+            for step in range(steps):
+                for parameters, points, directions, step_sizes, valid_steps in chunks:
+                    self.apply_chunk_step(parameters, points, directions, step_sizes, valid_steps, step)
+                self.finish_step(trace)
+                if trace.done:
+                    break
+        return self.end_streamline(trace)
+
+    # Integrates up to 'steps' steps of a valid front, without testing them. Ends early at a
+    # step too short to continue. Returns the points and directions of the steps, and the step
+    # size of the integrator after each step.
+    def integrate_ahead(
+            self,
+            parameters: StreamlineIntegration,
+            major: bool,
+            steps) -> tuple[list[Vector], list[Vector], list]:
+        points = []
+        directions = []
+        step_sizes = []
+        if not parameters.valid:
+            return points, directions, step_sizes
+        point = parameters.previous_point
+        direction = parameters.previous_direction
+        step_size = parameters.step_size
+        for _ in range(steps):
+            next_direction, step_size = self.integrator.integrate_step(point, major, step_size)
+            if next_direction.length_squared < 0.01:
+                break
+            if next_direction.dot(direction) < 0:
                 next_direction = next_direction * -1
+            point = point + next_direction
+            direction = next_direction
+            points.append(point)
+            directions.append(direction)
+            step_sizes.append(step_size)
+        return points, directions, step_sizes
 
-            next_point = parameters.previous_point + next_direction
-
-            if (
-                self.point_in_bounds(next_point)
-                and self.is_valid_sample(major, next_point, self.parameters_sq.dtest, collide_both)
-                and not self.streamline_turned(
-                    parameters.seed,
-                    parameters.original_direction,
-                    next_point,
-                    next_direction)
-            ):
-                parameters.previous_point = next_point
-                parameters.previous_direction = next_direction
-            else:
-                parameters.streamline.append(next_point)
-                parameters.valid = False
+    # Returns the number of leading steps of a chunk that pass the tests of
+    # 'apply_integration_step': inside the domain, at least dtest away from the grid samples
+    # and not turned more than 180 degrees.
+    def count_valid_steps(
+            self,
+            parameters: StreamlineIntegration,
+            points: list[Vector],
+            directions: list[Vector],
+            major: bool,
+            collide_both: bool) -> int:
+        if not points:
+            return 0
+        coords = np.array([p.to_tuple() for p in points])
+        steps = np.array([d.to_tuple() for d in directions])
+        x = coords[:, 0]
+        y = coords[:, 1]
+        valid = (
+            (self.origin.x <= x) & (x < self.world_dimensions.x + self.origin.x)
+            & (self.origin.y <= y) & (y < self.world_dimensions.y + self.origin.y)
+        )
+        valid &= self.grid(major).are_valid_samples(coords, self.parameters_sq.dtest)
+        if collide_both:
+            valid &= self.grid(not major).are_valid_samples(coords, self.parameters_sq.dtest)
+
+        # Vectorized 'streamline_turned', with the perpendicular vector (dy, -dx).
+        dx, dy = parameters.original_direction.to_tuple()
+        seed_x, seed_y = parameters.seed.to_tuple()
+        is_left = (x - seed_x) * dy - (y - seed_y) * dx < 0
+        direction_up = steps[:, 0] * dy - steps[:, 1] * dx > 0
+        turned = (steps[:, 0] * dx + steps[:, 1] * dy < 0) & (is_left == direction_up)
+        valid &= ~turned
+
+        invalid = np.flatnonzero(~valid)
+        return int(invalid[0]) if len(invalid) else len(points)
+
+    # Advances the front by the step of its chunk, like 'streamline_integration_step'. The
+    # first invalid step, or the missing step after a chunk that ended early, ends the front.
+    def apply_chunk_step(
+            self,
+            parameters: StreamlineIntegration,
+            points: list[Vector],
+            directions: list[Vector],
+            step_sizes: list,
+            valid_steps,
+            step):
+        if not parameters.valid:
+            return
+        parameters.streamline.append(parameters.previous_point)
+        if step < valid_steps:
+            parameters.previous_point = points[step]
+            parameters.previous_direction = directions[step]
+            parameters.step_size = step_sizes[step]
+            return
+
+        parameters.valid = False
+        if step == len(points):
+            return
+        if not self.point_in_bounds(points[step]):
+            # Streamlines end on the border of the domain, regardless of the step size.
+            parameters.streamline.append(self.clip_to_bounds(parameters.previous_point, points[step]))
+        else:
+            parameters.streamline.append(points[step])
+
+    # Traces streamlines from all seeds together, advancing all of their fronts with a
+    # single batch integration per step.
+    # Streamlines are only tested against the grids, not against each other.
+    # 'collide_both' holds the collide_early decision of each seed, drawn if not given.
+    def integrate_streamlines(self, seeds: list[Vector], major: bool, collide_both=None) -> list[deque[Vector]]:
+        if collide_both is None:
+            collide_both = [None] * len(seeds)
+        traces = [self.start_streamline(seed, major, collide) for seed, collide in zip(seeds, collide_both)]
+        active = [trace for trace in traces if not trace.done]
+        while active:
+            self.streamline_integration_steps(active, major)
+            for trace in active:
+                self.finish_step(trace)
+            active = [trace for trace in active if not trace.done]
+        return [self.end_streamline(trace) for trace in traces]
 
-    def integrate_streamline(self, seed: Vector, major: bool) -> deque[Vector]:
-        count = 0
-        points_escaped = False
-        rng = np.random.default_rng()
-        collide_both = rng.random() < self.parameters.collide_early
+    def start_streamline(self, seed: Vector, major: bool, collide_both=None) -> StreamlineTrace:
+        if collide_both is None:
+            collide_both = self.collide_random.random() < self.parameters.collide_early
 
-        d = self.integrator.integrate(seed, major)
+        d, step_size = self.integrator.integrate_step(seed, major)
         forward_parameters: StreamlineIntegration = StreamlineIntegration(
             seed=seed,
             original_direction=d,
             streamline=deque([seed]),
             previous_direction=d,
             previous_point=seed + d,
-            valid=True)
+            valid=True,
+            step_size=step_size)
         forward_parameters.valid = self.point_in_bounds(forward_parameters.previous_point)
 
         negative_d = d * -1
@@ -309,29 +994,45 @@ class StreamlineGenerator:
             streamline=deque([]),
             previous_direction=negative_d,
             previous_point=seed + negative_d,
-            valid=True)
+            valid=True,
+            step_size=step_size)
         backwards_parameters.valid = self.point_in_bounds(backwards_parameters.previous_point)
 
-        while count < self.parameters.path_iterations and (forward_parameters.valid or backwards_parameters.valid):
-            self.streamline_integration_step(forward_parameters, major, collide_both)
-            self.streamline_integration_step(backwards_parameters, major, collide_both)
+        trace = StreamlineTrace(forward_parameters, backwards_parameters, collide_both)
+        trace.done = trace.done or self.parameters.path_iterations <= 0
+        return trace
 
-            sq_distance_between_points = (
-                (forward_parameters.previous_point.x - backwards_parameters.previous_point.x) ** 2
-                + (forward_parameters.previous_point.y - backwards_parameters.previous_point.y) ** 2
-            )
+    # Joins the fronts if they met after a step, e.g. on circles, and ends the trace after
+    # path_iterations steps or when both fronts are invalid.
+    def finish_step(self, trace: StreamlineTrace):
+        forward_parameters = trace.forward
+        backwards_parameters = trace.backwards
+        sq_distance_between_points = (
+            (forward_parameters.previous_point.x - backwards_parameters.previous_point.x) ** 2
+            + (forward_parameters.previous_point.y - backwards_parameters.previous_point.y) ** 2
+        )
+        # Fronts can pass each other within a single step, if steps are longer than dcirclejoin.
+        sq_circle_join_distance = max(
+            self.parameters_sq.dcirclejoin,
+            forward_parameters.previous_direction.length_squared,
+            backwards_parameters.previous_direction.length_squared
+        )
 
-            if not points_escaped and sq_distance_between_points > self.parameters_sq.dcirclejoin:
-                points_escaped = True
+        if not trace.points_escaped and sq_distance_between_points > sq_circle_join_distance:
+            trace.points_escaped = True
 
-            if points_escaped and sq_distance_between_points <= self.parameters_sq.dcirclejoin:
-                forward_parameters.streamline.append(forward_parameters.previous_point)
-                forward_parameters.streamline.append(backwards_parameters.previous_point)
-                backwards_parameters.streamline.append(backwards_parameters.previous_point)
-                break
+        if trace.points_escaped and sq_distance_between_points <= sq_circle_join_distance:
+            forward_parameters.streamline.append(forward_parameters.previous_point)
+            forward_parameters.streamline.append(backwards_parameters.previous_point)
+            backwards_parameters.streamline.append(backwards_parameters.previous_point)
+            trace.done = True
+            return
 
-            count += 1
+        trace.count += 1
+        if trace.count >= self.parameters.path_iterations or not (forward_parameters.valid or backwards_parameters.valid):
+            trace.done = True
 
-        backwards_parameters.streamline.reverse()
-        backwards_parameters.streamline.extend(forward_parameters.streamline)
-        return backwards_parameters.streamline
+    def end_streamline(self, trace: StreamlineTrace) -> deque[Vector]:
+        trace.backwards.streamline.reverse()
+        trace.backwards.streamline.extend(trace.forward.streamline)
+        return trace.backwards.streamline
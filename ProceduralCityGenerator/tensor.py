@@ -1,4 +1,5 @@
 import math
+import numpy as np
 from mathutils import Vector
 
 
@@ -36,6 +37,22 @@ class Tensor:
         self.old_theta = True
         return self
 
+    # Equivalent to adding n zero tensors, used for basis fields that have been culled.
+    def skip(self, n, smooth=False):
+        if n <= 0:
+            return self
+
+        if smooth:
+            for _ in range(n):
+                self.matrix = [v * self.r for v in self.matrix]
+                self.r = math.hypot(*self.matrix)
+        else:
+            self.matrix = [v * self.r * 2 ** (n - 1) for v in self.matrix]
+            self.r = 2
+
+        self.old_theta = True
+        return self
+
     def scale(self, s):
         self.r *= s
         self.old_theta = True
@@ -74,3 +91,183 @@ class Tensor:
         if self.r == 0:
             return 0
         return math.atan2(self.matrix[1] / self.r, self.matrix[0] / self.r) / 2
+
+
+# Compact accumulator for the summation of tensors on the sampling hot path.
+# Holds 'r' and the matrix components as plain floats and follows the accumulation rules of
+# 'Tensor.add', without creating intermediate Tensor objects or lists.
+# The eigenvectors are derived from the summed matrix with half-angle formulas, instead of
+# calculating theta with atan2 followed by cos/sin.
+class TensorAccumulator:
+    __slots__ = ('r', 'm0', 'm1', 'smooth')
+
+    def __init__(self, smooth=False):
+        self.reset(smooth)
+
+    def reset(self, smooth=False):
+        self.r = 0.0
+        self.m0 = 0.0
+        self.m1 = 0.0
+        self.smooth = smooth
+        return self
+
+    def set(self, r, m0, m1):
+        self.r = r
+        self.m0 = m0
+        self.m1 = m1
+        return self
+
+    # Adds the tensor with matrix [m0, m1] and 'r' equal to weight.
+    def add(self, m0, m1, weight):
+        self.m0 = self.m0 * self.r + m0 * weight
+        self.m1 = self.m1 * self.r + m1 * weight
+        if self.smooth:
+            self.r = math.hypot(self.m0, self.m1)
+        else:
+            self.r = 2
+
+    # Equivalent to adding n zero tensors, see 'Tensor.skip'.
+    def skip(self, n):
+        if n <= 0:
+            return
+        if self.smooth:
+            for _ in range(n):
+                self.m0 *= self.r
+                self.m1 *= self.r
+                self.r = math.hypot(self.m0, self.m1)
+        else:
+            scale = self.r * 2 ** (n - 1)
+            self.m0 *= scale
+            self.m1 *= scale
+            self.r = 2
+
+    # Rotates the summed tensor by theta, see 'Tensor.rotate'.
+    def rotate(self, theta):
+        if theta == 0:
+            return
+        h = math.hypot(self.m0, self.m1)
+        cos_2theta, sin_2theta = (self.m0 / h, self.m1 / h) if h > 0 else (1.0, 0.0)
+        cos_rotation = math.cos(2 * theta)
+        sin_rotation = math.sin(2 * theta)
+        self.m0 = (cos_2theta * cos_rotation - sin_2theta * sin_rotation) * self.r
+        self.m1 = (sin_2theta * cos_rotation + cos_2theta * sin_rotation) * self.r
+
+    def to_tensor(self) -> Tensor:
+        return Tensor(self.r, [self.m0, self.m1])
+
+    # Returns cos(theta) and sin(theta) of the summed tensor, with theta in (-pi/2, pi/2]
+    # as calculated by 'Tensor.calculate_theta'.
+    def get_cos_sin(self):
+        h = math.hypot(self.m0, self.m1)
+        if h == 0:
+            return 1.0, 0.0
+        cos_2theta = self.m0 / h
+        return (
+            math.sqrt(max(0.0, (1 + cos_2theta) / 2)),
+            math.copysign(math.sqrt(max(0.0, (1 - cos_2theta) / 2)), self.m1)
+        )
+
+    def get_major(self) -> Vector:
+        if self.r == 0:
+            return Vector((0.0, 0.0))
+        return Vector(self.get_cos_sin())
+
+    # Minor eigenvector is the major eigenvector rotated by pi/2.
+    def get_minor(self) -> Vector:
+        if self.r == 0:
+            return Vector((0.0, 0.0))
+        cos_theta, sin_theta = self.get_cos_sin()
+        return Vector((-sin_theta, cos_theta))
+
+    def get_major_minor(self) -> tuple[Vector, Vector]:
+        if self.r == 0:
+            return Vector((0.0, 0.0)), Vector((0.0, 0.0))
+        cos_theta, sin_theta = self.get_cos_sin()
+        return Vector((cos_theta, sin_theta)), Vector((-sin_theta, cos_theta))
+
+
+# Array counterpart of the Tensor class, holding 'r' and the matrix components of N tensors
+# as NumPy arrays of shape (N,) and (N, 2).
+# Used for batch sampling of the tensor field, mirrors the scalar Tensor API.
+class TensorSamples:
+
+    def __init__(self, r: np.ndarray, matrix: np.ndarray):
+        self.r = r
+        self.matrix = matrix
+
+    @classmethod
+    def zero(cls, n) -> 'TensorSamples':
+        return TensorSamples(np.zeros(n), np.zeros((n, 2)))
+
+    def __len__(self):
+        return len(self.r)
+
+    # Dividing the matrix by 'r' (as in 'Tensor.calculate_theta') does not change the angle for
+    # r > 0 and is skipped.
+    @property
+    def theta(self) -> np.ndarray:
+        theta = np.arctan2(self.matrix[:, 1], self.matrix[:, 0]) / 2
+        theta[self.r == 0] = 0.0
+        return theta
+
+    def add(self, tensors: 'TensorSamples', smooth=False):
+        self.matrix = self.matrix * self.r[:, None] + tensors.matrix * tensors.r[:, None]
+
+        if smooth:
+            self.r = np.hypot(self.matrix[:, 0], self.matrix[:, 1])
+        else:
+            self.r = np.full(len(self.r), 2.0)
+
+        return self
+
+    def skip(self, n, smooth=False):
+        if n <= 0:
+            return self
+
+        if smooth:
+            for _ in range(n):
+                self.matrix = self.matrix * self.r[:, None]
+                self.r = np.hypot(self.matrix[:, 0], self.matrix[:, 1])
+        else:
+            self.matrix = self.matrix * (self.r * 2 ** (n - 1))[:, None]
+            self.r = np.full(len(self.r), 2.0)
+
+        return self
+
+    def scale(self, s):
+        self.r = self.r * s
+        return self
+
+    # Rotates each tensor by the corresponding angle of the array 'theta', see 'Tensor.rotate'.
+    def rotate(self, theta: np.ndarray):
+        rotate = theta != 0
+        if not rotate.any():
+            return self
+
+        h = np.hypot(self.matrix[:, 0], self.matrix[:, 1])
+        undefined = h == 0
+        h[undefined] = 1.0
+        cos_2theta = np.where(undefined, 1.0, self.matrix[:, 0] / h)
+        sin_2theta = self.matrix[:, 1] / h
+        cos_rotation = np.cos(2 * theta)
+        sin_rotation = np.sin(2 * theta)
+        matrix = np.stack((
+            (cos_2theta * cos_rotation - sin_2theta * sin_rotation) * self.r,
+            (sin_2theta * cos_rotation + cos_2theta * sin_rotation) * self.r
+        ), axis=1)
+        self.matrix = np.where(rotate[:, None], matrix, self.matrix)
+        return self
+
+    # returns major eigenvectors of the tensors as array of shape (N, 2)
+    def get_major(self) -> np.ndarray:
+        theta = self.theta
+        major = np.stack((np.cos(theta), np.sin(theta)), axis=1)
+        major[self.r == 0] = 0.0
+        return major
+
+    # returns minor eigenvectors of the tensors as array of shape (N, 2)
+    def get_minor(self) -> np.ndarray:
+        angle = self.theta + math.pi / 2
+        minor = np.stack((np.cos(angle), np.sin(angle)), axis=1)
+        minor[self.r == 0] = 0.0
+        return minor
@@ -1,14 +1,69 @@
-from ProceduralCityGenerator.tensor import Tensor
+import numpy as np
+from ProceduralCityGenerator.tensor import Tensor, TensorAccumulator, TensorSamples
 from mathutils import Vector
 from ProceduralCityGenerator.basis_field import GridBasisField, RadialBasisField
+from ProceduralCityGenerator.baked_field import BakedTensorField
+from ProceduralCityGenerator.field_index import BasisFieldIndex
+from ProceduralCityGenerator.noise import NoiseTexture, NoiseLayer
 
 
 # The TensorField class serves as the global tensor field.
 # Holds any number of basis fields, performs point sampling and summation of basis fields.
+# 'sample_points' is the batch version of 'sample_point', summing the basis fields for an
+# array of N points of shape (N, 2) at once.
+#
+# The field can be baked into a raster cache covering the generator domain (see 'bake'),
+# samples inside the baked domain are then interpolated instead of summed.
+# Any change to the basis fields or to 'smooth' discards the baked cache.
+#
+# Sampling only visits basis fields whose support region contains the sample point, using a
+# BasisFieldIndex built on demand. Smooth basis fields have unbounded support, unless
+# 'smooth_epsilon' is set: weights below the epsilon are then treated as zero.
+#
+# Noise layers (see 'add_global_noise' and 'add_park_noise') rotate the summed tensors in
+# the order they were added. Noise values are looked up in precomputed NoiseTextures, and
+# are part of the baked cache.
+#
+# 'sample_major', 'sample_minor' and 'sample_eigenvectors' are the hot path used during
+# integration. They sum the basis fields into a reused TensorAccumulator and return the
+# eigenvectors directly, without creating Tensor objects.
 class TensorField:
     def __init__(self):
         self.basis_fields = []
-        self.smooth = False
+        self.noise_layers: list[NoiseLayer] = []
+        self._smooth = False
+        self._smooth_epsilon = 0.0
+        self.baked: BakedTensorField | None = None
+        self._field_index: BasisFieldIndex | None = None
+        self._accumulator = TensorAccumulator()
+        # Incremented on every invalidation, used by caches of sampled values.
+        self.version = 0
+
+    @property
+    def smooth(self):
+        return self._smooth
+
+    @smooth.setter
+    def smooth(self, smooth):
+        if smooth != self._smooth:
+            self._smooth = smooth
+            self.invalidate()
+
+    @property
+    def smooth_epsilon(self):
+        return self._smooth_epsilon
+
+    @smooth_epsilon.setter
+    def smooth_epsilon(self, epsilon):
+        if epsilon != self._smooth_epsilon:
+            self._smooth_epsilon = epsilon
+            self.invalidate()
+
+    @property
+    def field_index(self) -> BasisFieldIndex:
+        if self._field_index is None:
+            self._field_index = BasisFieldIndex(self.basis_fields, self.smooth, self.smooth_epsilon)
+        return self._field_index
 
     def add_grid(self, center: Vector, size, decay, theta):
         grid = GridBasisField(center, size, decay, theta)
@@ -18,14 +73,59 @@ class TensorField:
         radial = RadialBasisField(center, size, decay)
         self.add_field(radial)
 
+    # Rotational noise everywhere in the field, by up to 'angle' (radians) in either direction.
+    # 'size' is the size of a noise lattice cell in world units.
+    def add_global_noise(self, size, angle, seed=0) -> NoiseLayer:
+        return self.add_noise_layer(NoiseLayer(NoiseTexture(seed=seed), size, angle))
+
+    # Rotational noise inside the disc given by center and radius, e.g. for parks.
+    def add_park_noise(self, center: Vector, radius, size, angle, seed=0) -> NoiseLayer:
+        return self.add_noise_layer(NoiseLayer(NoiseTexture(seed=seed), size, angle, center, radius))
+
+    def add_noise_layer(self, layer: NoiseLayer) -> NoiseLayer:
+        self.noise_layers.append(layer)
+        self.invalidate()
+        return layer
+
+    def remove_noise_layer(self, layer: NoiseLayer):
+        self.noise_layers.remove(layer)
+        self.invalidate()
+
     def add_field(self, field):
         self.basis_fields.append(field)
+        self.invalidate()
 
     def remove_field(self, field):
         self.basis_fields.remove(field)
+        self.invalidate()
+
+    def move_field(self, field, center: Vector):
+        field.center = center.copy()
+        self.invalidate()
+
+    # Returns the support region of the basis field as (x, y, radius), see
+    # 'BasisField.get_support_radius'.
+    def get_support_region(self, field) -> tuple[float, float, float]:
+        return field.center.x, field.center.y, field.get_support_radius(self.smooth, self.smooth_epsilon)
 
     def reset(self):
         self.basis_fields = []
+        self.noise_layers = []
+        self.invalidate()
+
+    # Discards cached data derived from the basis fields.
+    # Must be called after modifying basis fields or noise layers in place.
+    def invalidate(self):
+        self.baked = None
+        self._field_index = None
+        self.version += 1
+
+    # Bakes the field into a raster with grid spacing 'resolution' covering the domain
+    # given by origin and dimensions. Returns the BakedTensorField, which offers an
+    # error report against the analytic field.
+    def bake(self, origin: Vector, dimensions: Vector, resolution) -> BakedTensorField:
+        self.baked = BakedTensorField(self, origin, dimensions, resolution)
+        return self.baked
 
     def get_center_points(self):
         return [field.center for field in self.basis_fields]
@@ -34,18 +134,107 @@ class TensorField:
         return self.basis_fields
 
     def sample_point(self, point: Vector):
+        if self.baked is not None and self.baked.contains(point.x, point.y):
+            return self.baked.sample_point(point)
+        return self.evaluate_point(point)
+
+    def sample_points(self, points) -> TensorSamples:
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        if self.baked is None:
+            return self.evaluate_points(points)
+
+        inside = self.baked.contains_points(points)
+        if inside.all():
+            return self.baked.sample_points(points)
+        if not inside.any():
+            return self.evaluate_points(points)
+
+        tensors = TensorSamples(np.empty(len(points)), np.empty((len(points), 2)))
+        for mask, samples in [
+            (inside, self.baked.sample_points(points[inside])),
+            (~inside, self.evaluate_points(points[~inside]))
+        ]:
+            tensors.r[mask] = samples.r
+            tensors.matrix[mask] = samples.matrix
+        return tensors
+
+    def sample_major(self, point: Vector) -> Vector:
+        return self.accumulate(point.x, point.y).get_major()
+
+    def sample_minor(self, point: Vector) -> Vector:
+        return self.accumulate(point.x, point.y).get_minor()
+
+    # Returns both the major and the minor eigenvector from a single field evaluation.
+    def sample_eigenvectors(self, point: Vector) -> tuple[Vector, Vector]:
+        return self.accumulate(point.x, point.y).get_major_minor()
+
+    # Sums the field at (x, y) into the reused accumulator of the field and returns it.
+    # The accumulator is overwritten by the next call.
+    def accumulate(self, x, y) -> TensorAccumulator:
+        acc = self._accumulator.reset(self.smooth)
+        if self.baked is not None and self.baked.contains(x, y):
+            return self.baked.load(acc, x, y)
+
+        if not self.basis_fields:
+            return acc.set(1, 0, 0)
+
+        next_index = 0
+        for i in self.field_index.get_candidates(x, y):
+            acc.skip(i - next_index)
+            self.basis_fields[i].accumulate(acc, x, y)
+            next_index = i + 1
+        acc.skip(len(self.basis_fields) - next_index)
+
+        for layer in self.noise_layers:
+            acc.rotate(layer.get_angle(x, y))
+        return acc
+
+    # Sums all basis fields at the given point, ignoring the baked cache.
+    def evaluate_point(self, point: Vector):
         # check if point is valid in case of water etc. here
 
         if not self.basis_fields:
             return Tensor(1, [0, 0])
 
-        # summation of all underlying basis fields
+        # summation of all underlying basis fields, culled fields are skipped as zero tensors
         tensor_acc = Tensor.zero()
-        for field in self.basis_fields:
-            tensor_acc.add(field.get_weighted_tensor(point, self.smooth), self.smooth)
+        next_index = 0
+        for i in self.field_index.get_candidates(point.x, point.y):
+            tensor_acc.skip(i - next_index, self.smooth)
+            tensor_acc.add(self.basis_fields[i].get_weighted_tensor(point, self.smooth), self.smooth)
+            next_index = i + 1
+        tensor_acc.skip(len(self.basis_fields) - next_index, self.smooth)
+
+        # rotational noise of parks and global noise
+        for layer in self.noise_layers:
+            tensor_acc.rotate(layer.get_angle(point.x, point.y))
+
+        return tensor_acc
+
+    # Batch version of 'evaluate_point'.
+    def evaluate_points(self, points) -> TensorSamples:
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+
+        if not self.basis_fields or len(points) == 0:
+            return TensorSamples(np.ones(len(points)), np.zeros((len(points), 2)))
 
-        # rotational noise for parks added here if applicable
+        # summation of all underlying basis fields, fields without support in the bounding box
+        # of the points are skipped as zero tensors
+        field_index = self.field_index
+        min_x, min_y = points.min(axis=0)
+        max_x, max_y = points.max(axis=0)
+        tensor_acc = TensorSamples.zero(len(points))
+        n_skipped = 0
+        for i, field in enumerate(self.basis_fields):
+            if not field_index.overlaps_box(i, min_x, min_y, max_x, max_y):
+                n_skipped += 1
+                continue
+            tensor_acc.skip(n_skipped, self.smooth)
+            tensor_acc.add(field.get_weighted_tensors(points, self.smooth), self.smooth)
+            n_skipped = 0
+        tensor_acc.skip(n_skipped, self.smooth)
 
-        # global noise added here if applicable
+        for layer in self.noise_layers:
+            tensor_acc.rotate(layer.get_angles(points))
 
         return tensor_acc
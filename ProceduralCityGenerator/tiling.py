@@ -0,0 +1,247 @@
+import math
+import multiprocessing
+import os
+import numpy as np
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from mathutils import Vector
+from ProceduralCityGenerator.grid_storage import GridStorage
+from ProceduralCityGenerator.integrator import FieldIntegrator
+from ProceduralCityGenerator.streamline_parameters import StreamlineParameters
+from ProceduralCityGenerator.streamlines import StreamlineGenerator
+
+
+# TiledStreamlineGenerator of the worker processes, see 'init_worker'.
+worker_generator = None
+
+
+def init_worker(tiled_generator: 'TiledStreamlineGenerator'):
+    global worker_generator
+    worker_generator = tiled_generator
+
+
+def trace_tile_worker(tile, halo):
+    return worker_generator.trace_tile(tile, halo)
+
+
+# Generates the streamlines of a large domain in tiles, traced in parallel by a pool of
+# worker processes, and stitches them into a single StreamlineGenerator ('generator'), which
+# can be passed to Graph.
+#
+# Tiles are traced in four phases, one per color of a 2x2 checkerboard pattern, so the tiles
+# of a phase are never adjacent and are traced concurrently. Each tile has its own seed and
+# starts with a halo: the samples of its finished neighbours within dsep of the tile, so its
+# streamlines keep their distance to them. Tiles can not be smaller than dsep. Results only depend
+# on 'seed' and the tiling, not on the number of processes. Without 'tiles', the tiling is
+# derived from the number of processes (default: CPU count), with TILES_PER_WORKER tiles per
+# worker in each phase, see 'get_default_tiles'.
+# Streamlines end on the tile borders, the join pass of the stitched generator connects them
+# across the seams, and only the streamlines it extends are simplified again.
+#
+# Worker processes are forked, as tensor fields and Vectors can not be pickled, and return
+# their streamlines and simplified streamlines as arrays. If fork is not available (Windows,
+# macOS) or 'processes' is 1, all tiles are traced in this process instead.
+# 'options' are passed on to the StreamlineGenerator of each tile.
+class TiledStreamlineGenerator:
+    # Tiles of a phase per worker process, so that workers don't idle while a phase ends.
+    TILES_PER_WORKER = 4
+    # Minimum tile size of the default tiling, in dsep.
+    MIN_TILE_SIZE = 4
+
+    def __init__(
+            self,
+            integrator: FieldIntegrator,
+            origin: Vector,
+            world_dimensions: Vector,
+            parameters: StreamlineParameters,
+            tiles=None,
+            processes=None,
+            seed=None,
+            **options):
+        self.integrator = integrator
+        self.origin = origin
+        self.world_dimensions = world_dimensions
+        self.parameters = parameters
+        self.processes = processes
+        self.tiles_x, self.tiles_y = self.get_default_tiles() if tiles is None else tiles
+        self.tile_dimensions = Vector((world_dimensions.x / self.tiles_x, world_dimensions.y / self.tiles_y))
+        if min(self.tile_dimensions) < parameters.dsep:
+            raise ValueError("Tiles must not be smaller than dsep")
+        self.options = options
+        self.tile_seeds: list[int] = np.random.SeedSequence(seed).generate_state(self.tiles_x * self.tiles_y).tolist()
+
+        # Streamlines of the finished tiles, as lists of (major, points of shape (N, 2)), and
+        # their simplified streamlines.
+        self.tile_streamlines: dict[int, list[tuple[bool, np.ndarray]]] = {}
+        self.tile_simple_streamlines: dict[int, list[np.ndarray]] = {}
+        self.generator: StreamlineGenerator | None = None
+
+    # Returns the number of tiles along x and y, with at least TILES_PER_WORKER tiles per worker
+    # in each of the four phases, for cells close to square. Tiles are not smaller than
+    # MIN_TILE_SIZE * dsep (and dsep), which limits the tiles of small domains.
+    def get_default_tiles(self) -> tuple[int, int]:
+        workers = self.processes or os.cpu_count() or 1
+        if self.get_pool_context() is None:
+            workers = 1
+        tiles = 4 * self.TILES_PER_WORKER * workers
+        aspect = self.world_dimensions.x / self.world_dimensions.y
+        tiles_x = max(math.ceil(math.sqrt(tiles * aspect)), 1)
+        tiles_y = max(math.ceil(tiles / tiles_x), 1)
+        limits = [
+            max(math.floor(dimension / (self.MIN_TILE_SIZE * self.parameters.dsep)), 1)
+            for dimension in self.world_dimensions
+        ]
+        return min(tiles_x, limits[0]), min(tiles_y, limits[1])
+
+    # Returns the tiles, indexed by x * tiles_y + y, grouped into the phases of the
+    # checkerboard pattern.
+    def get_phases(self) -> list[list[int]]:
+        return [
+            [x * self.tiles_y + y for x in range(phase_x, self.tiles_x, 2) for y in range(phase_y, self.tiles_y, 2)]
+            for phase_x, phase_y in [(0, 0), (1, 0), (0, 1), (1, 1)]
+        ]
+
+    def get_tile_origin(self, tile) -> Vector:
+        x, y = divmod(tile, self.tiles_y)
+        return Vector((
+            self.origin.x + x * self.tile_dimensions.x,
+            self.origin.y + y * self.tile_dimensions.y)
+        )
+
+    def create_tile_generator(self, tile) -> StreamlineGenerator:
+        return StreamlineGenerator(
+            self.integrator,
+            self.get_tile_origin(tile),
+            self.tile_dimensions.copy(),
+            self.parameters,
+            seed=self.tile_seeds[tile],
+            **self.options)
+
+    # Returns the tiles around the tile, in tile order.
+    def get_neighbours(self, tile) -> list[int]:
+        x, y = divmod(tile, self.tiles_y)
+        return [
+            i * self.tiles_y + j
+            for i in range(max(x - 1, 0), min(x + 2, self.tiles_x))
+            for j in range(max(y - 1, 0), min(y + 2, self.tiles_y))
+            if (i, j) != (x, y)
+        ]
+
+    # Returns the major and minor samples of the finished neighbours within dsep of the tile,
+    # as arrays of shape (N, 2).
+    def get_halo(self, tile) -> tuple[np.ndarray, np.ndarray]:
+        origin = self.get_tile_origin(tile)
+        margin = self.parameters.dsep
+        neighbours = [neighbour for neighbour in self.get_neighbours(tile) if neighbour in self.tile_streamlines]
+        halo = []
+        for major in [True, False]:
+            blocks = [
+                points
+                for neighbour in neighbours
+                for streamline_major, points in self.tile_streamlines[neighbour]
+                if streamline_major == major
+            ]
+            points = np.concatenate(blocks) if blocks else np.empty((0, 2))
+            inside = (
+                (points[:, 0] >= origin.x - margin)
+                & (points[:, 0] <= origin.x + self.tile_dimensions.x + margin)
+                & (points[:, 1] >= origin.y - margin)
+                & (points[:, 1] <= origin.y + self.tile_dimensions.y + margin)
+            )
+            halo.append(points[inside])
+        return halo[0], halo[1]
+
+    # Traces all streamlines of the tile, around the major and minor samples of its halo.
+    def trace_tile_generator(self, tile, halo: tuple[np.ndarray, np.ndarray]) -> StreamlineGenerator:
+        generator = self.create_tile_generator(tile)
+        for major, points in zip([True, False], halo):
+            generator.grid(major).add_points([Vector(p) for p in points.tolist()], points)
+        generator.create_all_streamlines()
+        return generator
+
+    # Traces the tile, see 'trace_tile_generator', and returns its streamlines as arrays, as
+    # list of (major, points, simplified points).
+    def trace_tile(self, tile, halo: tuple[np.ndarray, np.ndarray]) -> list[tuple[bool, np.ndarray, np.ndarray]]:
+        generator = self.trace_tile_generator(tile, halo)
+        major_streamlines = {id(s) for s in generator.streamlines_major}
+        return [
+            (
+                id(s) in major_streamlines,
+                np.array([p.to_tuple() for p in s]).reshape(-1, 2),
+                np.array([p.to_tuple() for p in simple]).reshape(-1, 2)
+            )
+            for s, simple in zip(generator.all_streamlines, generator.all_streamlines_simple)
+        ]
+
+    def add_tile(self, tile, streamlines: list[tuple[bool, np.ndarray, np.ndarray]]):
+        self.tile_streamlines[tile] = [(major, points) for major, points, _ in streamlines]
+        self.tile_simple_streamlines[tile] = [simple for _, _, simple in streamlines]
+
+    def get_pool_context(self):
+        if self.processes == 1 or 'fork' not in multiprocessing.get_all_start_methods():
+            return None
+        return multiprocessing.get_context('fork')
+
+    # Traces all tiles and stitches them into 'generator'.
+    def create_all_streamlines(self) -> StreamlineGenerator:
+        self.tile_streamlines = {}
+        self.tile_simple_streamlines = {}
+        context = self.get_pool_context()
+        if context is None:
+            for phase in self.get_phases():
+                for tile in phase:
+                    self.add_tile(tile, self.trace_tile(tile, self.get_halo(tile)))
+        else:
+            with ProcessPoolExecutor(self.processes, context, init_worker, (self,)) as pool:
+                for phase in self.get_phases():
+                    halos = [self.get_halo(tile) for tile in phase]
+                    for tile, streamlines in zip(phase, pool.map(trace_tile_worker, phase, halos)):
+                        self.add_tile(tile, streamlines)
+        self.stitch()
+        return self.generator
+
+    # Creates 'generator' with the streamlines and simplified streamlines of all tiles, in tile
+    # order, and joins their dangling ends near the seams. All other ends were joined by the
+    # tile generators, against the same samples.
+    # Joins extend the ends along straight lines, so the new end points are added to the
+    # simplified streamlines of the tiles instead of simplifying the streamlines again.
+    def stitch(self):
+        self.generator = generator = StreamlineGenerator(
+            self.integrator,
+            self.origin,
+            self.world_dimensions,
+            self.parameters,
+            storage=self.options.get('storage', GridStorage),
+            free_space_seeds=False)
+        for tile in sorted(self.tile_streamlines):
+            for (major, points), simple in zip(self.tile_streamlines[tile], self.tile_simple_streamlines[tile]):
+                streamline = deque(Vector(p) for p in points.tolist())
+                generator.grid(major).add_points(list(streamline), points)
+                generator.streamlines(major).append(streamline)
+                generator.all_streamlines.append(streamline)
+                generator.all_streamlines_simple.append(deque(Vector(p) for p in simple.tolist()))
+        joined = generator.join_dangling_streamlines([
+            (streamline, major, start)
+            for streamline, major, start in generator.get_dangling_ends()
+            if self.is_near_seam(streamline[0] if start else streamline[-1])
+        ], resimplify=False)
+        joined_ids = {id(streamline) for streamline in joined}
+        for streamline, simple in zip(generator.all_streamlines, generator.all_streamlines_simple):
+            if id(streamline) not in joined_ids:
+                continue
+            if not streamline[0] == simple[0]:
+                simple.appendleft(streamline[0].copy())
+            if not streamline[-1] == simple[-1]:
+                simple.append(streamline[-1].copy())
+
+    # Returns True if the point is within dlookahead + dsep of a border between two tiles.
+    def is_near_seam(self, point: Vector) -> bool:
+        margin = self.parameters.dlookahead + self.parameters.dsep
+        for value, origin, size, tiles in [
+            (point.x, self.origin.x, self.tile_dimensions.x, self.tiles_x),
+            (point.y, self.origin.y, self.tile_dimensions.y, self.tiles_y)
+        ]:
+            seam = round((value - origin) / size)
+            if 0 < seam < tiles and abs(value - (origin + seam * size)) <= margin:
+                return True
+        return False
@@ -0,0 +1,90 @@
+# Benchmarks the spatial index backends of the StreamlineGenerator (GridStorage and
+# KDTreeStorage) on the samples of a generated city:
+# inserts, separation tests at dtest and dsep, the lookahead radius query used to join
+# dangling streamlines, k-nearest queries, and the full streamline generation.
+#
+# Run from the repository root with 'python benchmarks/spatial_index.py'.
+import sys
+import os
+import timeit
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ProceduralCityGenerator.tensor_field import TensorField
+from ProceduralCityGenerator.integrator import RK4Integrator
+from ProceduralCityGenerator.streamline_parameters import StreamlineParameters
+from ProceduralCityGenerator.streamlines import StreamlineGenerator
+from ProceduralCityGenerator.grid_storage import GridStorage
+from ProceduralCityGenerator.spatial_index import KDTreeStorage
+from mathutils import Vector
+
+ORIGIN = Vector((519.0, 249.0))
+DIMENSIONS = Vector((1452.0, 1279.0))
+
+
+def create_generator(storage):
+    field = TensorField()
+    field.add_grid(Vector((1381, 788)), 1500, 35, 1.983775)
+    field.add_grid(Vector((1181, 988)), 1500, 35, -1.283775)
+    field.add_radial(Vector((800, 888)), 750, 55)
+    parameters = StreamlineParameters(
+        dsep=100,
+        dtest=30,
+        dstep=1,
+        dcirclejoin=5,
+        dlookahead=200,
+        joinangle=0.1,
+        path_iterations=1500,
+        seed_tries=500,
+        simplify_tolerance=0.01,
+        collide_early=0,
+    )
+    return StreamlineGenerator(RK4Integrator(field, parameters), ORIGIN, DIMENSIONS, parameters, storage=storage)
+
+
+# Best time per call in microseconds.
+def best_time(function, calls, repeat=5):
+    return min(timeit.repeat(function, number=1, repeat=repeat)) / calls * 1e6
+
+
+def main():
+    generator = create_generator(GridStorage)
+    generator.create_all_streamlines()
+    samples = [p for s in generator.streamlines_major for p in s]
+    print(f"{len(samples)} samples")
+
+    rng = np.random.default_rng(0)
+    queries = [Vector((ORIGIN.x + x * DIMENSIONS.x, ORIGIN.y + y * DIMENSIONS.y)) for x, y in rng.random((1000, 2))]
+    on_streamlines = samples[::max(len(samples) // 1000, 1)]
+
+    print(f"{'':32}{'GridStorage':>14}{'KDTreeStorage':>14}")
+    storages = {}
+    results = {}
+    for storage in [GridStorage, KDTreeStorage]:
+        def build():
+            storages[storage] = storage(DIMENSIONS, ORIGIN, 100, 30)
+            storages[storage].add_polyline(samples)
+        results.setdefault('insert (us per sample)', []).append(best_time(build, len(samples)))
+        s = storages[storage]
+        results.setdefault('is_valid_sample dtest, random', []).append(
+            best_time(lambda: [s.is_valid_sample(q, 900) for q in queries], len(queries)))
+        results.setdefault('is_valid_sample dtest, on lines', []).append(
+            best_time(lambda: [s.is_valid_sample(q, 900) for q in on_streamlines], len(on_streamlines)))
+        results.setdefault('is_valid_sample dsep', []).append(
+            best_time(lambda: [s.is_valid_sample(q, 10000) for q in queries], len(queries)))
+        results.setdefault('get_nearby_points dlookahead', []).append(
+            best_time(lambda: [s.get_nearby_points(q, 200) for q in on_streamlines], len(on_streamlines)))
+        results.setdefault('get_nearest_points k=8', []).append(
+            best_time(lambda: [s.get_nearest_points(q, 8) for q in queries], len(queries)))
+    for name, (grid_time, kd_time) in results.items():
+        print(f"{name:32}{grid_time:12.1f}us{kd_time:12.1f}us")
+
+    for storage in [GridStorage, KDTreeStorage]:
+        generator = create_generator(storage)
+        print(f"create_all_streamlines with {storage.__name__}: "
+              f"{min(timeit.repeat(generator.create_all_streamlines, number=1, repeat=1)):.2f}s")
+
+
+if __name__ == "__main__":
+    main()
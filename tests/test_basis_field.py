@@ -1,5 +1,6 @@
 import unittest
 import math
+import numpy as np
 from ProceduralCityGenerator.basis_field import GridBasisField, RadialBasisField, BasisField
 from ProceduralCityGenerator.tensor import Tensor
 from mathutils import Vector
@@ -105,6 +106,39 @@ class TestBasisField(unittest.TestCase):
         self.assertEqual(field.get_weighted_tensor(point, smooth=True).r, tensor.r)
         self.assertEqual(field.get_weighted_tensor(point, smooth=True).matrix, tensor.matrix)
 
+    def test_tensor_weights(self):
+        center = Vector((2.0, 2.0))
+        size = 250
+        points = np.array([[150.0, 20.0], [2.0, 2.0], [300.0, 300.0], [-100.0, 40.0]])
+        for decay in [0, 10]:
+            field = BasisField(center, size, decay)
+            for smooth in [False, True]:
+                weights = field.get_tensor_weights(points, smooth)
+                for point, weight in zip(points, weights):
+                    self.assertAlmostEqual(weight, field.get_tensor_weight(Vector(point), smooth))
+
+    def test_get_weighted_tensors(self):
+        points = np.array([[150.0, 20.0], [5.0, 5.0], [-100.0, 40.0]])
+        fields = [
+            GridBasisField(Vector((2.0, 2.0)), 250, 10, math.pi / 3),
+            RadialBasisField(Vector((2.0, 2.0)), 250, 10),
+        ]
+        for field in fields:
+            tensors = field.get_weighted_tensors(points, smooth=True)
+            for i, point in enumerate(points):
+                tensor = field.get_weighted_tensor(Vector(point), smooth=True)
+                self.assertAlmostEqual(tensors.r[i], tensor.r)
+                self.assertAlmostEqual(tensors.matrix[i, 0], tensor.matrix[0], places=3)
+                self.assertAlmostEqual(tensors.matrix[i, 1], tensor.matrix[1], places=3)
+
+    def test_support_radius(self):
+        field = BasisField(Vector((2.0, 2.0)), 250, 10)
+        self.assertEqual(field.get_support_radius(smooth=False), 250)
+        self.assertEqual(field.get_support_radius(smooth=True), math.inf)
+        radius = field.get_support_radius(smooth=True, epsilon=1e-6)
+        point = Vector((2.0 + radius, 2.0))
+        self.assertAlmostEqual(field.get_tensor_weight(point, smooth=True), 1e-6)
+
 
 if __name__ == "__main__":
     unittest.main()
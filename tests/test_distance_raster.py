@@ -0,0 +1,55 @@
+import unittest
+import numpy as np
+from mathutils import Vector
+from ProceduralCityGenerator.distance_raster import DistanceRaster
+from ProceduralCityGenerator.grid_storage import GridStorage
+from ProceduralCityGenerator.spatial_index import KDTreeStorage
+
+
+class TestDistanceRaster(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        # Random walks with unit steps, like streamlines.
+        self.lines = []
+        for start in rng.random((5, 2)) * 100:
+            angles = np.cumsum(rng.normal(0, 0.1, 80))
+            points = start + np.cumsum(np.stack((np.cos(angles), np.sin(angles)), axis=1), axis=0)
+            self.lines.append([Vector(p) for p in points])
+        self.samples = [v for line in self.lines for v in line]
+        self.queries = [Vector(p) for p in rng.random((500, 2)) * 140 - 20]
+
+    def test_is_far(self):
+        raster = DistanceRaster(Vector((100.0, 100.0)), Vector((0.0, 0.0)), 10)
+        for line in self.lines:
+            raster.stamp_polyline((v.x, v.y) for v in line)
+        n_far = 0
+        for v in self.queries:
+            distance = min((s - v).length for s in self.samples)
+            for d in [5, 10]:
+                if raster.is_far(v.x, v.y, d * d):
+                    n_far += 1
+                    self.assertGreaterEqual(distance, d - 1e-4)
+                elif 0 <= v.x < 100 and 0 <= v.y < 100:
+                    self.assertLess(distance, d + 2 * raster.tolerance)
+        self.assertGreater(n_far, 0)
+
+    def test_storage(self):
+        for storage in [GridStorage, KDTreeStorage]:
+            plain = storage(Vector((100.0, 100.0)), Vector((0.0, 0.0)), 20, 10)
+            rastered = storage(Vector((100.0, 100.0)), Vector((0.0, 0.0)), 20, 10)
+            rastered.add_polyline(self.lines[0])
+            rastered.add_distance_raster(10)
+            for line in self.lines:
+                plain.add_polyline(line)
+            for line in self.lines[1:]:
+                rastered.add_polyline(line)
+            rastered.add_sample(Vector((50.0, 50.0)))
+            plain.add_sample(Vector((50.0, 50.0)))
+            for v in self.queries:
+                for d_sq in [25, 100, 400]:
+                    self.assertEqual(rastered.is_valid_sample(v, d_sq), plain.is_valid_sample(v, d_sq))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+import unittest
+import math
+from mathutils import Vector
+from ProceduralCityGenerator.tensor_field import TensorField
+from ProceduralCityGenerator.integrator import RK4Integrator
+from ProceduralCityGenerator.streamline_parameters import StreamlineParameters
+from ProceduralCityGenerator.streamlines import StreamlineGenerator
+from ProceduralCityGenerator.graph import Graph
+from ProceduralCityGenerator.field_editor import FieldEditor
+
+
+class TestFieldEditor(unittest.TestCase):
+
+    def setUp(self):
+        self.field = TensorField()
+        self.field.add_grid(Vector((0.0, 0.0)), 500, 10, math.pi / 6)
+        self.field.add_radial(Vector((50.0, 60.0)), 60, 5)
+        self.parameters = StreamlineParameters(
+            dsep=20,
+            dtest=15,
+            dstep=1,
+            dcirclejoin=5,
+            dlookahead=40,
+            joinangle=0.1,
+            path_iterations=300,
+            seed_tries=100,
+            simplify_tolerance=0.5,
+            collide_early=0,
+        )
+        self.generator = StreamlineGenerator(
+            RK4Integrator(self.field, self.parameters),
+            Vector((0.0, 0.0)),
+            Vector((250.0, 200.0)),
+            self.parameters,
+            seed=0)
+        self.generator.create_all_streamlines()
+        self.graph = Graph(self.generator)
+        self.editor = FieldEditor(self.field, self.generator, self.graph)
+
+    def get_sections(self, graph):
+        return [[[p.to_tuple() for p in section] for section in sections] for sections in graph.streamline_sections]
+
+    def test_move_field(self):
+        radial = self.field.basis_fields[1]
+        self.assertEqual(self.field.get_support_region(radial), (50.0, 60.0, 60))
+        before = list(self.generator.all_streamlines)
+        inside = self.editor.get_streamlines_in_regions([(50.0, 60.0, 60), (180.0, 120.0, 60)])
+        self.assertGreater(len(inside), 0)
+        self.assertLess(len(inside), len(before))
+
+        self.editor.move_field(radial, Vector((180.0, 120.0)))
+        after = list(self.generator.all_streamlines)
+        # Streamlines outside of both regions are kept as they are.
+        for streamline in before:
+            if not any(s is streamline for s in inside):
+                self.assertTrue(any(s is streamline for s in after))
+        self.assertFalse(any(s is streamline for s in after for streamline in inside))
+        self.assertGreater(len(after), len(before) - len(inside))
+
+        generator = self.generator
+        self.assertEqual(len(generator.all_streamlines_simple), len(generator.all_streamlines))
+        self.assertEqual(len(generator.streamlines_major) + len(generator.streamlines_minor), len(after))
+        samples, _ = generator.major_grid.get_samples_and_coords()
+        self.assertEqual(len(samples), sum(len(s) for s in generator.streamlines_major))
+
+        # The updated graph matches a graph built from scratch.
+        graph = Graph(generator)
+        self.assertEqual(self.get_sections(self.graph), self.get_sections(graph))
+        self.assertEqual(len(self.graph.nodes), len(graph.nodes))
+
+    def test_extended_bounding_box(self):
+        streamline = self.generator.all_streamlines[0]
+        min_x, min_y, max_x, max_y = self.editor.get_bounding_box(streamline)
+        # Streamlines are extended in place by joins outside of the editor.
+        end = Vector((max_x + 30.0, max_y + 30.0))
+        streamline.append(end)
+        self.assertIn(streamline, self.editor.get_streamlines_in_regions([(end.x, end.y, 1.0)]))
+        self.assertEqual(self.editor.get_bounding_box(streamline), (min_x, min_y, end.x, end.y))
+
+    def test_update_removed_paths(self):
+        generator = self.generator
+        regions = [(50.0, 60.0, 60), (180.0, 120.0, 60)]
+        removed = self.editor.get_streamlines_in_regions(regions)
+        near = self.editor.get_streamlines_ending_near(removed, self.parameters.dlookahead)
+        self.assertGreater(len([s for s in near if not any(s is r for r in removed)]), 0)
+        join_attempts = []
+        join_dangling_streamline = generator.join_dangling_streamline
+
+        def join(streamline, major):
+            join_attempts.append(streamline)
+            return join_dangling_streamline(streamline, major)
+
+        generator.join_dangling_streamline = join
+        self.editor.move_field(self.field.basis_fields[1], Vector((180.0, 120.0)))
+
+        # Kept streamlines ending near a removed streamline are joined again.
+        for streamline in near:
+            if not any(streamline is s for s in removed):
+                self.assertTrue(any(streamline is s for s in join_attempts))
+        for streamline, simple in zip(generator.all_streamlines, generator.all_streamlines_simple):
+            self.assertEqual(
+                [p.to_tuple() for p in simple], [p.to_tuple() for p in generator.simplify_streamline(streamline)])
+
+        # The paths of the removed streamlines are re-seeded outside of the regions as well.
+        path = [
+            p for s in removed for p in list(s)[::5]
+            if generator.point_in_bounds(p) and not any((p - Vector((x, y))).length <= r for x, y, r in regions)
+        ]
+        self.assertGreater(len(path), 20)
+        free = [
+            p for p in path
+            if any(generator.is_valid_sample(major, p, self.parameters.dsep ** 2) for major in [True, False])
+        ]
+        self.assertLess(len(free), len(path) / 10)
+
+        graph = Graph(generator)
+        self.assertEqual(self.get_sections(self.graph), self.get_sections(graph))
+
+    def test_regenerate(self):
+        self.editor.regenerate()
+        # The graph is updated in place.
+        self.assertIs(self.editor.graph, self.graph)
+        self.assertIs(self.graph.all_streamlines, self.generator.all_streamlines_simple)
+        graph = Graph(self.generator)
+        self.assertGreater(len(graph.nodes), 0)
+        self.assertEqual(self.get_sections(self.graph), self.get_sections(graph))
+        self.assertEqual(len(self.graph.nodes), len(graph.nodes))
+
+    def test_unbounded_support(self):
+        self.field.smooth = True
+        self.editor.add_field(self.field.basis_fields[1].__class__(Vector((200.0, 50.0)), 40, 5))
+        self.assertGreater(len(self.generator.all_streamlines), 0)
+        self.assertEqual(len(self.editor.graph.streamline_sections), len(self.generator.all_streamlines))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+import unittest
+import math
+import numpy as np
+from mathutils import Vector
+from ProceduralCityGenerator.grid_storage import GridStorage
+from ProceduralCityGenerator.spatial_index import KDTreeStorage
+from ProceduralCityGenerator.tensor_field import TensorField
+from ProceduralCityGenerator.integrator import RK4Integrator, DormandPrinceIntegrator
+from ProceduralCityGenerator.streamline_parameters import StreamlineParameters
+from ProceduralCityGenerator.streamlines import StreamlineGenerator
+
+
+class TestFreeSpace(unittest.TestCase):
+
+    def setUp(self):
+        self.lines = [
+            [Vector((x, 30.0)) for x in np.arange(0.0, 100.0, 1.0)],
+            [Vector((60.0, y)) for y in np.arange(0.0, 100.0, 1.0)],
+        ]
+        self.rng = np.random.default_rng(0)
+
+    def test_removed_cells_are_covered(self):
+        for storage in [GridStorage, KDTreeStorage]:
+            grid = storage(Vector((100.0, 100.0)), Vector((0.0, 0.0)), 20, 10)
+            grid.add_polyline(self.lines[0])
+            free_space = grid.add_free_space()
+            grid.add_polyline(self.lines[1])
+            n_cells = free_space.raster.nx * free_space.raster.ny
+            self.assertLess(len(free_space), n_cells)
+            self.assertGreater(len(free_space), 0)
+            free_cells = free_space.cells[:len(free_space)]
+            np.testing.assert_array_equal(free_space.positions[free_cells], np.arange(len(free_space)))
+            self.assertEqual(int((free_space.positions >= 0).sum()), len(free_space))
+            for cell in range(n_cells):
+                if cell in free_space:
+                    continue
+                min_x, min_y, max_x, max_y = free_space.get_cell_bounds(cell)
+                for x, y in self.rng.random((5, 2)):
+                    v = Vector((min_x + x * (max_x - min_x), min_y + y * (max_y - min_y)))
+                    self.assertFalse(grid.is_valid_sample(v))
+
+    def test_sample_point(self):
+        grid = GridStorage(Vector((100.0, 100.0)), Vector((0.0, 0.0)), 20, 10)
+        free_space = grid.add_free_space()
+        for _ in range(20):
+            seed, cell = free_space.sample_point(self.rng)
+            min_x, min_y, max_x, max_y = free_space.get_cell_bounds(cell)
+            self.assertTrue(min_x <= seed.x <= max_x and min_y <= seed.y <= max_y)
+        for cell in free_space.cells[:len(free_space)].tolist():
+            free_space.remove(cell)
+        self.assertIsNone(free_space.sample_point(self.rng))
+
+    def test_reject(self):
+        grid = GridStorage(Vector((100.0, 100.0)), Vector((0.0, 0.0)), 20, 10)
+        free_space = grid.add_free_space()
+        # A cell between two parallel lines is covered by their union only.
+        grid.add_polyline([Vector((x, 40.0)) for x in np.arange(0.0, 100.0, 1.0)])
+        grid.add_polyline([Vector((x, 78.0)) for x in np.arange(0.0, 100.0, 1.0)])
+        cell = int(50 / free_space.resolution) * free_space.ny + int(59 / free_space.resolution)
+        self.assertIn(cell, free_space)
+        free_space.reject(cell)
+        self.assertNotIn(cell, free_space)
+
+    def create_parameters(self, seed_tries=100):
+        return StreamlineParameters(
+            dsep=20,
+            dtest=15,
+            dstep=1,
+            dcirclejoin=5,
+            dlookahead=40,
+            joinangle=0.1,
+            path_iterations=300,
+            seed_tries=seed_tries,
+            simplify_tolerance=0.5,
+            collide_early=0,
+        )
+
+    def test_generation_ends_with_free_space(self):
+        field = TensorField()
+        field.add_grid(Vector((0.0, 0.0)), 500, 10, math.pi / 6)
+        # With enough seed tries, seeding only fails once the free space is empty.
+        parameters = self.create_parameters(seed_tries=1000000)
+        generator = StreamlineGenerator(
+            RK4Integrator(field, parameters), Vector((0.0, 0.0)), Vector((200.0, 200.0)), parameters, seed=0)
+        generator.streamlines_done = False
+        generator.last_streamline_major = False
+        while generator.update():
+            pass
+        self.assertGreater(len(generator.all_streamlines), 4)
+        # Generation ends with the first family without a seed.
+        self.assertEqual(len(generator.grid(generator.last_streamline_major).free_space), 0)
+        self.assertIsNone(generator.get_seed(generator.last_streamline_major))
+
+    def test_rejected_streamline_seeds(self):
+        field = TensorField()
+        field.add_grid(Vector((0.0, 0.0)), 500, 10, math.pi / 6)
+        field.add_radial(Vector((150.0, 100.0)), 300, 5)
+        # Streamlines of a single dstep long step are too short to be accepted.
+        parameters = self.create_parameters()
+        parameters.path_iterations = 1
+        for seed in range(1, 3):
+            generator = StreamlineGenerator(
+                DormandPrinceIntegrator(field, parameters, max_step=parameters.dstep),
+                Vector((0.0, 0.0)),
+                Vector((40.0, 40.0)),
+                parameters,
+                seed=seed)
+            generator.streamlines_done = False
+            generator.last_streamline_major = False
+            # Seeds of rejected streamlines refine the free space, so generation ends.
+            updates = 0
+            while generator.update():
+                updates += 1
+                self.assertLess(updates, 5000)
+            self.assertEqual(len(generator.all_streamlines), 0)
+            self.assertEqual(len(generator.grid(generator.last_streamline_major).free_space), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
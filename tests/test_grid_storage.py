@@ -0,0 +1,148 @@
+import unittest
+import numpy as np
+from mathutils import Vector
+from ProceduralCityGenerator.grid_storage import GridStorage, SparseGridLevel, SparseGridStorage
+
+
+class TestGridStorage(unittest.TestCase):
+
+    def setUp(self):
+        self.grid = GridStorage(Vector((100.0, 80.0)), Vector((-20.0, 10.0)), 10)
+        rng = np.random.default_rng(0)
+        self.samples = [Vector((-20 + x * 100, 10 + y * 80)) for x, y in rng.random((300, 2))]
+        self.grid.add_polyline(self.samples)
+
+    def test_cell_buffers(self):
+        self.assertEqual(sum(self.grid.coarse.cell_counts), len(self.samples))
+        for x, row in enumerate(self.grid.grid):
+            for y, cell in enumerate(row):
+                i = x * self.grid.ny + y
+                np.testing.assert_array_equal(
+                    self.grid.coarse.cell_points[i][:self.grid.coarse.cell_counts[i]].reshape(-1, 2),
+                    np.array([v.to_tuple() for v in cell]).reshape(-1, 2))
+
+    def test_is_valid_sample(self):
+        fine_grid = GridStorage(Vector((100.0, 80.0)), Vector((-20.0, 10.0)), 10, fine_cell_size=3)
+        fine_grid.add_polyline(self.samples)
+        rng = np.random.default_rng(1)
+        for x, y in rng.random((200, 2)):
+            v = Vector((-20 + x * 100, 10 + y * 80))
+            for d_sq in [4, 25, 100, 400]:
+                expected = all(s == v or (s - v).length_squared >= d_sq for s in self.samples)
+                self.assertEqual(self.grid.is_valid_sample(v, d_sq), expected)
+                self.assertEqual(fine_grid.is_valid_sample(v, d_sq), expected)
+        # Samples do not collide with themselves.
+        self.assertEqual(
+            self.grid.is_valid_sample(self.samples[0], 4),
+            all(s == self.samples[0] or (s - self.samples[0]).length_squared >= 4 for s in self.samples))
+
+    def test_get_level(self):
+        grid = GridStorage(Vector((100.0, 80.0)), Vector((-20.0, 10.0)), 10, fine_cell_size=3)
+        self.assertEqual(grid.get_level(9), (grid.fine, 1))
+        self.assertEqual(grid.get_level(100), (grid.coarse, 1))
+        self.assertEqual(grid.get_level(400), (grid.coarse, 2))
+        self.assertEqual(self.grid.levels, [self.grid.coarse])
+
+    def test_get_nearby_points(self):
+        v = Vector((30.0, 50.0))
+        nearby = self.grid.get_nearby_points(v, 15)
+        for s in self.samples:
+            if abs(s.x - v.x) < 10 and abs(s.y - v.y) < 10:
+                self.assertIn(s, nearby)
+        self.assertTrue(all(abs(s.x - v.x) < 20 and abs(s.y - v.y) < 20 for s in nearby))
+
+    def test_bulk_add_polyline(self):
+        grid = GridStorage(Vector((100.0, 80.0)), Vector((-20.0, 10.0)), 10, fine_cell_size=3)
+        for v in self.samples:
+            grid.add_sample(v)
+        bulk_grid = GridStorage(Vector((100.0, 80.0)), Vector((-20.0, 10.0)), 10, fine_cell_size=3)
+        bulk_grid.add_polyline(self.samples[:100])
+        bulk_grid.add_polyline(self.samples[100:])
+        self.assertEqual(bulk_grid.grid, grid.grid)
+        for level, bulk_level in zip(grid.levels, bulk_grid.levels):
+            self.assertEqual(bulk_level.cell_counts, level.cell_counts)
+            for points, bulk_points, n in zip(level.cell_points, bulk_level.cell_points, level.cell_counts):
+                np.testing.assert_array_equal(bulk_points[:n], points[:n])
+
+    def test_merge(self):
+        # Neighbouring grid, overlapping by 5 units.
+        other = GridStorage(Vector((100.0, 80.0)), Vector((75.0, 10.0)), 10)
+        rng = np.random.default_rng(2)
+        other_samples = [Vector((75 + x * 100, 10 + y * 80)) for x, y in rng.random((300, 2))]
+        other.add_polyline(other_samples)
+        self.grid.merge(other)
+
+        # Samples further than dsep from the domain are skipped.
+        near = [v for v in other_samples if v.x <= 90]
+        self.assertEqual(sum(self.grid.coarse.cell_counts), len(self.samples) + len(near))
+        all_samples = self.samples + near
+        for x, y in rng.random((200, 2)):
+            v = Vector((-20 + x * 100, 10 + y * 80))
+            for d_sq in [4, 25, 100]:
+                expected = all(s == v or (s - v).length_squared >= d_sq for s in all_samples)
+                self.assertEqual(self.grid.is_valid_sample(v, d_sq), expected)
+
+    def test_sparse(self):
+        sparse = SparseGridStorage(Vector((100.0, 80.0)), Vector((-20.0, 10.0)), 10, fine_cell_size=3)
+        sparse.add_polyline(self.samples[:100])
+        for v in self.samples[100:]:
+            sparse.add_sample(v)
+        samples, points = sparse.get_samples_and_coords()
+        expected_samples, expected_points = self.grid.get_samples_and_coords()
+        self.assertEqual(sorted(s.to_tuple() for s in samples), sorted(s.to_tuple() for s in expected_samples))
+        np.testing.assert_array_equal(points, [s.to_tuple() for s in samples])
+        for x in range(self.grid.nx):
+            for y in range(self.grid.ny):
+                self.assertEqual(list(sparse.get_cell(x, y)), self.grid.get_cell(x, y))
+
+    def test_sparse_memory(self):
+        # 50 km domain with 25 million cells, only the chunks around the samples are allocated.
+        sparse = SparseGridStorage(Vector((50000.0, 50000.0)), Vector((0.0, 0.0)), 10, fine_cell_size=2)
+        line = [Vector((20000.0 + i, 30000.0 + i / 2)) for i in range(1000)]
+        sparse.add_polyline(line)
+        self.assertEqual(sparse.nx * sparse.ny, 25000000)
+        self.assertLessEqual(len(sparse.chunks), 16)
+        self.assertLessEqual(len(sparse.fine.chunks), 64)
+        self.assertFalse(sparse.is_valid_sample(Vector((20500.5, 30250.0)), 4))
+        self.assertTrue(sparse.is_valid_sample(Vector((20500.0, 30260.0)), 4))
+        self.assertEqual(len(sparse.get_nearest_points(Vector((20100.0, 30000.0)), 3)), 3)
+        self.assertEqual(list(sparse.get_cell(0, 0)), [])
+        self.assertEqual(SparseGridLevel.chunk_index(17, 3), 19)
+
+    def test_get_nearest_points(self):
+        sparse = SparseGridStorage(Vector((100.0, 80.0)), Vector((-20.0, 10.0)), 3)
+        grid = GridStorage(Vector((100.0, 80.0)), Vector((-20.0, 10.0)), 3)
+        # Samples outside of the domain are kept in the border cells.
+        samples = self.samples + [Vector((-60.0, 40.0)), Vector((150.0, 200.0))]
+        sparse.add_polyline(samples)
+        grid.add_polyline(samples)
+        self.assertEqual(len(grid), len(samples))
+        rng = np.random.default_rng(2)
+        queries = [Vector((-50 + x * 220, -20 + y * 250)) for x, y in rng.random((50, 2))]
+        for v in queries:
+            for k in [1, 5, 40, 1000]:
+                expected = sorted((s - v).length_squared for s in samples)[:k]
+                for storage in [grid, sparse]:
+                    nearest = storage.get_nearest_points(v, k)
+                    np.testing.assert_allclose([(s - v).length_squared for s in nearest], expected)
+
+    def test_get_nearest_points_sparse(self):
+        # A single sample in a 50 km domain is found without scanning the empty cells.
+        sparse = SparseGridStorage(Vector((50000.0, 50000.0)), Vector((0.0, 0.0)), 10)
+        sparse.add_sample(Vector((49000.0, 48000.0)))
+        self.assertEqual(sparse.get_nearest_points(Vector((10.0, 10.0)), 3), [Vector((49000.0, 48000.0))])
+        self.assertEqual(SparseGridStorage(Vector((100.0, 80.0)), Vector((0.0, 0.0)), 10).get_nearest_points(
+            Vector((10.0, 10.0)), 3), [])
+
+    def test_out_of_bounds(self):
+        # Points on or outside of the border are assigned to the nearest cell.
+        self.assertEqual(self.grid.cell_coords(80.0, 90.0), (9, 7))
+        self.assertEqual(self.grid.cell_coords(-100.0, 50.0), (0, 4))
+        grid = GridStorage(Vector((100.0, 80.0)), Vector((-20.0, 10.0)), 10)
+        grid.add_sample(Vector((80.0, 90.0)))
+        self.assertFalse(grid.is_valid_sample(Vector((79.0, 89.0)), 4))
+        self.assertTrue(grid.is_valid_sample(Vector((-19.0, 11.0)), 4))
+
+
+if __name__ == "__main__":
+    unittest.main()
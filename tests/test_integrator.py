@@ -0,0 +1,94 @@
+import unittest
+import math
+import numpy as np
+from mathutils import Vector
+from ProceduralCityGenerator.tensor_field import TensorField
+from ProceduralCityGenerator.integrator import EulerIntegrator, RK4Integrator, DormandPrinceIntegrator
+from ProceduralCityGenerator.streamline_parameters import StreamlineParameters
+
+
+class TestIntegrator(unittest.TestCase):
+
+    def setUp(self):
+        self.field = TensorField()
+        self.field.add_grid(Vector((0.0, 0.0)), 500, 10, math.pi / 6)
+        self.field.add_radial(Vector((150.0, 100.0)), 300, 5)
+        self.parameters = StreamlineParameters(
+            dsep=100,
+            dtest=30,
+            dstep=1,
+            dcirclejoin=5,
+            dlookahead=200,
+            joinangle=0.1,
+            path_iterations=1500,
+            seed_tries=500,
+            simplify_tolerance=0.01,
+            collide_early=0,
+        )
+        self.points = [Vector((10.0, 20.0)), Vector((140.0, 90.0)), Vector((-50.0, 200.0))]
+
+    def test_integrate_many(self):
+        for integrator in [EulerIntegrator(self.field, self.parameters), RK4Integrator(self.field, self.parameters)]:
+            for major in [True, False]:
+                steps = integrator.integrate_many(np.array(self.points), major)
+                for point, step in zip(self.points, steps):
+                    np.testing.assert_allclose(step, integrator.integrate(point, major), atol=1e-5)
+
+    def test_sample_cache(self):
+        integrator = RK4Integrator(self.field, self.parameters, cache_size=2)
+        major, minor = integrator.sample_eigenvectors(self.points[0])
+        self.assertEqual(integrator.cache.misses, 1)
+        self.assertEqual(integrator.sample_field_vector(self.points[0], True), major)
+        self.assertEqual(integrator.sample_field_vector(self.points[0], False), minor)
+        self.assertEqual(integrator.cache.hits, 2)
+        integrator.sample_eigenvectors(self.points[1])
+        integrator.sample_eigenvectors(self.points[2])
+        self.assertEqual(len(integrator.cache.entries), 2)
+        self.assertNotIn(integrator.cache.key(self.points[0]), integrator.cache.entries)
+
+    def test_sample_cache_invalidation(self):
+        integrator = RK4Integrator(self.field, self.parameters, cache_size=16)
+        major = integrator.sample_field_vector(self.points[0], True)
+        self.field.basis_fields[0].theta = 0.0
+        self.field.invalidate()
+        self.assertEqual(integrator.cache.misses, 1)
+        self.assertNotEqual(integrator.sample_field_vector(self.points[0], True), major)
+        self.assertEqual(integrator.cache.misses, 2)
+
+    def test_dormand_prince_uniform(self):
+        field = TensorField()
+        field.add_grid(Vector((0.0, 0.0)), 10000, 1, math.pi / 6)
+        integrator = DormandPrinceIntegrator(field, self.parameters)
+        point = Vector((10.0, 20.0))
+        step_size = None
+        for i in range(5):
+            step, step_size = integrator.integrate_step(point, True, step_size)
+            point = point + step
+        self.assertAlmostEqual(step.length, self.parameters.dtest, places=4)
+        # The step size is state of the caller, 'integrate' starts from dstep.
+        self.assertAlmostEqual(integrator.integrate(point, True).length, self.parameters.dstep, places=4)
+        self.assertAlmostEqual(step.angle(Vector((math.cos(math.pi / 6), math.sin(math.pi / 6)))), 0.0, places=4)
+
+    def test_dormand_prince_refines(self):
+        field = TensorField()
+        field.add_radial(Vector((0.0, 0.0)), 10000, 1)
+        integrator = DormandPrinceIntegrator(field, self.parameters, tolerance=0.01)
+        point = Vector((20.0, 0.0))
+        step_size = None
+        for i in range(20):
+            step, step_size = integrator.integrate_step(point, True, step_size)
+            point = point + step
+            # Major streamlines of a radial field are circles around its center.
+            self.assertAlmostEqual(point.length, 20.0, delta=0.1)
+        self.assertLess(step.length, self.parameters.dtest)
+
+    def test_dormand_prince_integrate_many(self):
+        integrator = DormandPrinceIntegrator(self.field, self.parameters)
+        steps = integrator.integrate_many(np.array(self.points), True)
+        for point, step in zip(self.points, steps):
+            self.assertAlmostEqual(np.linalg.norm(step), self.parameters.dstep, places=2)
+            self.assertGreater(abs(np.dot(step, integrator.sample_field_vector(point, True))), 0.99)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+import math
+import numpy as np
+from mathutils import Vector
+from ProceduralCityGenerator.tensor import Tensor, TensorAccumulator, TensorSamples
+from ProceduralCityGenerator.tensor_field import TensorField
+from ProceduralCityGenerator.noise import NoiseTexture
+
+
+class TestNoise(unittest.TestCase):
+
+    def setUp(self):
+        self.texture = NoiseTexture(period=4, texels_per_cell=8, seed=3)
+        self.field = TensorField()
+        self.field.add_grid(Vector((0.0, 0.0)), 500, 10, math.pi / 6)
+        self.field.add_radial(Vector((150.0, 100.0)), 300, 5)
+        self.points = np.array([[10.0, 20.0], [140.0, 90.0], [-50.0, 200.0], [151.5, 99.0]])
+
+    def test_texture_tileable(self):
+        values = np.frombuffer(self.texture.values, dtype=float)
+        self.assertLessEqual(np.abs(values).max(), 1.0)
+        self.assertGreater(values.std(), 0.05)
+        for u, v in [(0.3, 0.7), (1.9, 3.99), (-2.2, 0.1)]:
+            self.assertAlmostEqual(self.texture.sample(u, v), self.texture.sample(u + 4, v - 8))
+
+    def test_texture_sample_points(self):
+        u = np.array([0.3, 1.9, -2.2, 3.99])
+        v = np.array([0.7, 3.99, 0.1, -0.01])
+        np.testing.assert_allclose(
+            self.texture.sample_points(u, v),
+            [self.texture.sample(a, b) for a, b in zip(u, v)])
+
+    def test_rotate(self):
+        tensor = Tensor(2, [0.5, -1.5])
+        acc = TensorAccumulator().set(2, 0.5, -1.5)
+        samples = TensorSamples(np.array([2.0, 2.0]), np.array([[0.5, -1.5], [0.5, -1.5]]))
+        tensor.rotate(0.4)
+        acc.rotate(0.4)
+        samples.rotate(np.array([0.4, 0.0]))
+        self.assertAlmostEqual(acc.m0, tensor.matrix[0])
+        self.assertAlmostEqual(acc.m1, tensor.matrix[1])
+        np.testing.assert_allclose(samples.matrix, [tensor.matrix, [0.5, -1.5]])
+
+    def test_field_noise(self):
+        noise_free = [self.field.sample_major(Vector(p)) for p in self.points]
+        noise = self.field.add_global_noise(50, 0.3)
+        park = self.field.add_park_noise(Vector((150.0, 100.0)), 20, 5, 1.0, seed=1)
+        self.assertFalse(park.contains(10.0, 20.0))
+
+        batch = self.field.sample_points(self.points).get_major()
+        for point, expected, major in zip(self.points, batch, noise_free):
+            point = Vector(point)
+            self.assertAlmostEqual((self.field.sample_major(point) - Vector(expected)).length, 0.0, places=5)
+            # 'Tensor.rotate' wraps theta to [0, pi), eigenvectors are compared up to sign.
+            self.assertAlmostEqual(abs(self.field.evaluate_point(point).get_major().dot(Vector(expected))), 1.0, places=5)
+        # The first point is only rotated by the global noise.
+        rotation = abs(noise.get_angle(*self.points[0]))
+        self.assertGreater(rotation, 0.0)
+        self.assertAlmostEqual(math.acos(min(1.0, abs(Vector(batch[0]).dot(noise_free[0])))), rotation, places=4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,24 @@
+import unittest
+import numpy as np
+from ProceduralCityGenerator.random_stream import RandomStream
+
+
+class TestRandomStream(unittest.TestCase):
+
+    def test_buffer_size(self):
+        a = RandomStream(7, buffer_size=3)
+        b = RandomStream(7, buffer_size=1000)
+        values = [a.random() for _ in range(10)]
+        self.assertEqual(values, [b.random() for _ in range(10)])
+        self.assertEqual(values, np.random.default_rng(7).random(10).tolist())
+
+    def test_spawn(self):
+        a, b = RandomStream.spawn(7, 2)
+        c, d = RandomStream.spawn(7, 2)
+        self.assertEqual([a.random() for _ in range(5)], [c.random() for _ in range(5)])
+        self.assertEqual([b.random() for _ in range(5)], [d.random() for _ in range(5)])
+        self.assertNotEqual(a.random(), b.random())
+
+
+if __name__ == "__main__":
+    unittest.main()
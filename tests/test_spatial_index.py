@@ -0,0 +1,153 @@
+import unittest
+import math
+import numpy as np
+from mathutils import Vector
+from ProceduralCityGenerator.grid_storage import GridStorage, SparseGridStorage
+from ProceduralCityGenerator.spatial_index import KDTree, KDTreeStorage
+from ProceduralCityGenerator.tensor_field import TensorField
+from ProceduralCityGenerator.integrator import RK4Integrator
+from ProceduralCityGenerator.streamline_parameters import StreamlineParameters
+from ProceduralCityGenerator.streamlines import StreamlineGenerator
+
+
+class TestSpatialIndex(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.samples = [Vector((-20 + x * 100, 10 + y * 80)) for x, y in rng.random((1000, 2))]
+        self.storages = [
+            GridStorage(Vector((100.0, 80.0)), Vector((-20.0, 10.0)), 10, 3),
+            KDTreeStorage(Vector((100.0, 80.0)), Vector((-20.0, 10.0)), 10, 3),
+            SparseGridStorage(Vector((100.0, 80.0)), Vector((-20.0, 10.0)), 10, 3),
+        ]
+        for storage in self.storages:
+            storage.add_polyline(self.samples)
+        self.queries = [Vector((-20 + x * 100, 10 + y * 80)) for x, y in rng.random((50, 2))]
+
+    def distance_sq(self, a, b):
+        return (a.x - b.x) ** 2 + (a.y - b.y) ** 2
+
+    def test_kd_tree(self):
+        points = np.random.default_rng(1).random((500, 2))
+        tree = KDTree(points, np.arange(500))
+        self.assertEqual(sorted(tree.ids), list(range(500)))
+        np.testing.assert_array_equal(tree.points, points[tree.ids])
+        for node, (start, end) in enumerate(zip(tree.start, tree.end)):
+            if tree.left[node] < 0:
+                self.assertLessEqual(end - start, KDTree.LEAF_SIZE)
+
+    def test_storage_buffer(self):
+        kd_storage = self.storages[1]
+        self.assertEqual(len(kd_storage), len(self.samples))
+        self.assertEqual(kd_storage.buffer_count, len(self.samples) % KDTreeStorage.BUFFER_SIZE)
+        self.assertEqual(sum(len(tree) for tree in kd_storage.trees) + kd_storage.buffer_count, len(self.samples))
+        self.assertEqual(list(kd_storage.get_samples()), self.samples)
+
+    def test_merge(self):
+        for storage in [GridStorage, KDTreeStorage, SparseGridStorage]:
+            for other in self.storages:
+                merged = storage(Vector((100.0, 80.0)), Vector((-20.0, 10.0)), 10, 3)
+                merged.add_polyline(self.samples[:10])
+                merged.merge(other)
+                samples, points = merged.get_samples_and_coords()
+                self.assertEqual(len(samples), len(self.samples) + 10)
+                np.testing.assert_array_equal(points, [s.to_tuple() for s in samples])
+
+    def test_is_valid_sample(self):
+        for v in self.queries + self.samples[:10]:
+            for d_sq in [1, 9, 100, 400]:
+                expected = all(s == v or self.distance_sq(s, v) >= d_sq for s in self.samples)
+                for storage in self.storages:
+                    self.assertEqual(storage.is_valid_sample(v, d_sq), expected)
+
+    def test_are_valid_samples(self):
+        points = np.array([(v.x + i, v.y - i / 2) for i, v in enumerate(self.queries[:5])] + [self.samples[0].to_tuple()])
+        for d_sq in [1, 9, 100]:
+            expected = [self.storages[0].is_valid_sample(Vector(p), d_sq) for p in points.tolist()]
+            for storage in self.storages:
+                self.assertEqual(storage.are_valid_samples(points, d_sq).tolist(), expected)
+                self.assertEqual(storage.are_valid_samples(np.empty((0, 2)), d_sq).tolist(), [])
+
+    def test_get_nearby_points_coords(self):
+        for v in self.queries[:10]:
+            for storage in self.storages:
+                self.assertEqual(
+                    [tuple(p) for p in storage.get_nearby_points_coords(v.x, v.y, 25).tolist()],
+                    [s.to_tuple() for s in storage.get_nearby_points(v, 25)])
+
+    def test_get_points_in_radius(self):
+        for v in self.queries:
+            for distance in [3, 10, 25]:
+                expected = sorted(s.to_tuple() for s in self.samples if self.distance_sq(s, v) <= distance ** 2)
+                for storage in self.storages:
+                    self.assertEqual(sorted(s.to_tuple() for s in storage.get_points_in_radius(v, distance)), expected)
+
+    def test_get_nearest_points(self):
+        for v in self.queries:
+            for k in [1, 5, 40]:
+                expected = sorted(self.distance_sq(s, v) for s in self.samples)[:k]
+                for storage in self.storages:
+                    nearest = storage.get_nearest_points(v, k)
+                    self.assertEqual(len(nearest), k)
+                    np.testing.assert_allclose([self.distance_sq(s, v) for s in nearest], expected)
+        for storage in self.storages:
+            self.assertEqual(len(storage.get_nearest_points(self.queries[0], 2000)), len(self.samples))
+
+    def test_generator_storage(self):
+        field = TensorField()
+        field.add_grid(Vector((0.0, 0.0)), 500, 10, math.pi / 6)
+        parameters = StreamlineParameters(
+            dsep=20,
+            dtest=15,
+            dstep=1,
+            dcirclejoin=5,
+            dlookahead=40,
+            joinangle=0.1,
+            path_iterations=300,
+            seed_tries=100,
+            simplify_tolerance=0.5,
+            collide_early=0,
+        )
+        generator = StreamlineGenerator(
+            RK4Integrator(field, parameters),
+            Vector((0.0, 0.0)),
+            Vector((200.0, 200.0)),
+            parameters,
+            storage=KDTreeStorage)
+        generator.create_all_streamlines()
+        self.assertIsInstance(generator.major_grid, KDTreeStorage)
+        self.assertGreater(len(generator.all_streamlines), 2)
+        self.assertEqual(len(generator.major_grid), sum(len(s) for s in generator.streamlines_major))
+
+    def test_sparse_generator_storage(self):
+        field = TensorField()
+        field.add_grid(Vector((0.0, 0.0)), 500, 10, math.pi / 6)
+        parameters = StreamlineParameters(
+            dsep=20,
+            dtest=15,
+            dstep=1,
+            dcirclejoin=5,
+            dlookahead=40,
+            joinangle=0.1,
+            path_iterations=300,
+            seed_tries=100,
+            simplify_tolerance=0.5,
+            collide_early=0,
+        )
+        for distance_raster, free_space_seeds in [(False, True), (True, False)]:
+            with self.assertRaises(ValueError):
+                StreamlineGenerator(
+                    RK4Integrator(field, parameters), Vector((0.0, 0.0)), Vector((200.0, 200.0)), parameters,
+                    storage=SparseGridStorage, distance_raster=distance_raster, free_space_seeds=free_space_seeds)
+        with self.assertRaises(ValueError):
+            self.storages[2].add_free_space()
+        generator = StreamlineGenerator(
+            RK4Integrator(field, parameters), Vector((0.0, 0.0)), Vector((200.0, 200.0)), parameters,
+            storage=SparseGridStorage, free_space_seeds=False, seed=0)
+        generator.create_all_streamlines()
+        self.assertIsNone(generator.major_grid.free_space)
+        self.assertGreater(len(generator.all_streamlines), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+import tempfile
+import numpy as np
+from ProceduralCityGenerator.streaming import StreamingStreamlineGenerator, read_tile
+from test_tiling import TilingFixture
+
+
+class TestStreaming(TilingFixture, unittest.TestCase):
+
+    def test_write_tiles(self):
+        streaming = self.create_tiled_generator(generator_type=StreamingStreamlineGenerator)
+        with tempfile.TemporaryDirectory() as directory:
+            paths = streaming.create_all_streamlines(directory)
+            self.assertEqual(len(paths), 6)
+            # Only the boundary samples of the last tiles_y + 1 tiles are kept.
+            self.assertEqual(sorted(streaming.tile_streamlines), [3, 4, 5])
+            tiles = [read_tile(path) for path in paths]
+
+        for tile in tiles:
+            self.assertEqual(tile['offsets'][-1], len(tile['points']))
+            self.assertEqual(len(tile['major']), len(tile['offsets']) - 1)
+            self.assertEqual(len(tile['simple_offsets']), len(tile['offsets']))
+            self.assertEqual(tile['section_offsets'][-1], len(tile['section_points']))
+            self.assertEqual(len(tile['section_streamlines']), len(tile['section_offsets']) - 1)
+            self.assertEqual(len(tile['node_types']), len(tile['nodes']))
+
+        # The first tile has no halo, as in TiledStreamlineGenerator.
+        tiled = self.create_tiled_generator()
+        streamlines = tiled.trace_tile(0, tiled.get_halo(0))
+        np.testing.assert_array_equal(tiles[0]['points'], np.concatenate([points for _, points, _ in streamlines]))
+        np.testing.assert_array_equal(tiles[0]['simple_points'], np.concatenate([simple for _, _, simple in streamlines]))
+        np.testing.assert_array_equal(tiles[0]['major'], [major for major, _, _ in streamlines])
+
+    def test_boundary_samples(self):
+        streaming = self.create_tiled_generator(generator_type=StreamingStreamlineGenerator)
+        generator = streaming.trace_tile_generator(4, streaming.get_halo(4))
+        boundary = streaming.get_boundary_samples(4, generator)
+        origin = streaming.get_tile_origin(4)
+        end = origin + streaming.tile_dimensions
+        self.assertEqual([major for major, _ in boundary], [True, False])
+        for major, points in boundary:
+            all_points = np.array([p.to_tuple() for s in generator.streamlines(major) for p in s])
+            self.assertLess(len(points), len(all_points))
+            self.assertTrue(all(min(x - origin.x, end.x - x, y - origin.y, end.y - y) < 20 for x, y in points))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+import unittest
+import math
+import numpy as np
+from mathutils import Vector
+from ProceduralCityGenerator.tensor_field import TensorField
+from ProceduralCityGenerator.integrator import RK4Integrator
+from ProceduralCityGenerator.streamline_parameters import StreamlineParameters
+from ProceduralCityGenerator.streamlines import StreamlineGenerator
+from ProceduralCityGenerator.streamline_store import StreamlineStore
+from ProceduralCityGenerator.simplify import simplify, simplify_array
+from ProceduralCityGenerator.graph import Graph
+
+
+class TestStreamlineStore(unittest.TestCase):
+
+    def setUp(self):
+        self.field = TensorField()
+        self.field.add_grid(Vector((0.0, 0.0)), 500, 10, math.pi / 6)
+        self.field.add_radial(Vector((150.0, 100.0)), 300, 5)
+        self.parameters = StreamlineParameters(
+            dsep=20,
+            dtest=15,
+            dstep=1,
+            dcirclejoin=5,
+            dlookahead=40,
+            joinangle=0.1,
+            path_iterations=300,
+            seed_tries=100,
+            simplify_tolerance=0.5,
+            collide_early=0,
+        )
+        self.generator = self.create_generator()
+        self.generator.create_all_streamlines()
+
+    def create_generator(self):
+        return StreamlineGenerator(
+            RK4Integrator(self.field, self.parameters),
+            Vector((-100.0, -100.0)),
+            Vector((300.0, 300.0)),
+            self.parameters,
+            seed=2)
+
+    def get_points(self, streamline):
+        return [p.to_tuple() for p in streamline]
+
+    def test_from_generator(self):
+        generator = self.generator
+        store = generator.get_store()
+        self.assertEqual(len(store), len(generator.all_streamlines))
+        self.assertEqual(len(store.points), sum(len(s) for s in generator.all_streamlines))
+        self.assertEqual(store.offsets[-1], len(store.points))
+        for i, streamline in enumerate(generator.all_streamlines):
+            self.assertEqual([tuple(p) for p in store[i].tolist()], self.get_points(streamline))
+            self.assertTrue(np.shares_memory(store[i], store.points))
+            self.assertEqual(store.major[i], any(s is streamline for s in generator.streamlines_major))
+            self.assertEqual(store.circle[i], streamline[0] == streamline[-1])
+            self.assertEqual(self.get_points(store.to_polyline(i)), self.get_points(streamline))
+        self.assertEqual(len(store.streamlines(True)) + len(store.streamlines(False)), len(store))
+        self.assertTrue(store.circle.any())
+
+        compact = generator.get_store(dtype=np.float32)
+        self.assertEqual(compact.points.dtype, np.float32)
+        self.assertLess(compact.nbytes, store.nbytes)
+
+        simple = generator.get_store(simple=True)
+        for i, streamline in enumerate(generator.all_streamlines_simple):
+            self.assertEqual([tuple(p) for p in simple[i].tolist()], self.get_points(streamline))
+        np.testing.assert_array_equal(simple.major, store.major)
+
+    def test_append(self):
+        store = StreamlineStore()
+        lines = [np.arange(2 * n, dtype=float).reshape(-1, 2) for n in range(1, 400, 7)]
+        for i, line in enumerate(lines):
+            store.append(line, i % 2 == 0)
+        self.assertEqual(len(store), len(lines))
+        self.assertGreater(len(store.buffer), StreamlineStore.INITIAL_CAPACITY)
+        for line, stored in zip(lines, store):
+            np.testing.assert_array_equal(stored, line)
+        np.testing.assert_array_equal(store[-1], lines[-1])
+        self.assertEqual(store.major.tolist(), [i % 2 == 0 for i in range(len(lines))])
+        with self.assertRaises(IndexError):
+            store[len(lines)]
+
+    def test_simplify_array(self):
+        for streamline in self.generator.all_streamlines:
+            for tolerance in [0.1, 0.5, 5]:
+                points = np.array(self.get_points(streamline))
+                self.assertEqual(
+                    [tuple(p) for p in simplify_array(points, tolerance).tolist()],
+                    self.get_points(simplify(streamline, tolerance)))
+        simple = self.generator.get_store().simplify(self.parameters.simplify_tolerance)
+        self.assertEqual(
+            [[tuple(p) for p in s.tolist()] for s in simple],
+            [self.get_points(s) for s in self.generator.all_streamlines_simple])
+
+    def test_add_store(self):
+        generator = self.create_generator()
+        generator.add_store(self.generator.get_store())
+        self.assertEqual(
+            [self.get_points(s) for s in generator.all_streamlines],
+            [self.get_points(s) for s in self.generator.all_streamlines])
+        self.assertEqual(len(generator.streamlines_major), len(self.generator.streamlines_major))
+        self.assertEqual(
+            len(list(generator.major_grid.get_samples())),
+            sum(len(s) for s in self.generator.streamlines_major))
+        self.assertEqual(
+            [self.get_points(s) for s in generator.all_streamlines_simple],
+            [self.get_points(s) for s in self.generator.all_streamlines_simple])
+
+        # The last streamlines of the store are removed with their simplified forms.
+        removed, removed_simple = generator.remove_streamlines(list(generator.all_streamlines)[-3:])
+        self.assertEqual(len(removed), 3)
+        self.assertEqual(
+            [self.get_points(s) for s in removed_simple],
+            [self.get_points(s) for s in list(self.generator.all_streamlines_simple)[-3:]])
+        self.assertEqual(len(generator.all_streamlines_simple), len(generator.all_streamlines))
+
+    def test_graph(self):
+        graph = Graph(self.generator)
+        store_graph = Graph(self.generator, store=self.generator.get_store(simple=True))
+        self.assertEqual(
+            [node.co.to_tuple() for node in store_graph.nodes], [node.co.to_tuple() for node in graph.nodes])
+        self.assertEqual(
+            [[self.get_points(section) for section in sections] for sections in store_graph.streamline_sections],
+            [[self.get_points(section) for section in sections] for sections in graph.streamline_sections])
+        self.assertEqual(len(store_graph.segment_boxes), sum(len(s) - 1 for s in self.generator.all_streamlines_simple))
+
+        compact_graph = Graph(self.generator, store=self.generator.get_store(simple=True, dtype=np.float32))
+        self.assertEqual(
+            [node.co.to_tuple() for node in compact_graph.nodes], [node.co.to_tuple() for node in graph.nodes])
+
+
+if __name__ == "__main__":
+    unittest.main()
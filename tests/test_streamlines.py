@@ -0,0 +1,331 @@
+import unittest
+import math
+import numpy as np
+from mathutils import Vector
+from ProceduralCityGenerator.tensor_field import TensorField
+from ProceduralCityGenerator.integrator import RK4Integrator, DormandPrinceIntegrator
+from ProceduralCityGenerator.streamline_parameters import StreamlineParameters
+from ProceduralCityGenerator.streamlines import StreamlineGenerator
+from ProceduralCityGenerator.stepper import StreamlineStepper, GraphStepper
+from ProceduralCityGenerator.graph import Graph
+
+
+class TestStreamlines(unittest.TestCase):
+
+    def setUp(self):
+        self.field = TensorField()
+        self.field.add_grid(Vector((0.0, 0.0)), 500, 10, math.pi / 6)
+        self.field.add_radial(Vector((150.0, 100.0)), 300, 5)
+        self.parameters = StreamlineParameters(
+            dsep=20,
+            dtest=15,
+            dstep=1,
+            dcirclejoin=5,
+            dlookahead=40,
+            joinangle=0.1,
+            path_iterations=300,
+            seed_tries=300,
+            simplify_tolerance=0.5,
+            collide_early=0,
+        )
+        self.seeds = [Vector((10.0, 20.0)), Vector((140.0, 90.0)), Vector((-50.0, 200.0))]
+
+    def create_generator(self):
+        integrator = RK4Integrator(self.field, self.parameters)
+        return StreamlineGenerator(integrator, Vector((-200.0, -200.0)), Vector((500.0, 500.0)), self.parameters)
+
+    def assert_streamlines_equal(self, a, b):
+        self.assertEqual(len(a), len(b))
+        np.testing.assert_allclose([p.to_tuple() for p in a], [p.to_tuple() for p in b], atol=1e-3)
+
+    def test_batch_fronts(self):
+        generator = self.create_generator()
+        batch_generator = self.create_generator()
+        batch_generator.BATCH_FRONTS = True
+        for major in [True, False]:
+            for seed in self.seeds:
+                self.assert_streamlines_equal(
+                    batch_generator.integrate_streamline(seed, major),
+                    generator.integrate_streamline(seed, major))
+
+    def test_integrate_streamlines(self):
+        generator = self.create_generator()
+        streamlines = generator.integrate_streamlines(self.seeds, True)
+        self.assertEqual(len(streamlines), len(self.seeds))
+        for seed, streamline in zip(self.seeds, streamlines):
+            self.assert_streamlines_equal(streamline, generator.integrate_streamline(seed, True))
+
+    def test_seed(self):
+        streamlines = []
+        for seed in [3, 3, 4]:
+            generator = StreamlineGenerator(
+                RK4Integrator(self.field, self.parameters),
+                Vector((-200.0, -200.0)),
+                Vector((300.0, 300.0)),
+                self.parameters,
+                seed=seed)
+            generator.create_all_streamlines()
+            streamlines.append([[p.to_tuple() for p in s] for s in generator.all_streamlines])
+        self.assertEqual(streamlines[0], streamlines[1])
+        self.assertNotEqual(streamlines[0], streamlines[2])
+
+    def create_seeded_generator(self):
+        return StreamlineGenerator(
+            RK4Integrator(self.field, self.parameters),
+            Vector((-200.0, -200.0)),
+            Vector((300.0, 300.0)),
+            self.parameters,
+            seed=5)
+
+    def get_streamlines(self, streamlines):
+        return [[p.to_tuple() for p in s] for s in streamlines]
+
+    def test_stepper(self):
+        generator = self.create_seeded_generator()
+        generator.create_all_streamlines()
+
+        stepped_generator = self.create_seeded_generator()
+        simple = stepped_generator.all_streamlines_simple
+        listened = []
+        stepped_generator.streamline_listeners.append(listened.append)
+        progress = []
+        finished = []
+        stepper = StreamlineStepper(
+            stepped_generator,
+            budget_ms=0,
+            on_progress=lambda s: progress.append(s.progress),
+            on_finished=finished.append)
+        # Join the ends in several batches.
+        stepper.JOIN_ENDS = 4
+        steps = 0
+        while stepper.timer() is not None:
+            steps += 1
+        self.assertTrue(stepper.done)
+        self.assertEqual(finished, [stepper])
+        self.assertGreater(len(stepper.join.ends), stepper.JOIN_ENDS)
+        self.assertGreater(steps, len(generator.all_streamlines))
+        self.assertEqual(progress, sorted(progress))
+        self.assertEqual(progress[-1], 1.0)
+        self.assertEqual(
+            self.get_streamlines(stepped_generator.all_streamlines), self.get_streamlines(generator.all_streamlines))
+        self.assertEqual(
+            self.get_streamlines(stepped_generator.all_streamlines_simple),
+            self.get_streamlines(generator.all_streamlines_simple))
+        # The simplified streamlines of the extended streamlines are replaced in place.
+        self.assertIs(stepped_generator.all_streamlines_simple, simple)
+        updated = [a for a in listened if a.updated]
+        self.assertGreater(len(updated), 0)
+        for a in updated:
+            self.assertIs(a.simple, simple[a.index])
+
+    def test_stepper_bake(self):
+        fields = []
+        for i in range(2):
+            field = TensorField()
+            field.add_grid(Vector((0.0, 0.0)), 500, 10, math.pi / 6)
+            field.add_radial(Vector((150.0, 100.0)), 300, 5)
+            fields.append(field)
+        generator = StreamlineGenerator(
+            RK4Integrator(fields[0], self.parameters), Vector((-200.0, -200.0)), Vector((300.0, 300.0)), self.parameters, seed=5)
+        fields[0].bake(generator.origin, generator.world_dimensions, 2)
+        generator.create_all_streamlines()
+
+        stepped_generator = StreamlineGenerator(
+            RK4Integrator(fields[1], self.parameters), Vector((-200.0, -200.0)), Vector((300.0, 300.0)), self.parameters, seed=5)
+        progress = []
+        stepper = StreamlineStepper(
+            stepped_generator, budget_ms=0, on_progress=lambda s: progress.append(s.progress), bake_resolution=2)
+        self.assertEqual(stepper.phase, StreamlineStepper.BAKING)
+        self.assertIsNone(fields[1].baked)
+        while stepper.timer() is not None:
+            pass
+        self.assertIs(fields[1].baked, stepper.baked)
+        self.assertEqual(progress, sorted(progress))
+        self.assertEqual(progress[-1], 1.0)
+        self.assertEqual(
+            self.get_streamlines(stepped_generator.all_streamlines_simple),
+            self.get_streamlines(generator.all_streamlines_simple))
+
+    def test_graph_stepper(self):
+        generator = self.create_seeded_generator()
+        generator.create_all_streamlines()
+        graph = Graph(generator)
+
+        progress = []
+        finished = []
+        stepper = GraphStepper(
+            generator, budget_ms=0, on_progress=lambda s: progress.append(s.progress), on_finished=finished.append)
+        steps = 0
+        while stepper.timer() is not None:
+            steps += 1
+        self.assertEqual(finished, [stepper])
+        self.assertGreater(steps, len(graph.all_streamlines))
+        self.assertEqual(progress, sorted(progress))
+        self.assertEqual(progress[-1], 1.0)
+        self.assertEqual([n.co.to_tuple() for n in stepper.graph.nodes], [n.co.to_tuple() for n in graph.nodes])
+        self.assertEqual(
+            [[len(n.neighbors), len(n.border_neighbors)] for n in stepper.graph.nodes],
+            [[len(n.neighbors), len(n.border_neighbors)] for n in graph.nodes])
+
+    def test_update(self):
+        generator = self.create_seeded_generator()
+        generator.streamlines_done = False
+        generator.last_streamline_major = False
+        while generator.update():
+            pass
+        self.assertTrue(generator.streamlines_done)
+        expected = self.create_seeded_generator()
+        expected.create_all_streamlines()
+        self.assertEqual(self.get_streamlines(generator.all_streamlines), self.get_streamlines(expected.all_streamlines))
+
+    def test_iter_streamlines(self):
+        generator = self.create_seeded_generator()
+        generator.create_all_streamlines()
+
+        iter_generator = self.create_seeded_generator()
+        listened = []
+        iter_generator.streamline_listeners.append(listened.append)
+        accepted = []
+        for streamline in iter_generator.iter_streamlines():
+            if not streamline.updated:
+                # Streamlines are yielded as soon as they are accepted.
+                self.assertIs(iter_generator.all_streamlines[-1], streamline.streamline)
+            accepted.append(streamline)
+        self.assertEqual(iter_generator.streamline_listeners, [listened.append])
+
+        new = [a for a in accepted if not a.updated]
+        updated = [a for a in accepted if a.updated]
+        # Listeners receive the same records, including those of the join pass.
+        self.assertEqual(
+            [(a.streamline, a.simple, a.major, a.index, a.updated) for a in accepted],
+            [(a.streamline, a.simple, a.major, a.index, a.updated) for a in listened])
+        self.assertEqual(
+            self.get_streamlines(a.streamline for a in new), self.get_streamlines(generator.all_streamlines))
+        self.assertEqual([a.index for a in new], list(range(len(new))))
+        self.assertEqual(
+            [a.major for a in new], [any(s is a.streamline for s in iter_generator.streamlines_major) for a in new])
+        self.assertGreater(len(updated), 0)
+        for a in updated:
+            self.assertIs(a.simple, iter_generator.all_streamlines_simple[a.index])
+        self.assertEqual(
+            self.get_streamlines(iter_generator.all_streamlines_simple),
+            self.get_streamlines(generator.all_streamlines_simple))
+
+    def test_join_dangling_streamlines(self):
+        generators = []
+        for _ in range(2):
+            generator = self.create_seeded_generator()
+            major = True
+            while generator.create_streamline(major):
+                major = not major
+            generators.append(generator)
+        generator, expected = generators
+
+        simple = list(generator.all_streamlines_simple)
+        joined = generator.join_dangling_streamlines()
+        expected_joined = [
+            streamline
+            for major in [True, False]
+            for streamline in expected.streamlines(major)
+            if expected.join_dangling_streamline(streamline, major)
+        ]
+        self.assertGreater(len(joined), 0)
+        self.assertEqual(self.get_streamlines(joined), self.get_streamlines(expected_joined))
+        self.assertEqual(self.get_streamlines(generator.all_streamlines), self.get_streamlines(expected.all_streamlines))
+        self.assertEqual(
+            self.get_streamlines(generator.all_streamlines_simple),
+            self.get_streamlines(expected.simplify_streamline(s) for s in expected.all_streamlines))
+        # Only the extended streamlines are simplified again.
+        joined_ids = {id(s) for s in joined}
+        for streamline, before, after in zip(generator.all_streamlines, simple, generator.all_streamlines_simple):
+            self.assertEqual(after is before, id(streamline) not in joined_ids)
+
+    def test_speculative_batch(self):
+        self.parameters.collide_early = 0.5
+        for batch_fronts in [False, True]:
+            streamlines = []
+            for speculative_batch in [0, 4]:
+                generator = StreamlineGenerator(
+                    RK4Integrator(self.field, self.parameters),
+                    Vector((-200.0, -200.0)),
+                    Vector((300.0, 300.0)),
+                    self.parameters,
+                    seed=5,
+                    free_space_seeds=False)
+                generator.BATCH_FRONTS = batch_fronts
+                generator.SPECULATIVE_BATCH = speculative_batch
+                generator.create_all_streamlines()
+                streamlines.append(self.get_streamlines(generator.all_streamlines))
+            self.assertGreater(len(streamlines[0]), 4)
+            self.assertEqual(streamlines[1], streamlines[0])
+
+    def test_integration_chunk(self):
+        self.parameters.collide_early = 0.5
+        generator = self.create_seeded_generator()
+        generator.create_all_streamlines()
+        for chunk in [1, 7, 64]:
+            chunked_generator = self.create_seeded_generator()
+            chunked_generator.INTEGRATION_CHUNK = chunk
+            chunked_generator.create_all_streamlines()
+            self.assertEqual(
+                self.get_streamlines(chunked_generator.all_streamlines),
+                self.get_streamlines(generator.all_streamlines))
+
+    def test_adaptive_step_size(self):
+        # The step size of the adaptive integrator is kept per front, so chunked and
+        # speculative tracing give the same streamlines as tracing one step at a time.
+        self.parameters.collide_early = 0.5
+        streamlines = []
+        for chunk, speculative_batch in [(0, 0), (8, 0), (64, 0), (0, 4)]:
+            generator = StreamlineGenerator(
+                DormandPrinceIntegrator(self.field, self.parameters),
+                Vector((-200.0, -200.0)),
+                Vector((300.0, 300.0)),
+                self.parameters,
+                seed=5,
+                free_space_seeds=False)
+            generator.INTEGRATION_CHUNK = chunk
+            generator.SPECULATIVE_BATCH = speculative_batch
+            generator.create_all_streamlines()
+            streamlines.append(self.get_streamlines(generator.all_streamlines))
+        self.assertGreater(len(streamlines[0]), 4)
+        for chunked in streamlines[1:]:
+            self.assertEqual(chunked, streamlines[0])
+
+    def test_valid_streamline(self):
+        generator = self.create_generator()
+        adaptive_generator = StreamlineGenerator(
+            DormandPrinceIntegrator(self.field, self.parameters),
+            Vector((-200.0, -200.0)),
+            Vector((500.0, 500.0)),
+            self.parameters)
+        # A road of four adaptive steps, each dtest long.
+        road = [Vector((15.0 * i, 0.0)) for i in range(5)]
+        self.assertFalse(generator.valid_streamline(road))
+        self.assertTrue(adaptive_generator.valid_streamline(road))
+        steps = [Vector((0.5 * i, 0.0)) for i in range(10)]
+        self.assertTrue(generator.valid_streamline(steps))
+        self.assertFalse(adaptive_generator.valid_streamline(steps))
+        # Short roads can be joined as well.
+        self.assertEqual(adaptive_generator.get_end(road[:3], True), (road[0], road[2]))
+        self.assertEqual(adaptive_generator.get_end(road[:3], False), (road[2], road[0]))
+        self.assertEqual(adaptive_generator.get_end(road, False), (road[4], road[1]))
+
+    def test_add_existing_streamlines(self):
+        generator = self.create_generator()
+        generator.create_all_streamlines()
+        neighbour = StreamlineGenerator(
+            RK4Integrator(self.field, self.parameters),
+            Vector((290.0, -200.0)),
+            Vector((500.0, 500.0)),
+            self.parameters)
+        neighbour.add_existing_streamlines(generator)
+        samples = [p for s in generator.streamlines_major for p in s]
+        near = [p for p in samples if p.x >= 290.0 - self.parameters.dsep]
+        self.assertGreater(len(near), 0)
+        self.assertEqual(len(list(neighbour.major_grid.get_samples())), len(near))
+        self.assertFalse(neighbour.major_grid.is_valid_sample(near[0] + Vector((0.5, 0.0))))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,8 @@
 import unittest
 import math
+import numpy as np
 from mathutils import Vector
-from ProceduralCityGenerator.tensor import Tensor
+from ProceduralCityGenerator.tensor import Tensor, TensorAccumulator, TensorSamples
 
 
 class TestTensor(unittest.TestCase):
@@ -76,6 +77,51 @@ class TestTensor(unittest.TestCase):
         self.assertEqual(t_1.theta, math.pi / 8)
         self.assertEqual(t_1.get_major(), Vector((math.cos(math.pi / 8), math.sin(math.pi / 8))))
 
+    def test_tensor_samples_zero(self):
+        tensors = TensorSamples.zero(3)
+        self.assertEqual(len(tensors), 3)
+        np.testing.assert_array_equal(tensors.theta, np.zeros(3))
+        np.testing.assert_array_equal(tensors.get_major(), np.zeros((3, 2)))
+
+    def test_tensor_samples_add(self):
+        thetas = [math.pi / 4, 0.0, -math.pi / 3]
+        matrix = np.array([[math.cos(2 * theta), math.sin(2 * theta)] for theta in thetas])
+        for smooth in [False, True]:
+            tensors = TensorSamples.zero(3).add(TensorSamples(np.ones(3), matrix), smooth)
+            tensors.add(TensorSamples(np.ones(3), np.array([[1.0, 0.0]] * 3)), smooth)
+            for i, theta in enumerate(thetas):
+                tensor = Tensor.zero().add(Tensor(1, list(matrix[i])), smooth).add(Tensor(1, [1.0, 0.0]), smooth)
+                self.assertAlmostEqual(tensors.r[i], tensor.r)
+                self.assertAlmostEqual(tensors.theta[i], tensor.theta)
+                np.testing.assert_allclose(tensors.get_major()[i], tensor.get_major(), atol=1e-6)
+                np.testing.assert_allclose(tensors.get_minor()[i], tensor.get_minor(), atol=1e-6)
+
+    def test_tensor_accumulator(self):
+        tensors = [(1.0, [0.0, 1.0]), (0.5, [-1.0, 0.2]), (0.0, [3.0, 4.0]), (2.0, [-0.3, -0.9])]
+        for smooth in [False, True]:
+            tensor = Tensor.zero()
+            acc = TensorAccumulator(smooth)
+            for r, matrix in tensors:
+                tensor.add(Tensor(r, list(matrix)), smooth)
+                acc.add(matrix[0], matrix[1], r)
+                self.assertAlmostEqual(acc.r, tensor.r)
+                self.assertAlmostEqual(acc.m0, tensor.matrix[0])
+                self.assertAlmostEqual(acc.m1, tensor.matrix[1])
+                major, minor = acc.get_major_minor()
+                self.assertAlmostEqual((major - tensor.get_major()).length, 0.0, places=6)
+                self.assertAlmostEqual((minor - tensor.get_minor()).length, 0.0, places=6)
+            tensor.skip(3, smooth)
+            acc.skip(3)
+            self.assertAlmostEqual(acc.to_tensor().theta, tensor.theta)
+
+    def test_tensor_accumulator_half_angle(self):
+        acc = TensorAccumulator()
+        for theta in [0.0, 0.3, math.pi / 4, math.pi / 2, -math.pi / 3, -1.5]:
+            acc.reset().add(math.cos(2 * theta), math.sin(2 * theta), 1.0)
+            self.assertAlmostEqual((acc.get_major() - Vector((math.cos(theta), math.sin(theta)))).length, 0.0, places=6)
+            self.assertAlmostEqual((acc.get_minor() - Tensor(1, [acc.m0, acc.m1]).get_minor()).length, 0.0, places=6)
+        self.assertEqual(TensorAccumulator().get_major(), Vector((0.0, 0.0)))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,8 +1,10 @@
 import unittest
 import math
+import numpy as np
 from mathutils import Vector
 from ProceduralCityGenerator.tensor import Tensor
 from ProceduralCityGenerator.tensor_field import TensorField
+from ProceduralCityGenerator.baked_field import BakedTensorField
 from ProceduralCityGenerator.basis_field import GridBasisField, RadialBasisField
 
 
@@ -82,6 +84,122 @@ class TestTensorField(unittest.TestCase):
         self.assertEqual(sample.theta, tensor.theta)
         self.assertEqual(sample.get_major(), tensor.get_major())
 
+    def test_sample_points_empty(self):
+        tensor_field = TensorField()
+        tensors = tensor_field.sample_points(np.zeros((4, 2)))
+        np.testing.assert_array_equal(tensors.r, np.ones(4))
+        np.testing.assert_array_equal(tensors.matrix, np.zeros((4, 2)))
+
+    def test_sample_points_multi(self):
+        tensor_field = TensorField()
+        tensor_field.add_grid(Vector((0.0, 0.0)), 250, 10, math.pi / 4)
+        tensor_field.add_radial(Vector((50.0, 10.0)), 250, 10)
+        tensor_field.add_radial(Vector((100.0, 300.0)), 250, 10)
+        points = np.array([[40.0, 40.0], [120.0, 250.0], [-30.0, 10.0], [600.0, 600.0]])
+        for smooth in [False, True]:
+            tensor_field.smooth = smooth
+            tensors = tensor_field.sample_points(points)
+            for i, point in enumerate(points):
+                tensor = tensor_field.sample_point(Vector(point))
+                self.assertAlmostEqual(tensors.r[i] / tensor.r, 1.0, places=5)
+                np.testing.assert_allclose(tensors.get_major()[i], tensor.get_major(), atol=1e-5)
+                np.testing.assert_allclose(tensors.get_minor()[i], tensor.get_minor(), atol=1e-5)
+
+    def test_bake(self):
+        tensor_field = TensorField()
+        tensor_field.add_grid(Vector((0.0, 0.0)), 250, 10, math.pi / 4)
+        tensor_field.add_radial(Vector((50.0, 10.0)), 250, 10)
+        baked = tensor_field.bake(Vector((-100.0, -100.0)), Vector((300.0, 300.0)), 1)
+        self.assertIs(tensor_field.baked, baked)
+        for point in [Vector((40.0, 40.0)), Vector((-30.5, 10.25)), Vector((199.9, -99.0))]:
+            sample = tensor_field.sample_point(point)
+            self.assertAlmostEqual(sample.theta, tensor_field.evaluate_point(point).theta, places=2)
+        points = np.array([[40.0, 40.0], [-30.5, 10.25], [500.0, 500.0]])
+        tensors = tensor_field.sample_points(points)
+        np.testing.assert_allclose(tensors.theta, tensor_field.evaluate_points(points).theta, atol=1e-2)
+        report = baked.error_report(n_samples=1000)
+        self.assertEqual(report['resolution'], 1)
+        self.assertLess(report['mean_error'], 1e-2)
+        self.assertLessEqual(report['mean_error'], report['max_error'])
+
+    def test_bake_deferred(self):
+        for smooth in [False, True]:
+            tensor_field = TensorField()
+            tensor_field.add_grid(Vector((0.0, 0.0)), 250, 10, math.pi / 4)
+            tensor_field.add_radial(Vector((50.0, 10.0)), 250, 10)
+            tensor_field.smooth = smooth
+            deferred = BakedTensorField(tensor_field, Vector((-100.0, -100.0)), Vector((300.0, 300.0)), 4, deferred=True)
+            self.assertFalse(deferred.done)
+            calls = 1
+            while deferred.bake_columns(7):
+                calls += 1
+            self.assertTrue(deferred.done)
+            self.assertEqual(calls, math.ceil(deferred.nx / 7))
+            baked = tensor_field.bake(Vector((-100.0, -100.0)), Vector((300.0, 300.0)), 4)
+            for values, expected in [(deferred.r, baked.r), (deferred.m0, baked.m0), (deferred.m1, baked.m1)]:
+                np.testing.assert_allclose(values, expected, atol=1e-12)
+
+    def test_bake_invalidation(self):
+        tensor_field = TensorField()
+        origin = Vector((0.0, 0.0))
+        dimensions = Vector((100.0, 100.0))
+        tensor_field.bake(origin, dimensions, 10)
+        tensor_field.add_grid(Vector((0.0, 0.0)), 250, 10, math.pi / 4)
+        self.assertIsNone(tensor_field.baked)
+        tensor_field.bake(origin, dimensions, 10)
+        tensor_field.smooth = True
+        self.assertIsNone(tensor_field.baked)
+        tensor_field.bake(origin, dimensions, 10)
+        tensor_field.remove_field(tensor_field.basis_fields[0])
+        self.assertIsNone(tensor_field.baked)
+        tensor_field.bake(origin, dimensions, 10)
+        tensor_field.reset()
+        self.assertIsNone(tensor_field.baked)
+
+    def test_sample_point_culled(self):
+        tensor_field = TensorField()
+        for i in range(20):
+            center = Vector(((i * 137) % 1000, (i * 291) % 1000))
+            if i % 2:
+                tensor_field.add_grid(center, 200, 10, i * 0.3)
+            else:
+                tensor_field.add_radial(center, 200, 10)
+        points = [Vector((x, y)) for x in range(0, 1000, 97) for y in range(0, 1000, 89)]
+        for point in points:
+            tensor = Tensor.zero()
+            for field in tensor_field.basis_fields:
+                tensor.add(field.get_weighted_tensor(point))
+            sample = tensor_field.sample_point(point)
+            self.assertEqual(sample.r, tensor.r)
+            self.assertEqual(sample.matrix, tensor.matrix)
+
+    def test_sample_point_culled_smooth(self):
+        tensor_field = TensorField()
+        tensor_field.add_grid(Vector((0.0, 0.0)), 250, 10, math.pi / 4)
+        tensor_field.add_radial(Vector((1000.0, 1000.0)), 250, 10)
+        tensor_field.add_grid(Vector((100.0, 0.0)), 250, 10, 0.0)
+        tensor_field.smooth = True
+        point = Vector((40.0, 40.0))
+        theta = tensor_field.sample_point(point).theta
+        tensor_field.smooth_epsilon = 1e-9
+        self.assertEqual(tensor_field.field_index.get_candidates(point.x, point.y), (0, 2))
+        self.assertAlmostEqual(tensor_field.sample_point(point).theta, theta, places=6)
+
+    def test_sample_eigenvectors(self):
+        tensor_field = TensorField()
+        tensor_field.add_grid(Vector((0.0, 0.0)), 250, 10, math.pi / 4)
+        tensor_field.add_radial(Vector((50.0, 10.0)), 250, 10)
+        tensor_field.add_radial(Vector((100.0, 300.0)), 250, 10)
+        for smooth in [False, True]:
+            tensor_field.smooth = smooth
+            for point in [Vector((40.0, 40.0)), Vector((120.0, 250.0)), Vector((600.0, 600.0))]:
+                tensor = tensor_field.sample_point(point)
+                major, minor = tensor_field.sample_eigenvectors(point)
+                self.assertAlmostEqual((major - tensor.get_major()).length, 0.0, places=5)
+                self.assertAlmostEqual((minor - tensor.get_minor()).length, 0.0, places=5)
+                self.assertEqual(tensor_field.sample_major(point), major)
+                self.assertEqual(tensor_field.sample_minor(point), minor)
+
 
 if __name__ == "__main__":
     unittest.main()
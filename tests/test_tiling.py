@@ -0,0 +1,110 @@
+import unittest
+import math
+import numpy as np
+from mathutils import Vector
+from ProceduralCityGenerator.tensor_field import TensorField
+from ProceduralCityGenerator.integrator import RK4Integrator
+from ProceduralCityGenerator.streamline_parameters import StreamlineParameters
+from ProceduralCityGenerator.tiling import TiledStreamlineGenerator
+
+
+# Field, parameters and tiled domain shared with TestStreaming.
+class TilingFixture:
+
+    def setUp(self):
+        self.field = TensorField()
+        self.field.add_grid(Vector((0.0, 0.0)), 500, 10, math.pi / 6)
+        self.field.add_radial(Vector((150.0, 100.0)), 300, 5)
+        self.parameters = StreamlineParameters(
+            dsep=20,
+            dtest=15,
+            dstep=1,
+            dcirclejoin=5,
+            dlookahead=40,
+            joinangle=0.1,
+            path_iterations=300,
+            seed_tries=100,
+            simplify_tolerance=0.5,
+            collide_early=0,
+        )
+
+    def create_tiled_generator(self, processes=None, seed=1, generator_type=TiledStreamlineGenerator):
+        return generator_type(
+            RK4Integrator(self.field, self.parameters),
+            Vector((-100.0, -100.0)),
+            Vector((400.0, 300.0)),
+            self.parameters,
+            tiles=(3, 2),
+            processes=processes,
+            seed=seed)
+
+
+class TestTiling(TilingFixture, unittest.TestCase):
+
+    def get_streamlines(self, generator):
+        return [[p.to_tuple() for p in s] for s in generator.all_streamlines]
+
+    def test_phases(self):
+        tiled = self.create_tiled_generator(1)
+        phases = tiled.get_phases()
+        self.assertEqual(sorted(tile for phase in phases for tile in phase), list(range(6)))
+        for phase in phases:
+            for a in phase:
+                for b in phase:
+                    if a != b:
+                        # Tiles of a phase are not adjacent.
+                        self.assertTrue(abs(a // 2 - b // 2) > 1 or abs(a % 2 - b % 2) > 1)
+        np.testing.assert_allclose(tiled.get_tile_origin(5).to_tuple(), (800 / 3 - 100, 50.0), atol=1e-3)
+
+    def test_deterministic(self):
+        generator = self.create_tiled_generator(1).create_all_streamlines()
+        parallel_generator = self.create_tiled_generator(2).create_all_streamlines()
+        self.assertGreater(len(generator.all_streamlines), 6)
+        self.assertEqual(self.get_streamlines(parallel_generator), self.get_streamlines(generator))
+        self.assertEqual(len(generator.all_streamlines_simple), len(generator.all_streamlines))
+        for streamline, simple in zip(generator.all_streamlines, generator.all_streamlines_simple):
+            self.assertEqual(simple[0], streamline[0])
+            self.assertEqual(simple[-1], streamline[-1])
+            self.assertLessEqual(len(simple), len(streamline))
+        self.assertEqual(
+            len(generator.streamlines_major) + len(generator.streamlines_minor), len(generator.all_streamlines))
+        other_generator = self.create_tiled_generator(1, seed=2).create_all_streamlines()
+        self.assertNotEqual(self.get_streamlines(other_generator), self.get_streamlines(generator))
+
+    def test_halo(self):
+        tiled = self.create_tiled_generator(1)
+        tiled.tile_streamlines[0] = [(True, np.array([[-90.0, -90.0], [30.0, 20.0], [50.0, 40.0]]))]
+        major_halo, minor_halo = tiled.get_halo(2)
+        # Only points within dsep of tile 2, which starts at x = 33.3.
+        np.testing.assert_array_equal(major_halo, [[30.0, 20.0], [50.0, 40.0]])
+        self.assertEqual(len(minor_halo), 0)
+        streamlines = tiled.trace_tile(2, (major_halo, minor_halo))
+        self.assertTrue(all(len(points) > 0 and len(simple) > 0 for _, points, simple in streamlines))
+        self.assertTrue(all(len(simple) <= len(points) for _, points, simple in streamlines))
+
+    def test_default_tiles(self):
+        tiled = TiledStreamlineGenerator(
+            RK4Integrator(self.field, self.parameters),
+            Vector((0.0, 0.0)),
+            Vector((10000.0, 5000.0)),
+            self.parameters,
+            processes=32)
+        if tiled.get_pool_context() is None:
+            self.assertEqual((tiled.tiles_x, tiled.tiles_y), (6, 3))
+            return
+        # Each phase holds TILES_PER_WORKER tiles per worker.
+        self.assertGreaterEqual(
+            min(len(phase) for phase in tiled.get_phases()), 32 * TiledStreamlineGenerator.TILES_PER_WORKER)
+        self.assertLess(abs(tiled.tile_dimensions.x - tiled.tile_dimensions.y), tiled.tile_dimensions.x / 2)
+        # Tiles of small domains are limited to MIN_TILE_SIZE * dsep.
+        small = TiledStreamlineGenerator(
+            RK4Integrator(self.field, self.parameters),
+            Vector((-100.0, -100.0)),
+            Vector((400.0, 300.0)),
+            self.parameters,
+            processes=32)
+        self.assertEqual((small.tiles_x, small.tiles_y), (5, 3))
+
+
+if __name__ == "__main__":
+    unittest.main()